@@ -1,7 +1,14 @@
 #!/usr/bin/env python
 
 import os
+import argparse
 import subprocess
+from manifest import Manifest
+from validate_outputs import validate_files
+
+parser = argparse.ArgumentParser(description="Run the analysis of the reconstructed particle-gun points")
+parser.add_argument("-Resume", help="Only run the points whose output is missing or incomplete in the manifest", action="store_true")
+args = parser.parse_args()
 
 DetectorModel = "FCCee_o2_v02"
 Nevts = "1000"
@@ -10,6 +17,9 @@ Nevts = "1000"
 script_filename = os.path.basename(__file__)
 print(f"-----> running {script_filename} with Detector Model = {DetectorModel}, Nevts = {Nevts}")
 
+# Outputs produced so far, with their number of events and parameters
+manifest = Manifest(f"/eos/user/g/gasadows/Output/TrackingPerformance/{DetectorModel}/Analysis/manifest.jsonl")
+
 # Define lists
 ParticleList = ["mu", "e", "pi"]
 MomentumList = ["1", "2", "5", "10", "20", "50", "100", "200"]
@@ -23,6 +33,11 @@ for Particle in ParticleList:
             ThetaList = ["10", "30", "50", "70", "89"]
 
         for theta in ThetaList:
+            output_file = f"/eos/user/g/gasadows/Output/TrackingPerformance/{DetectorModel}/Analysis/{Particle}_{theta}deg_{momentum}GeV_1000evt.root"
+            params = {"detector": DetectorModel, "particle": Particle, "theta": theta, "momentum": momentum, "nevts": Nevts}
+            if args.Resume and manifest.is_complete(output_file, params, Nevts):
+                continue
+
             print(f"running fccanalysis with Particle {Particle}-, Theta = {theta} deg, Momentum = {momentum} Gev")
 
             input_file = f"/eos/user/g/gasadows/Output/TrackingPerformance/{DetectorModel}/REC/REC_{Particle}_{theta}deg_{momentum}GeV_1000evt_edm4hep.root"
@@ -30,14 +45,21 @@ for Particle in ParticleList:
             if not os.path.exists(input_file):
                 print(f"/!\ Warning: Input file {input_file} does not exist. Skipping it.")
                 continue
+            # Do not analyse truncated or incomplete reconstruction outputs
+            n, problems = validate_files([input_file], int(Nevts))[input_file]
+            if problems:
+                print(f"/!\ Warning: Input file {input_file} is not valid ({'; '.join(problems)}). Skipping it.")
+                continue
 
             command = [
                    "fccanalysis", "run",
                     "FullSim/TrackingPerformance/CLD_pref_getTree.py",
                     "--output",
-                    f"/eos/user/g/gasadows/Output/TrackingPerformance/{DetectorModel}/Analysis/{Particle}_{theta}deg_{momentum}GeV_1000evt.root",
+                    output_file,
                     "--files-list",
                     input_file,
                    ]
 
-            subprocess.run(command)#, stdout=subprocess.DEVNULL)
\ No newline at end of file
+            result = subprocess.run(command)#, stdout=subprocess.DEVNULL)
+            if result.returncode == 0 and os.path.exists(output_file):
+                manifest.record(output_file, params)
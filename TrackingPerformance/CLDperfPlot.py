@@ -8,6 +8,7 @@ import matplotlib.lines as mlines
 from statistics import mean # importing mean()
 from scipy.stats import norm
 from scipy.stats import linregress
+from sigma_clip import sigma_clip
 
 # Get the current working directory
 cwd = os.getcwd()
@@ -76,17 +77,9 @@ for ftype in ['mu', 'e', 'pi']:
 
     ##### Remove badly reconstructed particles
         threshold = 2         # Define threshold value for number of standard deviations from the mean
-        DeltaPt_Pt2_sel = DeltaPt_Pt2  # Initialise with original data
         n_selections = 3        # Number of selection
-
-        for i in range(n_selections):
-            mean_DeltaPt_Pt2_sel = np.mean(DeltaPt_Pt2_sel)
-            std_DeltaPt_Pt2_sel = np.std(DeltaPt_Pt2_sel)
-            DeltaPt_Pt2_sel_new = []
-            for dpt in DeltaPt_Pt2_sel:
-                if abs(dpt - mean_DeltaPt_Pt2_sel) < threshold * std_DeltaPt_Pt2_sel:
-                    DeltaPt_Pt2_sel_new.append(dpt)
-            DeltaPt_Pt2_sel = DeltaPt_Pt2_sel_new
+        DeltaPt_Pt2_clip = sigma_clip(DeltaPt_Pt2, threshold, n_selections)
+        DeltaPt_Pt2_sel = DeltaPt_Pt2_clip.data
         sigma_DeltaPt_Pt2 = np.std(DeltaPt_Pt2_sel)
 
     #####
@@ -99,11 +92,14 @@ for ftype in ['mu', 'e', 'pi']:
         Nbins = len(reco_pt_list)//20    # Calculate the  number of bins for both histograms
         reco_pt_hist = ROOT.TH1F("reco_pt_hist", "Reco pT Distribution", Nbins, min_pt, max_pt) # Nbins, min, max)
         MC_pt_hist = ROOT.TH1F("MC_pt_hist", "MC pT Distribution", Nbins, min_pt, max_pt)   # Nbins, min, max)
-        # Fill the histograms
-        for reco_pt, MC_pt, dpt in zip(reco_pt_list, MC_pt_list, DeltaPt_Pt2):
-            if dpt in DeltaPt_Pt2_sel:
-                reco_pt_hist.Fill(reco_pt)
-                MC_pt_hist.Fill(MC_pt)
+        # Fill the histograms in bulk with the entries kept by the selection
+        n_entries = min(len(reco_pt_list), len(MC_pt_list), len(DeltaPt_Pt2))
+        sel = DeltaPt_Pt2_clip.mask[:n_entries]
+        reco_pt_sel = np.ascontiguousarray(np.asarray(reco_pt_list[:n_entries], dtype=np.float64)[sel])
+        MC_pt_sel = np.ascontiguousarray(np.asarray(MC_pt_list[:n_entries], dtype=np.float64)[sel])
+        if len(reco_pt_sel) > 0:
+            reco_pt_hist.FillN(len(reco_pt_sel), reco_pt_sel, np.ones(len(reco_pt_sel)))
+            MC_pt_hist.FillN(len(MC_pt_sel), MC_pt_sel, np.ones(len(MC_pt_sel)))
         # Divide the histograms
         divided_hist = ROOT.TH1F("divided_hist", "Divided Histogram", Nbins, min_pt, max_pt) # Nbins, min, max)
         divided_hist.Divide(reco_pt_hist, MC_pt_hist, 1, 1, "b") # weight Hist1, weight Hist2, b = binomial error)
@@ -3,6 +3,8 @@ import os
 import glob
 import numpy as np
 import scipy as scipy
+import matplotlib
+matplotlib.use("Agg")  # Plots are only saved to files, also from worker processes
 import matplotlib.pyplot as plt
 import matplotlib.lines as mlines
 from statistics import mean # importing mean()
@@ -10,6 +12,12 @@ from scipy.stats import norm, crystalball, chisquare
 from scipy.stats import linregress
 from scipy.optimize import curve_fit
 import argparse
+from multiprocessing import Pool
+from perf_reader import read_tracking_columns, tracking_quantities
+from sigma_clip import sigma_clip
+from efficiency import binned_efficiency, total_efficiency
+import summary_table
+from summary_table import summary_row, write_summary, read_summary, select, summary_enabled
 
 # Get the current working directory
 cwd = os.getcwd()
@@ -21,6 +29,10 @@ cwd = os.getcwd()
 parser = argparse.ArgumentParser(description="Script for plotting Detector Performances")
 parser.add_argument("-DetectorModel", help="Detector model: FCCee_o1_v04 \n FCCee_o2_v02", required=True)
 parser.add_argument("-Nevts", help="Number of events", required=True)
+parser.add_argument("-j", help="Number of worker processes used to process the files", type=int, default=1)
+parser.add_argument("-Resolution", help="Resolution configuration stored in the summary table, e.g. 7mic", default="")
+parser.add_argument("-Summary", help="Summary table of the results (default: <output dir>/summary.parquet)", default=None)
+parser.add_argument("-FromSummary", help="Make the plots from the summary table instead of processing the files", action="store_true")
 args = parser.parse_args()
 
 # Define the directory where the plots will be saved
@@ -30,10 +42,228 @@ sub_dirs = ['DeltaPt_Pt2_Distributions', 'Hist_pT_Distributions', 'd0_Distributi
 # Create the directory if it does not exist
 if not os.path.exists(output_dir):
     os.makedirs(output_dir)
+summary_file = args.Summary or os.path.join(output_dir, 'summary.parquet')
+# The summary table needs pyarrow, checked before the files are processed
+if args.FromSummary and summary_table.pa is None:
+    parser.error("-FromSummary needs pyarrow")
+write_table = not args.FromSummary and summary_enabled()
+
+# Names of the record fields in the summary table, as in Plotting/analysis_final.py
+summary_variables = {'sigma_DeltaPt_Pt2': 'sdelta_pt', 'd0': 'delta_d0', 'z0': 'delta_z0'}
 
 # Create a TGraphErrors object to hold the data points from divided histograms
 graph = ROOT.TGraphErrors()
 
+############################### Plot the distributions of DeltaPt_Pt2 and DeltaPt_Pt2_sel for each file
+def plot_distribution_DeltaPt_Pt2(data, bins, xlabel, title, output_path, ftype, file_name):
+    fig, ax = plt.subplots()
+   # Plot the histogram distribution
+    n, bins, patches = plt.hist(data, bins=bins, histtype='step', label='Data')
+    if ftype != 'e':
+       # Fit a normal distribution to the data
+        mu, std = norm.fit(data)
+        fit_line = scipy.stats.norm.pdf(bins[:-1], mu, std) * sum(n * np.diff(bins))
+       # Calculate chi-square for normal distribution fit
+        chi2, p_value = scipy.stats.chisquare(n / np.sum(n), f_exp=fit_line / np.sum(fit_line))
+       # Plot the fitted line
+        plt.plot(bins[:-1], fit_line, 'r', linewidth=1.5, label=(r"$\sigma=%0.3e$, $\chi^2=%0.3f$" % (std, chi2)))
+        data_std = std
+    else:
+       # Fit a Crystal Ball distribution for electrons
+        params = scipy.stats.crystalball.fit(data)
+        fit_line = scipy.stats.crystalball.pdf(bins[:-1], *params) * sum(n * np.diff(bins))
+        sigma = params[-1]
+       # Calculate chi-square for normal distribution fit
+        fit_line2 = scipy.stats.crystalball.pdf(bins[:-1], *params) * sum(n * np.diff(bins)) / np.sum(fit_line)
+        chi2, p_value = scipy.stats.chisquare(n / np.sum(n), f_exp=fit_line / np.sum(fit_line))
+       # Plot the fitted line
+        plt.plot(bins[:-1], fit_line, 'r', linewidth=1.5, label=(r"$\sigma=%0.3e$, $\chi^2=%0.3f$" % (sigma, chi2)))
+        data_std = sigma
+
+    plt.xlabel(xlabel, fontsize=12)
+    plt.title(title)
+    plt.legend()
+    plt.savefig(os.path.join(output_path, f'{file_name}.png'))
+    plt.close(fig)
+
+    return data_std
+
+############################### Plot the distribution of Delta d0/z0 for each file
+def plot_distribution_Delta_d0_z0(data, bins, xlabel, title, output_path, file_name):
+    fig, ax = plt.subplots()
+   # Plot the histogram distribution
+    n, bins, patches = plt.hist(data, bins=bins, histtype='step', label='Data')
+   # Fit a normal distribution to the data
+    mu, std = norm.fit(data)
+    fit_line = scipy.stats.norm.pdf(bins[:-1], mu, std) * sum(n * np.diff(bins))
+   # Calculate chi-square for normal distribution fit
+    chi2, p_value = scipy.stats.chisquare(n / np.sum(n), f_exp=fit_line / np.sum(fit_line))
+   # Plot the fitted line
+    plt.plot(bins[:-1], fit_line, 'r', linewidth=1.5, label=(r"$\sigma=%0.3e$, $\chi^2=%0.3f$" % (std, chi2)))
+    data_std = std
+
+    plt.xlabel(xlabel, fontsize=12)
+    plt.title(title)
+    plt.legend()
+    plt.savefig(os.path.join(output_path, f'{file_name}.png'))
+    plt.close(fig)
+
+    return data_std
+
+######################### Calculate Efficiency
+def calculate_efficiency(pt_all, passed, output_path, file_name):
+   # Histogram all MC particles and the ones with a selected track in one go
+    Nbins = 10
+    eff_bins = binned_efficiency(pt_all, passed, Nbins)
+    edges = eff_bins["edges"]
+    min_pt, max_pt = edges[0], edges[-1]
+    data_hist = ROOT.TH1F("data_hist", "Data Distribution", Nbins, min_pt, max_pt)
+    mc_matched_hist = ROOT.TH1F("mc_matched_hist", "MC Matched Distribution", Nbins, min_pt, max_pt)
+    for bin in range(1, Nbins + 1):
+        data_hist.SetBinContent(bin, eff_bins["n_all"][bin - 1])
+        mc_matched_hist.SetBinContent(bin, eff_bins["n_passed"][bin - 1])
+   # Efficiency per bin with Clopper-Pearson errors
+    filled = eff_bins["n_all"] > 0
+    centers = 0.5 * (edges[1:] + edges[:-1])[filled]
+    half_widths = 0.5 * np.diff(edges)[filled]
+    divided_hist = ROOT.TGraphAsymmErrors(int(np.count_nonzero(filled)),
+                                          np.ascontiguousarray(centers), np.ascontiguousarray(eff_bins["efficiency"][filled]),
+                                          np.ascontiguousarray(half_widths), np.ascontiguousarray(half_widths),
+                                          np.ascontiguousarray(eff_bins["err_low"][filled]), np.ascontiguousarray(eff_bins["err_high"][filled]))
+   # Plot the histograms
+    ROOT.gROOT.SetBatch(True)
+    file_name = os.path.basename(str(file_name))
+    canvas = ROOT.TCanvas("canvas", "Histograms", 800, 600)
+    canvas.Divide(2, 1)
+
+    canvas.cd(1)
+    data_hist.SetTitle("Data Distribution")
+    data_hist.GetXaxis().SetTitle("pT (GeV)")
+    data_hist.Draw()
+    data_hist.SetLineColor(ROOT.kBlue)
+    data_hist.SetLineWidth(2)
+
+    mc_matched_hist.Draw("same")
+    mc_matched_hist.SetLineColor(ROOT.kRed)
+    mc_matched_hist.SetLineWidth(2)
+    mc_matched_hist.SetLineStyle(9)
+
+    legend = ROOT.TLegend(0.7, 0.7, 0.9, 0.9)
+    legend.SetTextSize(0.03)
+    legend.AddEntry(mc_matched_hist, "MC Matched Distribution", "l")
+    legend.AddEntry(data_hist, "Data Distribution", "l")
+    legend.Draw()
+
+    canvas.cd(2)
+    divided_hist.GetXaxis().SetTitle("pT (GeV)")
+    divided_hist.Draw("AP")
+    divided_hist.SetLineColor(ROOT.kGreen)
+    divided_hist.SetLineWidth(2)
+    divided_hist.SetTitle("Divided Histogram")
+
+    canvas.SaveAs(os.path.join(output_path, f'{file_name}.png'))
+    ROOT.gROOT.SetBatch(False)
+    canvas.Close()
+
+    return eff_bins
+######################### 
+
+######################### Process one file
+def process_file(task):
+    file_name, ftype = task
+    # Read the file into flat per-particle arrays and select the particles matched to a track
+    quantities = tracking_quantities(read_tracking_columns(file_name))
+    MC_pt_all_list = quantities["MC_pt_all"]  # All MC_pt values
+    MC_pt_list = quantities["MC_pt"]  # MC_pt values matched to reco
+    MC_p_list = quantities["MC_p"]
+    MC_theta_list = quantities["MC_theta"]
+    d0_list = quantities["d0"]
+    z0_list = quantities["z0"]
+    DeltaPt_Pt2 = quantities["DeltaPt_Pt2"]
+    matched = quantities["matched"]
+
+   # Calculate mean values of theta and momentum
+    theta = int(np.mean(np.round(np.rad2deg(MC_theta_list))))  # Calculate mean of MC_theta_list
+    momentum = int(np.mean(np.round(MC_p_list)))  # Calculate mean of MC_p_list
+    transverse_momentum = int(np.mean(np.round(MC_pt_list)))  # Calculate mean of MC_pt_list
+
+#====================================================================
+#-------------------- Data selection
+   # Remove badly reconstructed tracks
+   # DeltaPt_Pt2
+    DeltaPt_Pt2_clip = sigma_clip(DeltaPt_Pt2, 3, 3)    # data, threshold, n_selections
+    DeltaPt_Pt2_sel = DeltaPt_Pt2_clip.data
+   # Delta_d0
+    Delta_d0_sel = sigma_clip(d0_list, 2, 3).data    # data, threshold, n_selections
+   # Delta_z0
+    Delta_z0_sel = sigma_clip(z0_list, 3, 3).data    # data, threshold, n_selections
+#-------------------- Fit and plotting distribution for each files
+    file_name = os.path.basename(str(file_name))  # Extract the filename only from the full path
+   # Plot the distributions for DeltaPt_Pt2
+    std_DeltaPt_Pt2 = plot_distribution_DeltaPt_Pt2(DeltaPt_Pt2_sel, len(DeltaPt_Pt2_sel) // 10, r'$\Delta p_T / p^2_{T,true}$', f'Distribution of $\Delta p_T / p^2_{{T,true}}$ for {file_name}', os.path.join(output_dir, f"{sub_dirs[0]}_{ftype}"), ftype, file_name)
+   # Plot the distributions for Delta_d0
+    std_Delta_d0 = plot_distribution_Delta_d0_z0(Delta_d0_sel, 100, r'$\Delta d_0$', f'Distribution of $\Delta d_0$ for {file_name}', os.path.join(output_dir, f"{sub_dirs[2]}_{ftype}"), file_name)
+  # Plot the distributions for Delta_z0
+    std_Delta_z0 = plot_distribution_Delta_d0_z0(Delta_z0_sel, 100, r'$\Delta z_0$', f'Distribution of $\Delta z_0$ for {file_name}', os.path.join(output_dir, f"{sub_dirs[3]}_{ftype}"), file_name)
+#-------------------- Efficiency histograms
+   # MC particles with a matched track passing the DeltaPt_Pt2 selection
+    passed = matched.copy()
+    passed[matched] = DeltaPt_Pt2_clip.mask
+    eff_bins = calculate_efficiency(MC_pt_all_list, passed, os.path.join(output_dir, f"{sub_dirs[1]}_{ftype}"), file_name)
+    efficiency, efficiency_err_low, efficiency_err_high = total_efficiency(passed)
+#====================================================================
+
+   # Small result record, merged by the parent process
+    return {
+        "theta": theta,
+        "momentum": momentum,
+        "transverse_momentum": transverse_momentum,
+        "sigma_DeltaPt_Pt2": std_DeltaPt_Pt2,
+        "d0": std_Delta_d0,
+        "z0": std_Delta_z0,
+        "efficiency": efficiency,
+        "efficiency_err": (efficiency_err_low, efficiency_err_high),
+        "efficiency_bins": eff_bins,
+        "mean": {"sigma_DeltaPt_Pt2": np.mean(DeltaPt_Pt2_sel), "d0": np.mean(Delta_d0_sel), "z0": np.mean(Delta_z0_sel)},
+        "n": {"sigma_DeltaPt_Pt2": len(DeltaPt_Pt2_sel), "d0": len(Delta_d0_sel), "z0": len(Delta_z0_sel)},
+    }
+#########################
+
+######################### Summary table
+def record_rows(record, ftype):
+   # One row of the summary table per variable of a file record
+    rows = []
+    for name, variable in summary_variables.items():
+        rows.append(summary_row(args.DetectorModel, args.Resolution, ftype, record["theta"], record["momentum"], variable,
+                                transverse_momentum=record["transverse_momentum"],
+                                mean=record["mean"][name], sigma=record[name], n=record["n"][name],
+                                efficiency=record["efficiency"],
+                                efficiency_err_low=record["efficiency_err"][0], efficiency_err_high=record["efficiency_err"][1]))
+    return rows
+
+def summary_records(table, ftype):
+   # Rebuild the file records of one particle type from the summary table
+    table = select(table, detector=args.DetectorModel, resolution=args.Resolution, particle=ftype)
+    records = {}
+    for row in table.to_pylist():
+        point = (int(row["theta"]), int(row["momentum"]))
+        if point not in records:
+            records[point] = {
+                "theta": point[0],
+                "momentum": point[1],
+                "transverse_momentum": int(row["transverse_momentum"]),
+                "efficiency": row["efficiency"],
+                "efficiency_err": (row["efficiency_err_low"], row["efficiency_err_high"]),
+            }
+        for name, variable in summary_variables.items():
+            if row["variable"] == variable:
+                records[point][name] = row["sigma"]
+    return [records[point] for point in sorted(records)]
+#########################
+
+summary = read_summary(summary_file) if args.FromSummary else None
+rows = []
+
 # loop over the three file types mu*.root, e*.root, pi*.root
 for ftype in ['mu', 'e', 'pi']:
     for sub_dir in sub_dirs:
@@ -44,229 +274,29 @@ for ftype in ['mu', 'e', 'pi']:
     # List of ROOT files
     filelist = glob.glob(f'/eos/user/g/gasadows/Output/TrackingPerformance/{args.DetectorModel}/Analysis/'+f'{ftype}'+'*.root')
 
-    sigma_DeltaPt_Pt2_list = []
-    theta_list = []
-    momentum_list = []
-    transverse_momentum_list = []
-    efficiency_list = []
-    d0_std_list = []
-    z0_std_list = []
-    std_values_DeltaPt_Pt2 = []
-    std_values_Delta_d0 = []
-    std_values_Delta_z0 = []
-   # List for calculated point and error from the divided histogram
-    eff_list = []
-    errors_list = []
-
-    for file_name in filelist:
-        # Open ROOT file and get events tree
-        file = ROOT.TFile.Open(file_name)
-        tree = file.Get("events")
-
-        # Create list sigma_DeltaPt_Pt2 containing the sigma value of the distribution DeltaPt_Pt2
-        sigma_DeltaPt_Pt2 = []
-        DeltaPt_Pt2 = []
-        MC_theta_list = []  # Create empty list for MC_theta values
-        MC_p_list = []  # Create empty list for MC_p values
-        MC_pt_list = []  # Create empty list for MC_pt mathed to reco values
-        MC_pt_all_list = []  # Create empty list for all MC_pt values
-        trk_pt_list = []  # Create empty list for Trk_pt values
-        d0_list = []  # Create empty list for d0 values
-        z0_list = []  # Create empty list for z0 values
-        for i in range(tree.GetEntries()):
-            tree.GetEntry(i)
-            MC_tlv = tree.MC_tlv   # MC particles
-            trk_pT = tree.Track_pt # Reconstructed track matched to the MC particle
-            trk_d0 = tree.d0
-            trk_z0 = tree.z0
-            reco_PDG = tree.MC_Reco_pdg
-            for j in range(len(MC_tlv)):
-                MC_pt_all = MC_tlv[j].Pt()
-                MC_pt_all_list.append(MC_pt_all)  # Append each MC_pt value to the list
-                trk_pt = trk_pT[j]
-                if trk_pt not in [0, -9]:  # Matched particles only
-                    trk_pt_list.append(trk_pt)  # Append each trk_pt value to the list
-                    d0 = trk_d0[j]
-                    d0_list.append(d0)  # Append each d0 value to the list
-                    z0 = trk_z0[j]
-                    z0_list.append(z0)  # Append each z0 value to the list
-                    MC_theta = MC_tlv[j].Theta()
-                    MC_theta_list.append(MC_theta)  # Append each MC_theta value to the list
-                    MC_p = MC_tlv[j].P()
-                    MC_p_list.append(MC_p)  # Append each MC_p value to the list
-                    MC_pt = MC_tlv[j].Pt()
-                    MC_pt_list.append(MC_pt)  # Append each MC_pt value to the list                 
-            DeltaPt_Pt2.append( (trk_pt - MC_pt) / (MC_pt * MC_pt) )  
-
-        #### Remove badly reconstructed tracks
-        def filter_data(data, threshold, n_selections):
-                filtered_data = data
-                for _ in range(n_selections):
-                    mean = np.mean(filtered_data)
-                    std = np.std(filtered_data)
-                    filtered_data = [d for d in filtered_data if abs(d - mean) < threshold * std]
-                return filtered_data
-        #####
-
-        ############################### Plot the distributions of DeltaPt_Pt2 and DeltaPt_Pt2_sel for each file
-        def plot_distribution_DeltaPt_Pt2(data, bins, xlabel, title, output_path, ftype, file_name):
-            fig, ax = plt.subplots()
-           # Plot the histogram distribution
-            n, bins, patches = plt.hist(data, bins=bins, histtype='step', label='Data')
-            if ftype != 'e':
-               # Fit a normal distribution to the data
-                mu, std = norm.fit(data)
-                fit_line = scipy.stats.norm.pdf(bins[:-1], mu, std) * sum(n * np.diff(bins))
-               # Calculate chi-square for normal distribution fit
-                chi2, p_value = scipy.stats.chisquare(n / np.sum(n), f_exp=fit_line / np.sum(fit_line))
-               # Plot the fitted line
-                plt.plot(bins[:-1], fit_line, 'r', linewidth=1.5, label=(r"$\sigma=%0.3e$, $\chi^2=%0.3f$" % (std, chi2)))
-                data_std = std
-            else:
-               # Fit a Crystal Ball distribution for electrons
-                params = scipy.stats.crystalball.fit(data)
-                fit_line = scipy.stats.crystalball.pdf(bins[:-1], *params) * sum(n * np.diff(bins))
-                sigma = params[-1]
-               # Calculate chi-square for normal distribution fit
-                fit_line2 = scipy.stats.crystalball.pdf(bins[:-1], *params) * sum(n * np.diff(bins)) / np.sum(fit_line)
-                chi2, p_value = scipy.stats.chisquare(n / np.sum(n), f_exp=fit_line / np.sum(fit_line))
-               # Plot the fitted line
-                plt.plot(bins[:-1], fit_line, 'r', linewidth=1.5, label=(r"$\sigma=%0.3e$, $\chi^2=%0.3f$" % (sigma, chi2)))
-                data_std = sigma
-
-            plt.xlabel(xlabel, fontsize=12)
-            plt.title(title)
-            plt.legend()
-            plt.savefig(os.path.join(output_path, f'{file_name}.png'))
-            plt.close(fig)
-
-            return data_std
-
-        ############################### Plot the distribution of Delta d0/z0 for each file
-        def plot_distribution_Delta_d0_z0(data, bins, xlabel, title, output_path, file_name):
-            fig, ax = plt.subplots()
-           # Plot the histogram distribution
-            n, bins, patches = plt.hist(data, bins=bins, histtype='step', label='Data')
-           # Fit a normal distribution to the data
-            mu, std = norm.fit(data)
-            fit_line = scipy.stats.norm.pdf(bins[:-1], mu, std) * sum(n * np.diff(bins))
-           # Calculate chi-square for normal distribution fit
-            chi2, p_value = scipy.stats.chisquare(n / np.sum(n), f_exp=fit_line / np.sum(fit_line))
-           # Plot the fitted line
-            plt.plot(bins[:-1], fit_line, 'r', linewidth=1.5, label=(r"$\sigma=%0.3e$, $\chi^2=%0.3f$" % (std, chi2)))
-            data_std = std
-
-            plt.xlabel(xlabel, fontsize=12)
-            plt.title(title)
-            plt.legend()
-            plt.savefig(os.path.join(output_path, f'{file_name}.png'))
-            plt.close(fig)
-
-            return data_std
-
-      ######################### Calculate Efficiency
-        def calculate_efficiency(data_list, mc_list, delta_list, output_path, file_name):
-           # Create histograms
-            min_pt = min(min(data_list), min(mc_list))
-            max_pt = max(max(data_list), max(mc_list))
-            Nbins = 10
-            data_hist = ROOT.TH1F("data_hist", "Data Distribution", Nbins, min_pt, max_pt)
-            mc_matched_hist = ROOT.TH1F("mc_matched_hist", "MC Matched Distribution", Nbins, min_pt, max_pt)
-           # Fill the histograms
-            for data_pt, delta_pt in zip(data_list, delta_list):
-                if delta_pt in delta_list:
-                    mc_matched_hist.Fill(data_pt)
-            for pt in mc_list:
-                data_hist.Fill(pt)
-           # Divide the histograms
-            divided_hist = ROOT.TH1F("divided_hist", "Divided Histogram", Nbins, min_pt, max_pt)
-            divided_hist.Divide(mc_matched_hist, data_hist, 1, 1, "b")
-            for bin in range(1, divided_hist.GetNbinsX() + 1):
-                bin_content = divided_hist.GetBinContent(bin)
-                bin_error = divided_hist.GetBinError(bin)
-                if bin_content != 0:
-                    eff_list.append(bin_content)
-                    errors_list.append(bin_error)
-           # Plot the histograms
-            ROOT.gROOT.SetBatch(True)
-            file_name = os.path.basename(str(file_name))
-            canvas = ROOT.TCanvas("canvas", "Histograms", 800, 600)
-            canvas.Divide(2, 1)
-
-            canvas.cd(1)
-            data_hist.SetTitle("Data Distribution")
-            data_hist.GetXaxis().SetTitle("pT (GeV)")
-            data_hist.Draw()
-            data_hist.SetLineColor(ROOT.kBlue)
-            data_hist.SetLineWidth(2)
-
-            mc_matched_hist.Draw("same")
-            mc_matched_hist.SetLineColor(ROOT.kRed)
-            mc_matched_hist.SetLineWidth(2)
-            mc_matched_hist.SetLineStyle(9)
-
-            legend = ROOT.TLegend(0.7, 0.7, 0.9, 0.9)
-            legend.SetTextSize(0.03)
-            legend.AddEntry(mc_matched_hist, "MC Matched Distribution", "l")
-            legend.AddEntry(data_hist, "Data Distribution", "l")
-            legend.Draw()
-
-            canvas.cd(2)
-            divided_hist.GetXaxis().SetTitle("pT (GeV)")
-            divided_hist.Draw()
-            divided_hist.SetLineColor(ROOT.kGreen)
-            divided_hist.SetLineWidth(2)
-            divided_hist.SetTitle("Divided Histogram")
-
-            canvas.SaveAs(os.path.join(output_path, f'{file_name}.png'))
-            ROOT.gROOT.SetBatch(False)
-            canvas.Close()
-
-            return eff_list, errors_list
-      ######################### 
-
-       # Calculate mean values of theta and momentum
-        theta = int(np.mean(np.round(np.rad2deg(MC_theta_list))))  # Calculate mean of MC_theta_list
-        momentum = int(np.mean(np.round(MC_p_list)))  # Calculate mean of MC_p_list
-        transverse_momentum = int(np.mean(np.round(MC_pt_list)))  # Calculate mean of MC_pt_list
-
-#====================================================================
-    #-------------------- Data selection
-       # DeltaPt_Pt2
-        DeltaPt_Pt2_sel = filter_data(DeltaPt_Pt2, 3, 3)    # data, threshold, n_selections
-       # Delta_d0
-        Delta_d0_sel = filter_data(d0_list, 2, 3)    # data, threshold, n_selections
-       # Delta_z0
-        Delta_z0_sel = filter_data(z0_list, 3, 3)    # data, threshold, n_selections
-    #-------------------- Fit and plotting distribution for each files
-        file_name = os.path.basename(str(file_name))  # Extract the filename only from the full path
-       # Plot the distributions for DeltaPt_Pt2
-        std_DeltaPt_Pt2 = plot_distribution_DeltaPt_Pt2(DeltaPt_Pt2_sel, len(DeltaPt_Pt2_sel) // 10, r'$\Delta p_T / p^2_{T,true}$', f'Distribution of $\Delta p_T / p^2_{{T,true}}$ for {file_name}', os.path.join(output_dir, f"{sub_dirs[0]}_{ftype}"), ftype, file_name)
-        std_values_DeltaPt_Pt2.append(std_DeltaPt_Pt2)
-       # Plot the distributions for Delta_d0
-        std_Delta_d0 = plot_distribution_Delta_d0_z0(Delta_d0_sel, 100, r'$\Delta d_0$', f'Distribution of $\Delta d_0$ for {file_name}', os.path.join(output_dir, f"{sub_dirs[2]}_{ftype}"), file_name)
-        std_values_Delta_d0.append(std_Delta_d0)
-      # Plot the distributions for Delta_z0
-        std_Delta_z0 = plot_distribution_Delta_d0_z0(Delta_z0_sel, 100, r'$\Delta z_0$', f'Distribution of $\Delta z_0$ for {file_name}', os.path.join(output_dir, f"{sub_dirs[3]}_{ftype}"), file_name)
-        std_values_Delta_z0.append(std_Delta_z0)
-    #-------------------- Efficiency histograms
-        efficiency_list, errors_list = calculate_efficiency(MC_pt_all_list, MC_pt_list, DeltaPt_Pt2,  os.path.join(output_dir, f"{sub_dirs[1]}_{ftype}"), file_name)
-#====================================================================
-
-       # Calculate std for d0 and z0
-        d0_std = np.std(Delta_d0_sel)
-        z0_std = np.std(Delta_z0_sel)
-
-       # Append the values to the lists
-        sigma_DeltaPt_Pt2_list.append(sigma_DeltaPt_Pt2)
-        theta_list.append(theta)
-        momentum_list.append(momentum)
-        transverse_momentum_list.append(transverse_momentum)
-        d0_std_list.append(d0_std)
-        z0_std_list.append(z0_std)
-
-       # Close the ROOT file
-        file.Close()
+    # Process the files, in parallel if requested, or take the results from the summary table
+    tasks = [(file_name, ftype) for file_name in filelist]
+    if args.FromSummary:
+        results = summary_records(summary, ftype)
+    elif args.j > 1:
+        with Pool(args.j) as pool:
+            results = pool.map(process_file, tasks, chunksize=1)
+    else:
+        results = [process_file(task) for task in tasks]
+    if not args.FromSummary:
+        for record in results:
+            rows += record_rows(record, ftype)
+
+    # Merge the per-file records
+    theta_list = [r["theta"] for r in results]
+    momentum_list = [r["momentum"] for r in results]
+    transverse_momentum_list = [r["transverse_momentum"] for r in results]
+    std_values_DeltaPt_Pt2 = [r["sigma_DeltaPt_Pt2"] for r in results]
+    std_values_Delta_d0 = [r["d0"] for r in results]
+    std_values_Delta_z0 = [r["z0"] for r in results]
+   # Reconstruction efficiency of each file and its (lower, upper) errors
+    eff_list = [r["efficiency"] for r in results]
+    errors_list = [r["efficiency_err"] for r in results]
 
    # Rename the lists
     theta = theta_list
@@ -521,7 +551,7 @@ for ftype in ['mu', 'e', 'pi']:
             pt = data_dict[t]['transverse_momentum']
             eff_points = data_dict[t]['eff_list']
             errors = data_dict[t]['errors_list']
-            scatter = plt.errorbar(pt, eff_points, yerr=errors, fmt=markers[idx % len(markers)], capsize=3)
+            scatter = plt.errorbar(pt, eff_points, yerr=np.transpose(errors), fmt=markers[idx % len(markers)], capsize=3)
             handles.append(scatter)
             labels.append(r'$\theta$ = '+str(t)+' deg')
 
@@ -553,3 +583,6 @@ for ftype in ['mu', 'e', 'pi']:
     efficiency_plot(data_dict, ftype, {args.Nevts}, output_dir)
 #====================================================================
 
+# Write the summary table of all particle types
+if write_table:
+    write_summary(rows, summary_file)
@@ -1,10 +1,15 @@
 #!/usr/bin/env python
 
 import os
+import sys
 import argparse
 import subprocess
-import time;
-ts = time.time()
+from cost_model import CostModel, pack_tasks, job_flavour
+from sandbox import build_sandbox, unpack_commands, steering_helper_paths
+from executors import Task, make_executor
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from manifest import Manifest
 
 thetaList_         = ["10", "20", "30", "40", "50", "60", "70", "80", "89"]
 momentumList_      = [ "1", "2", "5", "10", "20", "50", "100", "200"]
@@ -27,9 +32,32 @@ ResITValuesU_ = ['0.005','0.006','0.007','0.008','0.009']   #ResITValuesU_ = ['0
 ResITValuesV_ = ['0.07','0.08','0.09','0.10','0.11']    #ResITValuesV_ = ['0.09']
 ResOTValuesU_ = ['0.007']
 ResOTValuesV_ = ['0.09']
-DetectorModelPath = f"/FCCee/compact/{DetectorModelList_[0]}/{DetectorModelList_[0]}.xml"
-Config_Value_Path = "/afs/cern.ch/user/g/gasadows/CLICPerformance/fcceeConfig/"
 run_reco_path = "/afs/cern.ch/user/g/gasadows/FullSim/TrackingPerformance/Condor/run_reco.py"
+validate_outputs_path = "/afs/cern.ch/user/g/gasadows/FullSim/TrackingPerformance/validate_outputs.py"
+# Profile the time and memory of every processor: <output>.profile.json is copied to EosDir next to
+# the REC file (summary: python processor_profiling.py -Records "<EosDir>/*.profile.json")
+Profile_           = False
+cost_model_path = "/afs/cern.ch/user/g/gasadows/FullSim/TrackingPerformance/Condor/cost_model.py"
+# Cost model fitted from previous job logs (python cost_model.py -Logs "CondorJobs_*/*/output.*.out"),
+# used to pack the tasks into jobs of about ChunkTargetHours_ and to pick their JobFlavour
+CostModelPath = os.path.join(CondorDirectory, "cost_model.json")
+ChunkTargetHours_  = 1
+# Send only the files needed by the steering file in a content-hashed
+# tarball, unpacked once per worker node, instead of copying CLICdir into every job
+Sandbox_           = True
+SandboxDirectory = os.path.join(CondorDirectory, "sandboxes")
+ConfigDirectory = os.path.join(CLICdir, "fcceeConfig")
+# Resume: only submit the points whose REC file is missing or incomplete in the output manifest
+# (files written by the jobs are measured and recorded at the next submission)
+Resume_            = False
+OutputManifest = os.path.join(EosDir, "manifest.jsonl")
+# Where the jobs run: "condor" submits them, "local" runs them on this machine with at most
+# LocalProcesses_ parallel jobs (None: one per CPU, fewer if LocalMemoryGB_ per job is not
+# available), pinned to one CPU each, with logs in the job directories and LocalRetries_ retries
+Executor_          = "condor"
+LocalProcesses_    = None
+LocalMemoryGB_     = 4
+LocalRetries_      = 1
 
 # Create EosDir is it does not exist
 if not os.path.exists(EosDir):
@@ -38,26 +66,40 @@ if not os.path.exists(EosDir):
 if not os.path.exists(CondorDirectory):
     os.makedirs(CondorDirectory)
 
-# Split tasks into chunks of 200
-def chunk_tasks(tasks_list, chunk_size=200):
-    for i in range(0, len(tasks_list), chunk_size):
-        yield tasks_list[i:i + chunk_size]
+# Function to get the point of a task
+def decode_task(task_id):
+    return [DetectorModelList_[task_id // (len(particleList_) * len(thetaList_) * len(momentumList_))],
+            particleList_[(task_id // (len(thetaList_) * len(momentumList_))) % len(particleList_)],
+            thetaList_[(task_id // len(momentumList_)) % len(thetaList_)],
+            momentumList_[task_id % len(momentumList_)]]
 
 # Create the Condor submit script and submit jobs in chunks
 condor_file_template = '''
-executable = bash_script.sh
+executable = {executable}
 output = output.$(ClusterId).out
 error = error.$(ClusterId).err
 log = log.$(ClusterId).log
-+JobFlavour = "longlunch"
-queue {}
++JobFlavour = "{flavour}"
+{transfer}
+queue
 '''
-#+JobFlavour = "microcentury"   # 1 hour
-#+JobFlavour = "longlunch"     # 2 hours
-#+JobFlavour = "workday"        # 8 hours
 
 total_tasks = len(DetectorModelList_) * len(particleList_) * len(thetaList_) * len(momentumList_)
-task_chunks = list(chunk_tasks(range(total_tasks)))
+cost_model = CostModel.load(CostModelPath)
+if Resume_:
+    output_manifest = Manifest(OutputManifest)
+
+# The resolution values are given to each job on the command line, so every set
+# (and every submission) uses the same steering inputs
+if Sandbox_:
+    sandbox_path, sandbox_hash = build_sandbox(SteeringFile, ConfigDirectory, SandboxDirectory)
+    transfer = [sandbox_path]
+    steering = os.path.basename(SteeringFile)
+else:
+    transfer = []
+    steering = SteeringFile
+
+jobs = []
 
 # Create the Condor jobs submission directory for each set of resolution values
 for VXDBarrelResU, VXDBarrelResV in zip(ResVDXValuesU_, ResVDXValuesV_):
@@ -66,32 +108,27 @@ for VXDBarrelResU, VXDBarrelResV in zip(ResVDXValuesU_, ResVDXValuesV_):
             # Create a unique directory for this combination of resolution values
             res_set_directory = os.path.join(CondorDirectory, f"CondorJobs_VXD{VXDBarrelResU}_IT{ITBarrelResU}_OT{OTBarrelResU}")
             os.makedirs(res_set_directory, exist_ok=True)
-    # Generate content for the config_values.py using the current resolution values
-            config_content = f'''
-DetectorModel = "{DetectorModelPath}"
-
-VXDBarrelResU = "{VXDBarrelResU}"
-VXDBarrelResV = "{VXDBarrelResV}"
-VXDEndcapResU = "{VXDBarrelResU}"
-VXDEndcapResV = "{VXDBarrelResV}"
-
-ITBarrelResU = "{ITBarrelResU}"
-ITBarrelResV = "{ITBarrelResV}"
-ITEndcapResU = "{ITBarrelResU}"
-ITEndcapResV = "{ITBarrelResV}"
-
-OTBarrelResU = "{OTBarrelResU}"
-OTBarrelResV = "{OTBarrelResV}"
-OTEndcapResU = "{OTBarrelResU}"
-OTEndcapResV = "{OTBarrelResV}"
-    '''
-            print(config_content)
-            # Write the content to config_values.py
-            with open(os.path.join(Config_Value_Path, "config_values.py"), "w") as config_file:
-                config_file.write(config_content)
-
-            # Loop over task chunks and create a Condor job submission for each chunk
-            for i, chunk in enumerate(task_chunks):
+            resolutions = {"VXD": [VXDBarrelResU, VXDBarrelResV], "IT": [ITBarrelResU, ITBarrelResV], "OT": [OTBarrelResU, OTBarrelResV]}
+
+            # Function to get the name of the REC file of a task
+            def rec_output(task_id):
+                dect, part, theta, momentum = decode_task(task_id)
+                return "REC_" + dect + "_" + "resIT_U_" + str(int(float(ITBarrelResU)*1000)) + "_V_" + str(int(float(ITBarrelResV)*1000)) + "mic_" + part + "_" + theta + "_deg_" + momentum + "_GeV_" + Nevts_ + "_evts_edm4hep.root"
+
+            task_ids = list(range(total_tasks))
+            if Resume_:
+                task_ids = [task_id for task_id in task_ids
+                            if not output_manifest.is_complete(os.path.join(EosDir, rec_output(task_id)),
+                                                               dict(zip(["detector", "particle", "theta", "momentum"], decode_task(task_id)),
+                                                                    nevts=Nevts_, resolutions=resolutions), Nevts_)]
+                print(f"{len(task_ids)} of {total_tasks} tasks to submit in {res_set_directory}")
+
+            # Expected duration of each task, and chunks of balanced expected duration
+            task_costs = [cost_model.task_seconds("reco", *decode_task(task_id), Nevts_) for task_id in task_ids]
+            task_chunks = [([task_ids[t] for t in chunk], seconds) for chunk, seconds in pack_tasks(task_costs, ChunkTargetHours_ * 3600)]
+
+            # Loop over task chunks and create a job for each chunk
+            for i, (chunk, chunk_seconds) in enumerate(task_chunks):
                 directory_jobs = os.path.join(res_set_directory, f"CondorJobs_{i}")
                 os.makedirs(directory_jobs, exist_ok=True)
 
@@ -99,39 +136,41 @@ OTEndcapResV = "{OTBarrelResV}"
                 with open(bash_file, "w") as file:
                     file.write("#!/bin/bash \n")
                     file.write("source "+ setup + "\n")
-                    file.write("cp -rf " + CLICdir + " ." + "\n")
-                    file.write("cd " + "CLICPerformance/fcceeConfig" + "\n")
-                    file.write("cp " +  run_reco_path + " . " + "\n")
+                    if Sandbox_:
+                        for command in unpack_commands(sandbox_path, sandbox_hash):
+                            file.write(command + "\n")
+                    else:
+                        file.write("cp -rf " + CLICdir + " ." + "\n")
+                        file.write("cd " + "CLICPerformance/fcceeConfig" + "\n")
+                    file.write("cp " +  run_reco_path + " " + cost_model_path + " " + validate_outputs_path + " " + " ".join(steering_helper_paths(SteeringFile)) + " . " + "\n")
 
                     # Loop over tasks in the current chunk
                     for task_id in chunk:
-                        dect, part, theta, momentum = [
-                            DetectorModelList_[task_id // (len(particleList_) * len(thetaList_) * len(momentumList_))],
-                            particleList_[(task_id // (len(thetaList_) * len(momentumList_))) % len(particleList_)],
-                            thetaList_[(task_id // len(momentumList_)) % len(thetaList_)],
-                            momentumList_[task_id % len(momentumList_)]
-                        ]
-
-                        output_file = "REC_" + dect + "_" + "resIT_U_" + str(int(float(ITBarrelResU)*1000)) + "_V_" + str(int(float(ITBarrelResV)*1000)) + "mic_" + part + "_" + theta + "_deg_" + momentum + "_GeV_" + Nevts_ + "_evts_edm4hep.root"
+                        dect, part, theta, momentum = decode_task(task_id)
+
+                        output_file = rec_output(task_id)
                         input_file= os.path.join(InputDirectory, "SIM_" + dect + "_" + part + "_" + theta + "_deg_" + momentum + "_GeV_" + Nevts_ + "_evts.slcio")
 
-                        time.sleep(1)
-                        seed = str(time.time()%1000)
-                        arguments = " -Nevts " + Nevts_ + " -OutputPath " + output_file+ " -InputPath " + input_file + " -SteeringFile " + SteeringFile
+                        arguments = " -Nevts " + Nevts_ + " -OutputPath " + output_file+ " -InputPath " + input_file + " -SteeringFile " + steering
+                        arguments += " -DetectorModel " + dect + " -Particle " + part + " -Theta " + theta + " -Momentum " + momentum
+                        arguments += " -VXDRes " + VXDBarrelResU + " " + VXDBarrelResV + " -ITRes " + ITBarrelResU + " " + ITBarrelResV + " -OTRes " + OTBarrelResU + " " + OTBarrelResV
+                        if Profile_:
+                            arguments += " -Profile"
                         command = "python run_reco.py " + arguments
 
                         file.write(command + "\n")
-                        file.write("cp " + output_file + " " + EosDir + "\n")
+                        # only complete outputs reach EosDir, the others are resubmitted with Resume_
+                        file.write("python validate_outputs.py -j 1 -Files " + output_file + " -Nevts " + Nevts_ + " && cp " + output_file + " " + EosDir + "\n")
+                        if Profile_:
+                            file.write("cp " + os.path.splitext(output_file)[0] + ".profile.json " + EosDir + "\n")
 
                 os.chmod(bash_file, 0o755)
+                jobs.append(Task(os.path.basename(res_set_directory) + f"_{i}", directory_jobs, [bash_file], job_flavour(chunk_seconds), transfer))
 
-                # Create the Condor submit script for this chunk
-                condor_file = os.path.join(directory_jobs, "condor_script.sub")
-                with open(condor_file, "w") as file2:
-                    file2.write(condor_file_template.format(len(chunk)))
-
-                # Submit the Condor job for this chunk
-                os.system(f"cd {directory_jobs}; condor_submit condor_script.sub")
+# Submit the jobs of all the resolution sets to HTCondor or run them here
+executor = make_executor(Executor_, condor_file_template, n_processes=LocalProcesses_, memory_per_task_gb=LocalMemoryGB_, retries=LocalRetries_)
+status = executor.run(jobs)
+print(f"{sum(1 for returncode in status.values() if returncode == 0)} of {len(jobs)} jobs {'submitted' if Executor_ == 'condor' else 'done'}")
 
 
 
@@ -1,10 +1,19 @@
 #!/usr/bin/env python
 
 import os
+import sys
+import json
+import math
 import argparse
 import subprocess
-import time;
-ts = time.time()
+from seeds import SeedService
+from cost_model import CostModel, pack_tasks, job_flavour
+from executors import Task, make_executor
+from sandbox import steering_helper_paths
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from manifest import Manifest
+from validate_outputs import sampled_events
 
 thetaList_         = ["10", "20", "30", "40", "50", "60", "70", "80", "89"]
 momentumList_      = [ "1", "2", "5", "10", "20", "50", "100", "200"]
@@ -14,42 +23,116 @@ particleList_      = [ "mu", "e", "pi"]
 #particleList_      = [ "mu"]
 DetectorModelList_ = [ "FCCee_o2_v02"]
 Nevts_             = "10"
+Campaign_          = f"{DetectorModelList_[0]}_{Nevts_}evts"
 runningDirectory = "/afs/cern.ch/user/g/gasadows/FullSim/TrackingPerformance/Condor"
 SteeringFile = "/afs/cern.ch/user/g/gasadows/CLICPerformance/fcceeConfig/fcc_steer.py"
 setup = "/cvmfs/sw.hsf.org/key4hep/setup.sh"
 EosDir = f"/eos/user/g/gasadows/Output/TrackingPerformance/LCIO/{DetectorModelList_[0]}/SIM/Test_splitting"
 run_sim_path = "/afs/cern.ch/user/g/gasadows/FullSim/TrackingPerformance/Condor/run_ddsim.py"
+cost_model_path = "/afs/cern.ch/user/g/gasadows/FullSim/TrackingPerformance/Condor/cost_model.py"
+# Simulate all the points of a job with a single ddsim process (run_ddsim_batch.py), so that
+# the geometry and the physics tables are built once per job instead of once per point
+BatchSim_          = True
+run_sim_batch_path = "/afs/cern.ch/user/g/gasadows/FullSim/TrackingPerformance/Condor/run_ddsim_batch.py"
+# Cost model fitted from previous job logs (python cost_model.py -Logs "CondorJobs_*/output.*.out"),
+# used to pack the tasks into jobs of about ChunkTargetHours_ and to pick their JobFlavour
+CostModelPath = os.path.join(runningDirectory, "cost_model.json")
+ChunkTargetHours_  = 1
+# Seeds of the campaign, derived from the point and recorded next to the outputs
+SeedManifest = os.path.join(EosDir, f"seeds_{Campaign_}.json")
+# Resume: only submit the points whose SIM file is missing or incomplete in the output manifest
+# (files written by the jobs are measured and recorded at the next submission)
+Resume_            = False
+OutputManifest = os.path.join(EosDir, "manifest.jsonl")
+# Where the jobs run: "condor" submits them, "local" runs them on this machine with at most
+# LocalProcesses_ parallel jobs (None: one per CPU, fewer if LocalMemoryGB_ per job is not
+# available), pinned to one CPU each, with logs in the job directories and LocalRetries_ retries
+Executor_          = "condor"
+LocalProcesses_    = None
+LocalMemoryGB_     = 2
+LocalRetries_      = 1
+
+# Adaptive sampling: simulate and reconstruct each point in batches of BatchEvts_ events
+# until the relative error on the resolutions is below TargetPrecision_ (at most Nevts_ events),
+# see run_adaptive.py. The REC files are then written directly to RecEosDir.
+AdaptiveSampling_  = False
+BatchEvts_         = "1000"
+MinEvts_           = "2000"
+TargetPrecision_   = "0.02"
+RecoSteeringFile = "/afs/cern.ch/user/g/gasadows/FullSim/fccRec_lcio_input_trackers.py"
+CLICdir = "/afs/cern.ch/user/g/gasadows/CLICPerformance"
+RecEosDir = f"/eos/user/g/gasadows/Output/TrackingPerformance/LCIO/{DetectorModelList_[0]}/REC/"
+run_reco_path = "/afs/cern.ch/user/g/gasadows/FullSim/TrackingPerformance/Condor/run_reco.py"
+run_adaptive_path = "/afs/cern.ch/user/g/gasadows/FullSim/TrackingPerformance/Condor/run_adaptive.py"
+sigma_clip_path = "/afs/cern.ch/user/g/gasadows/FullSim/TrackingPerformance/sigma_clip.py"
+seeds_path = "/afs/cern.ch/user/g/gasadows/FullSim/TrackingPerformance/Condor/seeds.py"
 
 # Create EosDir is it does not exist
 if not os.path.exists(EosDir):
     os.makedirs(EosDir)
+if AdaptiveSampling_ and not os.path.exists(RecEosDir):
+    os.makedirs(RecEosDir)
 
-# Function to split the tasks into chunks of 200
-def chunk_tasks(tasks_list, chunk_size=200):
-    for i in range(0, len(tasks_list), chunk_size):
-        yield tasks_list[i:i + chunk_size]
+# Function to get the point of a task
+def decode_task(task_id):
+    return [DetectorModelList_[task_id // (len(particleList_) * len(thetaList_) * len(momentumList_))],
+            particleList_[(task_id // (len(thetaList_) * len(momentumList_))) % len(particleList_)],
+            thetaList_[(task_id // len(momentumList_)) % len(thetaList_)],
+            momentumList_[task_id % len(momentumList_)]]
 
 # Create the Condor submit script and submit jobs in chunks
 condor_file_template = '''
-executable = bash_script.sh
+executable = {executable}
 arguments = $(ClusterId) $(ProcId)
 output = output.$(ClusterId).$(ProcId).out
 error = error.$(ClusterId).$(ProcId).err
 log = log.$(ClusterId).log
-queue {}
++JobFlavour = "{flavour}"
+queue
 '''
-#+JobFlavour = "microcentury"   # 1 hour
-#+JobFlavour = "longlunch"     # 2 hours
-#+JobFlavour = "workday"        # 8 hours
 
 # Calculate the total number of tasks
 total_tasks = len(DetectorModelList_) * len(particleList_) * len(thetaList_) * len(momentumList_)
 
-# Split tasks into chunks of 200
-task_chunks = list(chunk_tasks(range(total_tasks)))
-
-# Loop over task chunks and create a Condor job submission for each chunk
-for i, chunk in enumerate(task_chunks):
+seed_service = SeedService(Campaign_, SeedManifest)
+
+# Function to get the name of the SIM file of a task and the parameters it is produced with
+def sim_output(task_id):
+    dect, part, theta, momentum = decode_task(task_id)
+    output_file = "SIM_" + dect + "_" + part + "_" + theta + "_deg_" + momentum + "_GeV_" + Nevts_ + "_evts.slcio"
+    nevts = Nevts_
+    if AdaptiveSampling_:
+        # the SIM file keeps the Nevts_ name, the events actually used are in its _sampling.json
+        sampled = sampled_events(os.path.join(EosDir, output_file))
+        nevts = str(sampled) if sampled is not None else None
+    params = {"detector": dect, "particle": part, "theta": theta, "momentum": momentum, "nevts": nevts,
+              "seed": seed_service.seed(dect, part, theta, momentum)}
+    return output_file, params
+
+def sim_complete(task_id):
+    output_file, params = sim_output(task_id)
+    # with adaptive sampling a SIM file without its _sampling.json is from an unfinished job
+    return params["nevts"] is not None and output_manifest.is_complete(os.path.join(EosDir, output_file), params, params["nevts"])
+
+task_ids = list(range(total_tasks))
+if Resume_:
+    output_manifest = Manifest(OutputManifest)
+    task_ids = [task_id for task_id in task_ids if not sim_complete(task_id)]
+    print(f"{len(task_ids)} of {total_tasks} tasks to submit")
+
+# Expected duration of each task, and chunks of balanced expected duration
+cost_model = CostModel.load(CostModelPath)
+task_costs = []
+for task_id in task_ids:
+    dect, part, theta, momentum = decode_task(task_id)
+    task_costs.append(cost_model.task_seconds("sim_batch" if BatchSim_ and not AdaptiveSampling_ else "sim", dect, part, theta, momentum, Nevts_))
+    if AdaptiveSampling_:
+        task_costs[-1] += cost_model.task_seconds("reco", dect, part, theta, momentum, Nevts_)
+task_chunks = [([task_ids[t] for t in chunk], seconds) for chunk, seconds in pack_tasks(task_costs, ChunkTargetHours_ * 3600)]
+
+# Loop over task chunks and create a job for each chunk
+jobs = []
+for i, (chunk, chunk_seconds) in enumerate(task_chunks):
     directory_jobs = f"CondorJobs_{i}"
     os.system(f"mkdir -p {directory_jobs}")
 
@@ -57,33 +140,70 @@ for i, chunk in enumerate(task_chunks):
     with open(bash_file, "w") as file:
         file.write("#!/bin/bash \n")
         file.write("source "+ setup + "\n")
-        file.write("cp " +  run_sim_path + " . " + "\n")
-
-        # Loop over tasks in the current chunk
-        for task_id in chunk:
-            dect, part, theta, momentum = [DetectorModelList_[task_id // (len(particleList_) * len(thetaList_) * len(momentumList_))],
-                                           particleList_[(task_id // (len(thetaList_) * len(momentumList_))) % len(particleList_)],
-                                           thetaList_[(task_id // len(momentumList_)) % len(thetaList_)],
-                                           momentumList_[task_id % len(momentumList_)]]
-
-            output_file = "SIM_" + dect + "_" + part + "_" + theta + "_deg_" + momentum + "_GeV_" + Nevts_ + "_evts.slcio"
-
-            time.sleep(1)
-            seed = str(time.time() % 1000)
-            arguments = "-DetectorModel " + dect + " -Nevts " + Nevts_ + " -Particle " + part + " -Momentum " + momentum + " -Theta " + theta + " -Seed " + seed + " -OutputPath " + output_file + " -SteeringFile " + SteeringFile
-            command = "python run_ddsim.py " + arguments
-
-            file.write(command + "\n")
-            file.write("cp " + output_file + " " + EosDir + "\n")
+        if AdaptiveSampling_:
+            # the reconstruction runs in the job too, from the CLICPerformance configuration directory
+            file.write("cp -rf " + CLICdir + " ." + "\n")
+            file.write("cd " + "CLICPerformance/fcceeConfig" + "\n")
+            file.write("cp " + " ".join([run_sim_path, run_reco_path, run_adaptive_path, sigma_clip_path, cost_model_path] + steering_helper_paths(RecoSteeringFile)) + " . " + "\n")
+        elif BatchSim_:
+            file.write("cp " + " ".join([run_sim_batch_path, seeds_path, cost_model_path]) + " . " + "\n")
+        else:
+            file.write("cp " +  run_sim_path + " " + cost_model_path + " . " + "\n")
+
+        if BatchSim_ and not AdaptiveSampling_:
+            # One gun schedule and one ddsim process per detector model of the chunk
+            schedules = {}
+            for task_id in chunk:
+                output_file, params = sim_output(task_id)
+                schedules.setdefault(params["detector"], []).append({"particle": params["particle"], "momentum": params["momentum"], "theta": params["theta"],
+                                                                      "nevts": Nevts_, "seed": params["seed"], "output": output_file})
+            for dect, schedule in schedules.items():
+                # recorded in the seed manifest, as the events of a point depend on the whole batch
+                job_seed = seed_service.batch_seed(dect, [(point["particle"], point["theta"], point["momentum"], 0) for point in schedule])
+                schedule_file = os.path.abspath(os.path.join(directory_jobs, f"schedule_{dect}.json"))
+                with open(schedule_file, "w") as f:
+                    json.dump(schedule, f, indent=1)
+                file.write("cp " + schedule_file + " . " + "\n")
+                file.write("python run_ddsim_batch.py -DetectorModel " + dect + " -Schedule " + os.path.basename(schedule_file) + " -Seed " + str(job_seed) + " -SteeringFile " + SteeringFile + "\n")
+                file.write("cp " + " ".join(point["output"] for point in schedule) + " " + EosDir + "\n")
+        else:
+            # Loop over tasks in the current chunk
+            for task_id in chunk:
+                dect, part, theta, momentum = decode_task(task_id)
+
+                output_file, params = sim_output(task_id)
+
+                seed = str(params["seed"])
+                if AdaptiveSampling_:
+                    rec_file = "REC_" + dect + "_" + part + "_" + theta + "_deg_" + momentum + "_GeV_" + Nevts_ + "_evts_edm4hep.root"
+                    sampling_file = "REC_" + dect + "_" + part + "_" + theta + "_deg_" + momentum + "_GeV_" + Nevts_ + "_evts_edm4hep_sampling.json"
+                    # one seed per possible batch, the first being that of the point
+                    seeds = [str(seed_service.seed(dect, part, theta, momentum, batch)) for batch in range(math.ceil(int(Nevts_) / int(BatchEvts_)))]
+                    arguments = ("-DetectorModel " + dect + " -Particle " + part + " -Momentum " + momentum + " -Theta " + theta + " -Seeds " + " ".join(seeds) +
+                                 " -SimSteeringFile " + SteeringFile + " -RecoSteeringFile " + RecoSteeringFile +
+                                 " -SimOutputPath " + output_file + " -RecOutputPath " + rec_file +
+                                 " -BatchEvts " + BatchEvts_ + " -MinEvts " + MinEvts_ + " -MaxEvts " + Nevts_ + " -TargetPrecision " + TargetPrecision_)
+                    command = "python run_adaptive.py " + arguments
+
+                    file.write(command + "\n")
+                    file.write("cp " + output_file + " " + os.path.splitext(output_file)[0] + "_sampling.json " + EosDir + "\n")
+                    file.write("cp " + rec_file + " " + sampling_file + " " + RecEosDir + "\n")
+                else:
+                    arguments = "-DetectorModel " + dect + " -Nevts " + Nevts_ + " -Particle " + part + " -Momentum " + momentum + " -Theta " + theta + " -Seed " + seed + " -OutputPath " + output_file + " -SteeringFile " + SteeringFile
+                    command = "python run_ddsim.py " + arguments
+
+                    file.write(command + "\n")
+                    file.write("cp " + output_file + " " + EosDir + "\n")
 
     os.chmod(bash_file, 0o755)
+    jobs.append(Task(directory_jobs, os.path.abspath(directory_jobs), [os.path.abspath(bash_file)], job_flavour(chunk_seconds)))
 
-    # Create the Condor submit script for this chunk
-    condor_file = os.path.join(directory_jobs, "condor_script.sub")
-    with open(condor_file, "w") as file2:
-        file2.write(condor_file_template.format(len(chunk)))
+# Record the seeds before the jobs start
+seed_service.save()
 
-    # Submit the Condor job for this chunk
-    os.system(f"cd {directory_jobs}; condor_submit condor_script.sub")
+# Submit the jobs to HTCondor or run them here
+executor = make_executor(Executor_, condor_file_template, n_processes=LocalProcesses_, memory_per_task_gb=LocalMemoryGB_, retries=LocalRetries_)
+status = executor.run(jobs)
+print(f"{sum(1 for returncode in status.values() if returncode == 0)} of {len(jobs)} jobs {'submitted' if Executor_ == 'condor' else 'done'}")
 
 
@@ -0,0 +1,186 @@
+#!/usr/bin/env python
+
+import os
+import glob
+import json
+import math
+import heapq
+import argparse
+
+# Cost model of the simulation and reconstruction tasks, and packing of the tasks into
+# Condor jobs of balanced duration.
+#
+# run_ddsim.py and run_reco.py print one "TIMING {...}" line per task with the stage,
+# detector, particle, theta, momentum, number of events and wall time. The model fits
+# log(seconds per event) = a + b log(momentum) + c log(sin(theta)) for every
+# (stage, detector, particle) with enough measurements, falling back to (stage,
+# particle) and then to a default cost.
+#
+# run_ddsim_batch.py simulates several points in one process and shares the wall time
+# between them; its records carry the number of points and are fitted as the separate
+# stage "sim_batch", which falls back to "sim" when it has no fit.
+
+timing_prefix = "TIMING "
+
+# Seconds per event used when there is no measurement at all
+default_event_seconds = {"sim": 0.5, "reco": 0.5}
+
+# Minimum number of measurements to fit a group
+min_records = 3
+
+# Wall-time limit of the lxbatch job flavours, in seconds
+job_flavours = [
+    ("espresso", 20 * 60),
+    ("microcentury", 60 * 60),
+    ("longlunch", 2 * 3600),
+    ("workday", 8 * 3600),
+    ("tomorrow", 24 * 3600),
+    ("testmatch", 3 * 24 * 3600),
+    ("nextweek", 7 * 24 * 3600),
+]
+
+
+def timing_record(stage, detector, particle, theta, momentum, nevts, seconds, points=1):
+    """Line printed by the run scripts after each task, points > 1 if its wall time is a share of a batch."""
+    return timing_prefix + json.dumps({"stage": stage, "detector": detector, "particle": particle, "theta": float(theta),
+                                       "momentum": float(momentum), "nevts": int(nevts), "seconds": seconds, "points": points})
+
+
+def record_stage(record):
+    """Stage a timing record is fitted for: the amortised times of a batch have their own."""
+    return record["stage"] + "_batch" if record.get("points", 1) > 1 else record["stage"]
+
+
+def read_timing_records(patterns):
+    """Timing records found in the job output files matching the glob patterns."""
+    records = []
+    for pattern in patterns:
+        for path in glob.glob(pattern, recursive=True):
+            with open(path, errors="replace") as log_file:
+                for line in log_file:
+                    if line.startswith(timing_prefix):
+                        records.append(json.loads(line[len(timing_prefix):]))
+    return records
+
+
+def features(theta, momentum):
+    return [1.0, math.log(float(momentum)), math.log(math.sin(math.radians(float(theta))))]
+
+
+def least_squares(x, y):
+    """Coefficients minimising |x c - y|^2 from the normal equations, or None if they are singular."""
+    n = len(x[0])
+    a = [[sum(row[i] * row[j] for row in x) for j in range(n)] + [sum(row[i] * v for row, v in zip(x, y))] for i in range(n)]
+    for col in range(n):
+        pivot = max(range(col, n), key=lambda r: abs(a[r][col]))
+        if abs(a[pivot][col]) < 1e-9:
+            return None
+        a[col], a[pivot] = a[pivot], a[col]
+        for r in range(n):
+            if r != col:
+                factor = a[r][col] / a[col][col]
+                a[r] = [vr - factor * vc for vr, vc in zip(a[r], a[col])]
+    return [a[i][n] / a[i][i] for i in range(n)]
+
+
+class CostModel:
+
+    def __init__(self, coefficients=None):
+        # {"stage/detector/particle" or "stage/*/particle": [a, b, c]}
+        self.coefficients = coefficients or {}
+
+    def fit(self, records):
+        groups = {}
+        for r in records:
+            if r["nevts"] <= 0 or r["seconds"] <= 0 or r.get("particle") is None:
+                continue
+            stage = record_stage(r)
+            for key in [f"{stage}/{r['detector']}/{r['particle']}", f"{stage}/*/{r['particle']}"]:
+                groups.setdefault(key, []).append(r)
+        for key, group in groups.items():
+            if len(group) < min_records:
+                continue
+            x = [features(r["theta"], r["momentum"]) for r in group]
+            y = [math.log(r["seconds"] / r["nevts"]) for r in group]
+            # least squares, with a constant model if the points do not constrain the slopes
+            coefficients = least_squares(x, y)
+            self.coefficients[key] = coefficients if coefficients else [sum(y) / len(y), 0.0, 0.0]
+        return self
+
+    def fit_key(self, stage, detector, particle):
+        """Key of the fit used for a group, the batch stages falling back to their stage, or None."""
+        base_stage = stage[:-len("_batch")] if stage.endswith("_batch") else stage
+        for key in [f"{stage}/{detector}/{particle}", f"{stage}/*/{particle}",
+                    f"{base_stage}/{detector}/{particle}", f"{base_stage}/*/{particle}"]:
+            if key in self.coefficients:
+                return key
+        return None
+
+    def has_fit(self, stage, detector, particle):
+        """True if event_seconds comes from measurements rather than the default cost."""
+        return self.fit_key(stage, detector, particle) is not None
+
+    def event_seconds(self, stage, detector, particle, theta, momentum):
+        key = self.fit_key(stage, detector, particle)
+        if key is None:
+            return default_event_seconds[stage[:-len("_batch")] if stage.endswith("_batch") else stage]
+        return math.exp(sum(c * f for c, f in zip(self.coefficients[key], features(theta, momentum))))
+
+    def task_seconds(self, stage, detector, particle, theta, momentum, nevts):
+        return self.event_seconds(stage, detector, particle, theta, momentum) * int(nevts)
+
+    def save(self, path):
+        with open(path, "w") as model_file:
+            json.dump(self.coefficients, model_file, indent=1, sort_keys=True)
+
+    @classmethod
+    def load(cls, path):
+        """Model saved by save(), or the default model if the file does not exist."""
+        if not os.path.exists(path):
+            return cls()
+        with open(path) as model_file:
+            return cls(json.load(model_file))
+
+
+def job_flavour(seconds, margin=1.5):
+    """Shortest job flavour whose wall-time limit covers seconds * margin."""
+    for name, limit in job_flavours:
+        if seconds * margin <= limit:
+            return name
+    return job_flavours[-1][0]
+
+
+def pack_tasks(costs, target_seconds):
+    """Group tasks into chunks of about target_seconds each (longest processing time first).
+
+    costs is a list of expected durations, one per task. Returns a list of
+    (task indices, expected duration) per chunk.
+    """
+    if not costs:
+        return []
+    n_chunks = max(1, math.ceil(sum(costs) / target_seconds))
+    # a task longer than the target gets its own chunk
+    n_chunks = max(n_chunks, sum(1 for c in costs if c >= target_seconds))
+    n_chunks = min(n_chunks, len(costs))
+    heap = [(0.0, i) for i in range(n_chunks)]
+    chunks = [[] for _ in range(n_chunks)]
+    for task in sorted(range(len(costs)), key=lambda t: costs[t], reverse=True):
+        load, i = heapq.heappop(heap)
+        chunks[i].append(task)
+        heapq.heappush(heap, (load + costs[task], i))
+    loads = {i: load for load, i in heap}
+    return [(sorted(chunks[i]), loads[i]) for i in range(n_chunks) if chunks[i]]
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Fit the task cost model from the TIMING lines of previous job logs")
+    parser.add_argument("-Logs", help="Glob patterns of the job output files", nargs="+", required=True)
+    parser.add_argument("-Model", help="Cost model file to write", default="cost_model.json")
+    args = parser.parse_args()
+
+    records = read_timing_records(args.Logs)
+    model = CostModel.load(args.Model).fit(records)
+    model.save(args.Model)
+    print(f"{len(records)} timing records, model written to {args.Model}")
+    for key, (a, b, c) in sorted(model.coefficients.items()):
+        print(f"  {key:40s} s/evt = {math.exp(a):.3g} * p^{b:.2f} * sin(theta)^{c:.2f}")
@@ -0,0 +1,133 @@
+#!/usr/bin/env python
+
+import os
+import time
+import queue
+import shutil
+import tempfile
+import subprocess
+from collections import namedtuple
+from multiprocessing import Pool, Queue
+
+# Backends that run the same list of tasks either on HTCondor or on the local machine.
+# A task is a command (usually the bash_script.sh of a job) run from a job directory,
+# with the files HTCondor would transfer to it. Both backends have run(tasks), which
+# returns {task name: return code}; for HTCondor this is the status of condor_submit.
+
+Task = namedtuple("Task", ["name", "directory", "command", "flavour", "transfer"], defaults=["espresso", []])
+
+
+class CondorExecutor:
+
+    def __init__(self, submit_template, submit_file="condor_script.sub"):
+        # submit_template is formatted with executable, arguments, flavour and transfer
+        self.submit_template = submit_template
+        self.submit_file = submit_file
+
+    def run(self, tasks):
+        status = {}
+        for task in tasks:
+            with open(os.path.join(task.directory, self.submit_file), "w") as file:
+                transfer = "transfer_input_files = " + ", ".join(task.transfer) if task.transfer else ""
+                file.write(self.submit_template.format(executable=task.command[0], arguments=" ".join(task.command[1:]),
+                                                       flavour=task.flavour, transfer=transfer))
+            status[task.name] = subprocess.run(["condor_submit", self.submit_file], cwd=task.directory).returncode
+        return status
+
+
+def available_memory_gb():
+    """MemAvailable of /proc/meminfo in GB, or None if it cannot be read."""
+    try:
+        with open("/proc/meminfo") as meminfo:
+            for line in meminfo:
+                if line.startswith("MemAvailable:"):
+                    return int(line.split()[1]) / 1024**2
+    except OSError:
+        pass
+    return None
+
+
+def pin_worker(cpus):
+    # each worker takes one CPU, and the processes it starts inherit the affinity. A worker
+    # that replaces a dead one finds the queue empty and runs unpinned rather than waiting;
+    # the short timeout leaves time for the CPUs put by the parent to reach the queue
+    try:
+        cpu = cpus.get(timeout=1)
+    except queue.Empty:
+        return
+    if hasattr(os, "sched_setaffinity"):
+        os.sched_setaffinity(0, {cpu})
+
+
+def run_local_task(item):
+    task, retries, scratch, log_directory = item
+    log_directory = log_directory or task.directory
+    os.makedirs(log_directory, exist_ok=True)
+    returncode = None
+    with open(os.path.join(log_directory, f"{task.name}.local.out"), "w") as out, \
+         open(os.path.join(log_directory, f"{task.name}.local.err"), "w") as err:
+        for attempt in range(retries + 1):
+            out.write(f"===== attempt {attempt + 1}, {time.ctime()}\n")
+            out.flush()
+            # like on a worker node, run in an empty directory with the transferred files
+            work_directory = tempfile.mkdtemp(prefix=f"{task.name}.", dir=task.directory) if scratch else task.directory
+            for path in task.transfer:
+                shutil.copy(path, work_directory)
+            start = time.time()
+            returncode = subprocess.run(task.command, cwd=work_directory, stdout=out, stderr=err).returncode
+            out.write(f"===== exit code {returncode} after {time.time() - start:.0f} s\n")
+            out.flush()
+            # the scratch directory of a failed attempt is kept for debugging
+            if scratch and returncode == 0:
+                shutil.rmtree(work_directory, ignore_errors=True)
+            if returncode == 0:
+                break
+    return task.name, returncode
+
+
+class LocalExecutor:
+
+    def __init__(self, n_processes=None, memory_per_task_gb=2.0, retries=1, pin_cpus=True, scratch=True, log_directory=None):
+        self.n_processes = n_processes
+        self.memory_per_task_gb = memory_per_task_gb
+        self.retries = retries
+        self.pin_cpus = pin_cpus
+        self.scratch = scratch
+        self.log_directory = log_directory
+
+    def workers(self, n_tasks):
+        """Number of parallel tasks: bounded by the CPUs, the available memory and the number of tasks."""
+        cpus = sorted(os.sched_getaffinity(0)) if hasattr(os, "sched_getaffinity") else list(range(os.cpu_count()))
+        n = min(self.n_processes or len(cpus), len(cpus), n_tasks)
+        memory = available_memory_gb()
+        if memory is not None and self.memory_per_task_gb:
+            n = min(n, int(memory / self.memory_per_task_gb))
+        return max(1, n), cpus
+
+    def run(self, tasks):
+        if not tasks:
+            return {}
+        n, cpus = self.workers(len(tasks))
+        print(f"-----> running {len(tasks)} tasks with {n} local processes")
+        initializer, initargs = None, ()
+        if self.pin_cpus:
+            cpu_queue = Queue()
+            for cpu in cpus[:n]:
+                cpu_queue.put(cpu)
+            initializer, initargs = pin_worker, (cpu_queue,)
+        status = {}
+        with Pool(n, initializer=initializer, initargs=initargs) as pool:
+            items = [(task, self.retries, self.scratch, self.log_directory) for task in tasks]
+            for name, returncode in pool.imap_unordered(run_local_task, items):
+                status[name] = returncode
+                print(f"{name}: {'done' if returncode == 0 else f'failed ({returncode})'}")
+        return status
+
+
+def make_executor(kind, submit_template=None, **local_options):
+    """"condor" or "local" backend; the local options are passed to LocalExecutor."""
+    if kind == "condor":
+        return CondorExecutor(submit_template)
+    if kind == "local":
+        return LocalExecutor(**local_options)
+    raise ValueError(f"unknown executor {kind}, use condor or local")
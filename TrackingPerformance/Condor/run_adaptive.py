@@ -0,0 +1,162 @@
+#!/usr/bin/env python
+
+import os
+import sys
+import json
+import math
+import argparse
+import subprocess
+import numpy as np
+import ROOT
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from sigma_clip import sigma_clip
+
+# Sequential sampling of one particle-gun point: simulate and reconstruct batches of
+# events until the statistical precision on sigma(DeltapT/pT^2), sigma(d0) and
+# sigma(z0) reaches the target, then merge the batches into the usual SIM/REC files.
+# The merged files keep their names, and the number of events they hold is written to
+# a <name>_sampling.json next to each of them, read by validate_outputs.py.
+
+# Magnetic field in T of the detector models, to get pT from omega
+detector_bfield = {
+    "FCCee_o1_v04": 2.0,
+    "FCCee_o2_v02": 2.0,
+}
+
+parser = argparse.ArgumentParser(description="Simulate and reconstruct one point in batches until the resolutions are precise enough")
+parser.add_argument("-DetectorModel", help="Detector model: FCCee_o1_v04 \n FCCee_o2_v02", required=True)
+parser.add_argument("-Particle", help="particles: [mu, e, pi]", required=True)
+parser.add_argument("-Momentum", help="momentum ", required=True)
+parser.add_argument("-Theta", help="theta ", required=True)
+# one seed per batch, from SeedService.seed(..., chunk=batch) so that they are recorded and unique in the campaign
+parser.add_argument("-Seeds", help="Seeds of the batches, at least MaxEvts / BatchEvts of them", nargs="+", required=True)
+parser.add_argument("-SimSteeringFile", help="ddsim steering file", required=True)
+parser.add_argument("-RecoSteeringFile", help="Reconstruction steering file", required=True)
+parser.add_argument("-SimOutputPath", help="Merged SIM output file path", required=True)
+parser.add_argument("-RecOutputPath", help="Merged REC output file path", required=True)
+parser.add_argument("-BatchEvts", help="Number of events per batch", type=int, default=1000)
+parser.add_argument("-MinEvts", help="Minimum number of events before stopping", type=int, default=2000)
+parser.add_argument("-MaxEvts", help="Maximum number of events", type=int, default=10000)
+parser.add_argument("-TargetPrecision", help="Target relative statistical error on the resolutions", type=float, default=0.02)
+parser.add_argument("-BField", help="Magnetic field in T, to get pT from omega (default: that of the detector model)", type=float, default=None)
+args = parser.parse_args()
+if len(args.Seeds) < math.ceil(args.MaxEvts / args.BatchEvts):
+    parser.error(f"{math.ceil(args.MaxEvts / args.BatchEvts)} seeds are needed for {args.MaxEvts} events in batches of {args.BatchEvts}")
+if args.BField is None:
+    if args.DetectorModel not in detector_bfield:
+        parser.error(f"no magnetic field known for {args.DetectorModel}, give it with -BField")
+    args.BField = detector_bfield[args.DetectorModel]
+
+# Selections of CLDperfPlot_track.py: threshold and number of passes of the sigma clipping
+clip_settings = {
+    "DeltaPt_Pt2": (3, 3),
+    "d0": (2, 3),
+    "z0": (3, 3),
+}
+
+# Track state at the IP of the gun particle, as in Plotting/analysis_stage1.py
+ROOT.gROOT.SetBatch(True)
+ROOT.gInterpreter.Declare("""
+ROOT::VecOps::RVec<int> MCTruthTrackIndex(ROOT::VecOps::RVec<int> trackIndex,
+                                          ROOT::VecOps::RVec<int> mcIndex,
+                                          ROOT::VecOps::RVec<edm4hep::MCParticleData> mc)
+{
+    ROOT::VecOps::RVec<int> res;
+    res.resize(mc.size(), -1);
+
+    for (size_t i = 0; i < trackIndex.size(); i++) {
+        res[mcIndex[i]] = trackIndex[i];
+    }
+    return res;
+}
+""")
+
+def read_residuals(rec_file):
+    # Residuals of the gun particle track for one batch; the gun shoots from the origin so d0 and z0 are true 0
+    df = (ROOT.RDataFrame("events", rec_file)
+          .Alias("MCTrackAssociations0", "SiTracksMCTruthLink#0.index")
+          .Alias("MCTrackAssociations1", "SiTracksMCTruthLink#1.index")
+          .Define("GunParticle_index", "MCParticles.generatorStatus == 1")
+          .Define("GunParticle", "MCParticles[GunParticle_index][0]")
+          .Define("trackStates_IP", "SiTracks_Refitted_1[SiTracks_Refitted_1.location == 1]")
+          .Define("MC2TrackIndex", "MCTruthTrackIndex(MCTrackAssociations0, MCTrackAssociations1, MCParticles)")
+          .Define("GunParticleTrackIndex", "MC2TrackIndex[GunParticle_index][0]")
+          .Filter("GunParticleTrackIndex >= 0 && GunParticleTrackIndex < (int) trackStates_IP.size()")
+          .Define("GunParticleTSIP", "trackStates_IP[GunParticleTrackIndex]")
+          .Define("true_pt", "std::hypot(GunParticle.momentum.x, GunParticle.momentum.y)")
+          .Define("reco_pt", f"0.299792458e-3 * {args.BField} / std::abs(GunParticleTSIP.omega)")
+          .Define("DeltaPt_Pt2", "(reco_pt - true_pt) / (true_pt * true_pt)")
+          .Define("d0", "GunParticleTSIP.D0")
+          .Define("z0", "GunParticleTSIP.Z0"))
+    columns = df.AsNumpy(list(clip_settings))
+    return {v: np.asarray(columns[v], dtype=np.float64) for v in clip_settings}
+
+def relative_sigma_error(data):
+    # Relative statistical error of the standard deviation: 1/2 sqrt((m4/m2^2 - 1) / n)
+    n = len(data)
+    if n < 2:
+        return np.inf
+    centred = data - np.mean(data)
+    m2 = np.mean(centred**2)
+    m4 = np.mean(centred**4)
+    if m2 == 0:
+        return np.inf
+    return 0.5 * np.sqrt(max(m4 / m2**2 - 1, 0) / n)
+
+def precision(residuals):
+    # Relative error on the resolution of each variable, after the selections of the plotting script
+    result = {}
+    for v, (threshold, n_selections) in clip_settings.items():
+        result[v] = relative_sigma_error(sigma_clip(residuals[v], threshold, n_selections).data)
+    return result
+
+work_dir = os.path.splitext(os.path.basename(args.RecOutputPath))[0] + "_batches"
+os.makedirs(work_dir, exist_ok=True)
+
+residuals = {v: np.zeros(0) for v in clip_settings}
+sim_files = []
+rec_files = []
+history = []
+n_events = 0
+batch = 0
+while n_events < args.MaxEvts:
+    n_batch = min(args.BatchEvts, args.MaxEvts - n_events)
+    sim_file = os.path.join(work_dir, f"SIM_batch{batch}.slcio")
+    rec_file = os.path.join(work_dir, f"REC_batch{batch}_edm4hep.root")
+    seed = args.Seeds[batch]
+
+    subprocess.run(["python", "run_ddsim.py", "-DetectorModel", args.DetectorModel, "-Nevts", str(n_batch),
+                    "-Particle", args.Particle, "-Momentum", args.Momentum, "-Theta", args.Theta, "-Seed", seed,
+                    "-OutputPath", sim_file, "-SteeringFile", args.SimSteeringFile], check=True)
+    subprocess.run(["python", "run_reco.py", "-Nevts", str(n_batch), "-OutputPath", rec_file,
+                    "-InputPath", sim_file, "-SteeringFile", args.RecoSteeringFile], check=True)
+    sim_files.append(sim_file)
+    rec_files.append(rec_file)
+    n_events += n_batch
+    batch += 1
+
+    batch_residuals = read_residuals(rec_file)
+    for v in clip_settings:
+        residuals[v] = np.concatenate([residuals[v], batch_residuals[v]])
+    errors = precision(residuals)
+    history.append({"events": n_events, "relative_errors": errors})
+    print(f"batch {batch}: {n_events} events, relative errors " + ", ".join(f"{v} {e:.4f}" for v, e in errors.items()))
+
+    if n_events >= args.MinEvts and max(errors.values()) <= args.TargetPrecision:
+        print(f"Target precision {args.TargetPrecision} reached after {n_events} events")
+        break
+
+# Merge the batches into the files expected by the rest of the chain
+if len(sim_files) == 1:
+    os.replace(sim_files[0], args.SimOutputPath)
+    os.replace(rec_files[0], args.RecOutputPath)
+else:
+    subprocess.run(["lcio_merge_files", args.SimOutputPath] + sim_files, check=True)
+    # hadd would not merge the podio metadata and collection IDs
+    subprocess.run(["podio-merge-files", "--output-file", args.RecOutputPath] + rec_files, check=True)
+
+# Record how many events were used, next to the SIM and REC files
+for path in [args.SimOutputPath, args.RecOutputPath]:
+    with open(os.path.splitext(path)[0] + "_sampling.json", "w") as sampling_file:
+        json.dump({"events": n_events, "batches": batch, "target_precision": args.TargetPrecision, "history": history}, sampling_file, indent=1)
@@ -1,7 +1,9 @@
 #!/usr/bin/env python
 
 import os
+import time
 import argparse
+from cost_model import timing_record
 
 parser = argparse.ArgumentParser(description="Script for plotting Detector Performances")
 parser.add_argument("-DetectorModel", help="Detector model: FCCee_o1_v04 \n FCCee_o2_v02", required=True)
@@ -32,6 +34,10 @@ command = (
 
 print(command)
 
+start = time.time()
 os.system(command + " > /dev/null")
 
+# Wall time of the task, collected from the job logs by cost_model.py
+print(timing_record("sim", args.DetectorModel, args.Particle, args.Theta, args.Momentum, args.Nevts, time.time() - start))
+
 
@@ -0,0 +1,104 @@
+#!/usr/bin/env python
+
+import os
+import sys
+import json
+import math
+import time
+import random
+import argparse
+import subprocess
+from seeds import hash_seed
+from cost_model import timing_record
+
+# Simulation of several particle-gun points with a single ddsim process, so that the
+# geometry and the Geant4 physics tables are built once per job instead of once per
+# point. The gun schedule (JSON list of {"particle", "momentum", "theta", "nevts",
+# "seed", "output"}) is turned into one HEPEvt file with the events of every point in
+# sequence, ddsim simulates it, and the output is split back into one file per point.
+#
+# The gun events are those of run_ddsim.py: the particle ("mu" -> mu-) with a kinetic
+# energy of momentum GeV, at a fixed theta and a uniform phi, from the origin.
+
+# PDG code and mass (GeV) of the negative gun particles
+gun_particles = {"mu": (13, 0.1056583755), "e": (11, 0.00051099895), "pi": (-211, 0.13957039)}
+
+
+def gun_events(point):
+    """HEPEvt lines of the events of one point."""
+    pdg, mass = gun_particles[point["particle"]]
+    energy = float(point["momentum"]) + mass
+    p = math.sqrt(energy**2 - mass**2)
+    theta = math.radians(float(point["theta"]))
+    generator = random.Random(point["seed"])
+    lines = []
+    for _ in range(int(point["nevts"])):
+        phi = generator.uniform(0, 2 * math.pi)
+        px, py, pz = p * math.sin(theta) * math.cos(phi), p * math.sin(theta) * math.sin(phi), p * math.cos(theta)
+        # short HEPEvt format: number of particles, then status pdg daughter1 daughter2 px py pz mass
+        lines += ["1", f"1 {pdg} 0 0 {px:.10g} {py:.10g} {pz:.10g} {mass:.10g}"]
+    return lines
+
+
+def split_events(input_file, outputs):
+    """Write the events of input_file in sequence to the outputs, a list of (path, number of events)."""
+    from pyLCIO import IOIMPL, EVENT
+    reader = IOIMPL.LCFactory.getInstance().createLCReader()
+    reader.open(input_file)
+    writer = IOIMPL.LCFactory.getInstance().createLCWriter()
+    for path, nevts in outputs:
+        writer.open(path, EVENT.LCIO.WRITE_NEW)
+        for _ in range(nevts):
+            event = reader.readNextEvent()
+            if event is None:
+                raise RuntimeError(f"{input_file} has fewer events than the schedule")
+            writer.writeEvent(event)
+        writer.close()
+    reader.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Simulate several particle-gun points with one ddsim process")
+    parser.add_argument("-DetectorModel", help="Detector model: FCCee_o1_v04 \n FCCee_o2_v02", required=True)
+    parser.add_argument("-Schedule", help="Gun schedule (JSON list of particle, momentum, theta, nevts, seed, output)", required=True)
+    parser.add_argument("-SteeringFile", help="Steering file", required=True)
+    parser.add_argument("-Seed", help="Geant4 seed of the job (default: from the seeds of the points)", type=int, default=None)
+    parser.add_argument("-KeepCombined", help="Keep the HEPEvt and the combined SIM file", action="store_true")
+    args = parser.parse_args()
+
+    with open(args.Schedule) as schedule_file:
+        schedule = json.load(schedule_file)
+    n_total = sum(int(point["nevts"]) for point in schedule)
+
+    hepevt_file = os.path.splitext(os.path.basename(args.Schedule))[0] + ".HEPEvt"
+    combined_file = os.path.splitext(os.path.basename(args.Schedule))[0] + "_combined.slcio"
+    with open(hepevt_file, "w") as f:
+        for point in schedule:
+            f.write("\n".join(gun_events(point)) + "\n")
+
+    # the Geant4 seed of the job depends on the seeds of all its points, see SeedService.batch_seed
+    seed = args.Seed if args.Seed is not None else hash_seed(*[point["seed"] for point in schedule])
+    command = (
+        "ddsim --compactFile ${LCGEO}/FCCee/compact/" + args.DetectorModel + "/" + args.DetectorModel + ".xml "
+        "--outputFile " + combined_file + " "
+        "--steeringFile " + args.SteeringFile + " "
+        "--random.seed " + str(seed) + " "
+        "--inputFiles " + hepevt_file + " "
+        "--crossingAngleBoost 0 "
+        "--numberOfEvents " + str(n_total)
+    )
+    print(command)
+
+    start = time.time()
+    if subprocess.run(command + " > /dev/null", shell=True).returncode != 0:
+        sys.exit(f"ddsim failed on {hepevt_file}")
+    split_events(combined_file, [(point["output"], int(point["nevts"])) for point in schedule])
+    seconds = time.time() - start
+
+    # Wall time shared between the points in proportion to their events, tagged as such for cost_model.py
+    for point in schedule:
+        print(timing_record("sim", args.DetectorModel, point["particle"], point["theta"], point["momentum"], point["nevts"],
+                            seconds * int(point["nevts"]) / n_total, points=len(schedule)))
+    if not args.KeepCombined:
+        os.remove(hepevt_file)
+        os.remove(combined_file)
@@ -1,13 +1,35 @@
 #!/usr/bin/env python
 
 import os
+import sys
+import json
+import time
 import argparse
+import subprocess
+from cost_model import timing_record
 
 parser = argparse.ArgumentParser(description="Script for plotting Detector Performances")
 parser.add_argument("-Nevts", help="Number of events", required=True)
 parser.add_argument("-OutputPath", help="Output file path", required=True)
 parser.add_argument("-InputPath", help="Input file path", required=True)         
 parser.add_argument("-SteeringFile", help="Steering file", required=True)       
+# Description of the point, only used for the timing record
+parser.add_argument("-DetectorModel", help="Detector model", default=None)
+parser.add_argument("-Particle", help="particles: [mu, e, pi]", default=None)
+parser.add_argument("-Momentum", help="momentum ", default=0)
+parser.add_argument("-Theta", help="theta ", default=0)
+# Hit resolutions [U, V] in mm, used for the barrel and the endcaps. They are passed to
+# the steering file on the command line instead of being read from config_values.py
+parser.add_argument("-VXDRes", help="VXD resolutions U V", nargs=2, default=None)
+parser.add_argument("-ITRes", help="IT resolutions U V", nargs=2, default=None)
+parser.add_argument("-OTRes", help="OT resolutions U V", nargs=2, default=None)
+# Collections and format of the output, see output_profiles.py (default: those of the steering file)
+parser.add_argument("-OutputProfile", help="Output profile: tracking, pfo, full", default=None)
+parser.add_argument("-OutputFormat", help="edm4hep or lcio", default="edm4hep")
+# Time and memory of every processor, written to <output>.profile.json (needs processor_profiling.py)
+parser.add_argument("-Profile", help="Profile the processors", action="store_true")
+# Other ConformalTracking cuts, JSON file of {step: {parameter: value}} (needs conformal_steps.py)
+parser.add_argument("-ConformalStepParameters", help="ConformalTracking Steps overrides", default=None)
 
 args = parser.parse_args()
 
@@ -19,12 +41,46 @@ else:
     command = (
         "k4run " + args.SteeringFile +  
         " --LcioEvent.Files " + args.InputPath + 
-        " --filename.PodioOutput " + args.OutputPath +
+        (" --OutputFormat lcio --LCIOOutputFile " if args.OutputFormat == "lcio" else " --filename.PodioOutput ") + args.OutputPath +
         " -n " + args.Nevts
     )
+    if args.OutputProfile:
+        command += " --OutputProfile " + args.OutputProfile
+    if args.ConformalStepParameters:
+        command += " --ConformalStepParameters " + args.ConformalStepParameters
+    stem = os.path.splitext(args.OutputPath)[0]
+    if args.Profile:
+        command += " --Profile --ProfileTimingFile " + stem + ".timing.txt"
+    for layer in ["VXD", "IT", "OT"]:
+        resolutions = getattr(args, layer + "Res")
+        if resolutions:
+            for part in ["Barrel", "Endcap"]:
+                command += f" --{layer}{part}ResU {resolutions[0]} --{layer}{part}ResV {resolutions[1]}"
+    if args.DetectorModel and (args.VXDRes or args.ITRes or args.OTRes):
+        command += f" --DetectorModel /FCCee/compact/{args.DetectorModel}/{args.DetectorModel}.xml"
     print(command)
 
-    os.system(command + " > /dev/null")
+    start = time.time()
+    # the k4run log holds the MemoryAuditor lines when profiling
+    returncode = subprocess.run(command + (" > " + stem + ".k4run.log" if args.Profile else " > /dev/null"), shell=True).returncode
+
+    # Wall time of the task, collected from the job logs by cost_model.py
+    if returncode == 0:
+        print(timing_record("reco", args.DetectorModel, args.Particle, args.Theta, args.Momentum, args.Nevts, time.time() - start))
+
+    # a failed reconstruction has no profile, and the job fails so that it is retried
+    if args.Profile and returncode == 0:
+        from processor_profiling import profile_record
+        info = {"detector": args.DetectorModel, "particle": args.Particle, "theta": args.Theta, "momentum": args.Momentum,
+                "nevts": args.Nevts, "steering": os.path.basename(args.SteeringFile)}
+        with open(stem + ".profile.json", "w") as profile_file:
+            json.dump(profile_record(stem + ".timing.txt", stem + ".k4run.log", info), profile_file)
+        for path in [stem + ".timing.txt", stem + ".k4run.log"]:
+            if os.path.exists(path):
+                os.remove(path)
+    if returncode != 0:
+        print(f"/!\\ Error: k4run exited with status {returncode}")
+        sys.exit(1)
 
 
 
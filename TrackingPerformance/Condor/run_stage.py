@@ -0,0 +1,31 @@
+#!/usr/bin/env python
+
+import os
+import argparse
+import importlib.util
+import ROOT
+
+# Run one fccanalysis stage (Plotting/analysis_stage1.py or analysis_stage2.py) on a
+# single input file, so that each grid point can be its own node in the sweep DAG.
+
+parser = argparse.ArgumentParser(description="Run the analysers of an fccanalysis stage script on one file")
+parser.add_argument("-Stage", help="Stage script defining RDFanalysis", required=True)
+parser.add_argument("-InputPath", help="Input file path", required=True)
+parser.add_argument("-OutputPath", help="Output file path", required=True)
+parser.add_argument("-Threads", help="Number of threads for ROOT implicit multi-threading (0: disabled)", type=int, default=0)
+args = parser.parse_args()
+
+if args.Threads > 0:
+    ROOT.EnableImplicitMT(args.Threads)
+
+stage_spec = importlib.util.spec_from_file_location("stage", args.Stage)
+stage = importlib.util.module_from_spec(stage_spec)
+stage_spec.loader.exec_module(stage)
+
+df = stage.RDFanalysis.analysers(ROOT.RDataFrame("events", args.InputPath))
+branches = ROOT.std.vector["std::string"](stage.RDFanalysis.output())
+output_directory = os.path.dirname(args.OutputPath)
+if output_directory and not os.path.exists(output_directory):
+    os.makedirs(output_directory)
+df.Snapshot("events", args.OutputPath, branches)
+print(f"File {args.OutputPath}  -----> finished processing")
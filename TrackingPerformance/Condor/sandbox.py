@@ -0,0 +1,134 @@
+#!/usr/bin/env python
+
+import io
+import os
+import re
+import tarfile
+import hashlib
+import argparse
+
+# Reconstruction job sandbox: instead of copying the whole CLICPerformance checkout
+# into every job, pack only the files the steering file reads (PandoraSettings and
+# other inputs found in fcceeConfig), the steering file itself and optional extra files
+# such as a config_values.py, and the helper modules of the steering file into a compressed tarball named after the hash of its content. The tarball is sent
+# with transfer_input_files, and each worker node unpacks a given hash only once into
+# a local cache; jobs run in a symlink copy of the cached directory.
+
+# Extensions of the steering file inputs looked up in the configuration directory
+input_extensions = ["xml", "root", "txt", "json", "dat", "weights", "py"]
+
+# Modules the reconstruction steering files import from their own directory. They are
+# packed with the steering file, and copied next to it by the jobs without a sandbox
+steering_helpers = ["steering_pruner.py", "output_profiles.py", "processor_profiling.py", "conformal_steps.py"]
+
+# Local cache of the unpacked sandboxes on the worker nodes
+default_node_cache = "/tmp/${USER}/fullsim_sandbox"
+
+
+def steering_inputs(steering_file, config_dir):
+    """Files of config_dir referenced by the steering file, with the whole directory of each of them.
+
+    A referenced XML file can include its neighbours (e.g. the Pandora likelihood data),
+    so the directory of every referenced file is packed. Files that do not exist in
+    config_dir, such as output files, are ignored.
+    """
+    with open(steering_file) as f:
+        text = f.read()
+    pattern = r"[\"']([^\"'\s]+\.(?:" + "|".join(input_extensions) + r"))[\"']"
+    files = set()
+    for name in re.findall(pattern, text):
+        path = os.path.join(config_dir, name)
+        if os.path.isabs(name) or not os.path.isfile(path):
+            continue
+        directory = os.path.dirname(name)
+        if directory:
+            for root, _, names in os.walk(os.path.join(config_dir, directory)):
+                for n in names:
+                    files.add(os.path.relpath(os.path.join(root, n), config_dir))
+        else:
+            files.add(name)
+    return sorted(files)
+
+
+def steering_helper_paths(steering_file):
+    """Paths of the steering_helpers found next to the steering file."""
+    directory = os.path.dirname(os.path.abspath(steering_file))
+    return [os.path.join(directory, name) for name in steering_helpers if os.path.isfile(os.path.join(directory, name))]
+
+
+def sandbox_contents(steering_file, config_dir, extra_contents=None):
+    """{name in the sandbox: bytes} of the steering file, its inputs, its helper modules and the extra contents."""
+    contents = {}
+    for name in steering_inputs(steering_file, config_dir):
+        with open(os.path.join(config_dir, name), "rb") as f:
+            contents[name] = f.read()
+    with open(steering_file, "rb") as f:
+        contents[os.path.basename(steering_file)] = f.read()
+    for path in steering_helper_paths(steering_file):
+        with open(path, "rb") as f:
+            contents[os.path.basename(path)] = f.read()
+    for name, content in (extra_contents or {}).items():
+        contents[name] = content.encode() if isinstance(content, str) else content
+    return contents
+
+
+def content_hash(contents):
+    digest = hashlib.sha256()
+    for name in sorted(contents):
+        digest.update(name.encode() + b"\0" + hashlib.sha256(contents[name]).digest())
+    return digest.hexdigest()[:16]
+
+
+def build_sandbox(steering_file, config_dir, output_dir, extra_contents=None):
+    """Write the sandbox tarball to output_dir if it does not exist yet, and return (path, hash)."""
+    contents = sandbox_contents(steering_file, config_dir, extra_contents)
+    sandbox_hash = content_hash(contents)
+    path = os.path.join(output_dir, f"sandbox_{sandbox_hash}.tar.gz")
+    if os.path.exists(path):
+        return path, sandbox_hash
+    os.makedirs(output_dir, exist_ok=True)
+    tmp_path = f"{path}.tmp{os.getpid()}"
+    with tarfile.open(tmp_path, "w:gz") as tar:
+        for name in sorted(contents):
+            info = tarfile.TarInfo(name)
+            info.size = len(contents[name])
+            info.mode = 0o644
+            tar.addfile(info, io.BytesIO(contents[name]))
+    os.replace(tmp_path, path)
+    return path, sandbox_hash
+
+
+def unpack_commands(sandbox_path, sandbox_hash, node_cache=default_node_cache, work_dir="sandbox_work"):
+    """Shell commands that unpack the transferred sandbox once per node and enter a symlink copy of it."""
+    tarball = os.path.basename(sandbox_path)
+    cached = f"{node_cache}/{sandbox_hash}"
+    return [
+        f"if [ ! -d {cached} ]; then",
+        f"    mkdir -p {node_cache}",
+        f"    tmp_dir=$(mktemp -d {node_cache}/unpack.XXXXXX)",
+        f"    tar xzf {tarball} -C $tmp_dir && (mv -T $tmp_dir {cached} 2> /dev/null || rm -rf $tmp_dir)",
+        "fi",
+        f"mkdir -p {work_dir}",
+        f"cp -rs {cached}/. {work_dir}/",
+        f"cd {work_dir}",
+    ]
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Build the reconstruction sandbox of a steering file and list its content")
+    parser.add_argument("-SteeringFile", help="Steering file", required=True)
+    parser.add_argument("-ConfigDir", help="Directory the steering file runs from, e.g. CLICPerformance/fcceeConfig", required=True)
+    parser.add_argument("-ConfigValues", help="config_values.py to include", default=None)
+    parser.add_argument("-OutputDir", help="Directory of the tarballs", default="sandboxes")
+    args = parser.parse_args()
+
+    extra = {}
+    if args.ConfigValues:
+        with open(args.ConfigValues) as f:
+            extra["config_values.py"] = f.read()
+    path, sandbox_hash = build_sandbox(args.SteeringFile, args.ConfigDir, args.OutputDir, extra)
+    with tarfile.open(path) as tar:
+        names = tar.getnames()
+    print(f"{path}: {len(names)} files, {os.path.getsize(path) / 1024:.1f} kB")
+    for name in names:
+        print(f"  {name}")
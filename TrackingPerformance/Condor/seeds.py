@@ -0,0 +1,71 @@
+#!/usr/bin/env python
+
+import os
+import json
+import hashlib
+
+# Deterministic random seeds for the simulation jobs. A seed is the first 32 bits of
+# the SHA-256 of (campaign, detector, particle, theta, momentum, chunk), so it does
+# not depend on when or where the job is submitted. The seeds of a campaign are
+# recorded in a JSON manifest, which is also used to make them unique: if two
+# points hash to the same seed, the later one is salted until it is free.
+#
+# A point simulated in a batch (run_ddsim_batch.py) takes its gun kinematics from its
+# own seed, but the Geant4 seed is that of the batch job. The manifest records it for
+# each point, with the points of the batch in their order, which are needed to
+# reproduce the events.
+
+
+def hash_seed(*fields):
+    """32-bit seed from the hash of the fields, never 0."""
+    digest = hashlib.sha256("/".join(str(f) for f in fields).encode()).digest()
+    return int.from_bytes(digest[:4], "big") or 1
+
+
+class SeedService:
+
+    def __init__(self, campaign, manifest_path=None):
+        self.campaign = campaign
+        self.manifest_path = manifest_path
+        self.seeds = {}
+        self.batches = {}
+        if manifest_path and os.path.exists(manifest_path):
+            with open(manifest_path) as manifest_file:
+                manifest = json.load(manifest_file)
+            if manifest["campaign"] != campaign:
+                raise ValueError(f"seed manifest {manifest_path} belongs to campaign {manifest['campaign']}, not {campaign}")
+            self.seeds = manifest["seeds"]
+            self.batches = manifest.get("batches", {})
+        self.used = set(self.seeds.values())
+
+    def seed(self, detector, particle, theta, momentum, chunk=0):
+        """Seed of one job, the same every time it is asked for."""
+        key = f"{detector}/{particle}/{theta}/{momentum}/{chunk}"
+        if key not in self.seeds:
+            salt = 0
+            seed = hash_seed(self.campaign, key)
+            while seed in self.used:
+                salt += 1
+                seed = hash_seed(self.campaign, key, salt)
+            self.seeds[key] = seed
+            self.used.add(seed)
+        return self.seeds[key]
+
+    def batch_seed(self, detector, points):
+        """Geant4 seed of a batch job simulating points, a list of (particle, theta, momentum, chunk), recorded for each of them."""
+        keys = [f"{detector}/{particle}/{theta}/{momentum}/{chunk}" for particle, theta, momentum, chunk in points]
+        seed = hash_seed(*[self.seed(detector, *point) for point in points])
+        for key in keys:
+            self.batches[key] = {"geant4_seed": seed, "points": keys}
+        return seed
+
+    def save(self):
+        """Write the manifest, replacing the previous one atomically."""
+        if not self.manifest_path:
+            return
+        directory = os.path.dirname(os.path.abspath(self.manifest_path))
+        os.makedirs(directory, exist_ok=True)
+        tmp_path = f"{self.manifest_path}.tmp{os.getpid()}"
+        with open(tmp_path, "w") as manifest_file:
+            json.dump({"campaign": self.campaign, "seeds": self.seeds, "batches": self.batches}, manifest_file, indent=1, sort_keys=True)
+        os.replace(tmp_path, self.manifest_path)
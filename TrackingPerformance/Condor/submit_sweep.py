@@ -0,0 +1,230 @@
+#!/usr/bin/env python
+
+import os
+import argparse
+from collections import namedtuple
+from sweep_spec import load_spec, points, resolution_name, point_name, sim_file, rec_file, stage_file, resolution_arguments, shard_events, shard_file, load_cost_model, estimated_event_seconds
+from seeds import SeedService
+from sandbox import build_sandbox, unpack_commands, steering_helper_paths
+from executors import Task, LocalExecutor
+from cost_model import job_flavour
+
+# Whole campaign as one HTCondor DAG: for every point sim -> reco -> stage1 -> stage2,
+# with one reco/stage1/stage2 chain per resolution set. Expensive points are simulated
+# in parallel shards with distinct seeds, merged back into the usual SIM file. Only the nodes whose outputs
+# are missing or older than their inputs are submitted, together with everything
+# downstream of them. The sim and reco nodes get the job flavour of their expected
+# duration in the cost model.
+
+parser = argparse.ArgumentParser(description="Submit a simulation/reconstruction/analysis sweep as an HTCondor DAG")
+parser.add_argument("-Spec", help="Sweep specification (JSON)", required=True)
+parser.add_argument("-DagDirectory", help="Directory for the DAG, node scripts and logs", default="SweepDAG")
+parser.add_argument("-DryRun", help="Write the DAG but do not submit it", action="store_true")
+parser.add_argument("-SeedManifest", help="Seed manifest of the campaign (default: <DagDirectory>/<campaign>_seeds.json)", default=None)
+parser.add_argument("-Local", help="Run the nodes on this machine with N parallel processes instead of HTCondor", type=int, default=0)
+parser.add_argument("-LocalMemoryGB", help="Memory needed by one node when running locally", type=float, default=4.0)
+args = parser.parse_args()
+
+# One job of the DAG: shell commands, files read and written, parent nodes, and files sent with the job
+Node = namedtuple("Node", ["name", "commands", "inputs", "outputs", "parents", "flavour", "transfer"], defaults=[[]])
+
+condor_file_template = '''
+executable = {name}.sh
+output = {name}.out
+error = {name}.err
+log = {name}.log
++JobFlavour = "{flavour}"
+{transfer}
+queue
+'''
+
+
+def sim_node(spec, point, seed_service, cost_model, name, output, nevts, shard=0):
+    detector, particle, theta, momentum = point
+    local_output = os.path.basename(output)
+    seed = str(seed_service.seed(detector, particle, theta, momentum, shard))
+    arguments = ("-DetectorModel " + detector + " -Nevts " + str(nevts) + " -Particle " + particle + " -Momentum " + momentum +
+                 " -Theta " + theta + " -Seed " + seed + " -OutputPath " + local_output + " -SteeringFile " + spec["sim_steering"])
+    commands = [
+        "cp " + os.path.join(spec["scripts_dir"], "run_ddsim.py") + " " + os.path.join(spec["scripts_dir"], "cost_model.py") + " .",
+        "python run_ddsim.py " + arguments,
+        "mkdir -p " + os.path.dirname(output),
+        "cp " + local_output + " " + output,
+    ]
+    return Node(name, commands, [], [output], [], job_flavour(estimated_event_seconds(spec, point, cost_model) * int(nevts)))
+
+
+def sim_nodes(spec, point, seed_service, cost_model):
+    # One sim node, or one node per shard and a merge node producing the same SIM file
+    name = f"sim_{point_name(point)}"
+    output = sim_file(spec, point)
+    events = shard_events(spec, point, cost_model)
+    if len(events) == 1:
+        return [sim_node(spec, point, seed_service, cost_model, name, output, events[0])]
+    shards = [sim_node(spec, point, seed_service, cost_model, f"simshard{i}_{point_name(point)}", shard_file(spec, point, i), n, i)
+              for i, n in enumerate(events)]
+    shard_outputs = [shard.outputs[0] for shard in shards]
+    local_output = os.path.basename(output)
+    commands = [
+        "lcio_merge_files " + local_output + " " + " ".join(shard_outputs),
+        "mkdir -p " + os.path.dirname(output),
+        "cp " + local_output + " " + output,
+    ]
+    merge = Node(name, commands, shard_outputs, [output], [shard.name for shard in shards], spec["job_flavour"]["merge"])
+    return shards + [merge]
+
+
+def reco_node(spec, point, res, parent, sandbox_dir, cost_model):
+    output = rec_file(spec, point, res)
+    local_output = os.path.basename(output)
+    transfer = []
+    if spec["sandbox"]:
+        # steering inputs in a tarball shared by all the reconstruction jobs
+        sandbox_path, sandbox_hash = build_sandbox(spec["reco_steering"], os.path.join(spec["clic_dir"], "fcceeConfig"), sandbox_dir)
+        commands = unpack_commands(sandbox_path, sandbox_hash)
+        steering = os.path.basename(spec["reco_steering"])
+        transfer = [sandbox_path]
+    else:
+        commands = [
+            "cp -rf " + spec["clic_dir"] + " .",
+            "cd CLICPerformance/fcceeConfig",
+        ]
+        steering = spec["reco_steering"]
+    arguments = " -Nevts " + spec["nevts"] + " -OutputPath " + local_output + " -InputPath " + sim_file(spec, point) + " -SteeringFile " + steering
+    arguments += " -DetectorModel " + point[0] + " -Particle " + point[1] + " -Theta " + point[2] + " -Momentum " + point[3]
+    arguments += resolution_arguments(res)
+    commands += [
+        "cp " + os.path.join(spec["scripts_dir"], "run_reco.py") + " " + os.path.join(spec["scripts_dir"], "cost_model.py") + " .",
+        "cp " + os.path.join(os.path.dirname(spec["scripts_dir"].rstrip("/")), "validate_outputs.py") + " .",
+        # modules imported by the reconstruction steering file (also in the sandbox), and by run_reco.py -Profile
+        "cp " + " ".join(steering_helper_paths(spec["reco_steering"])) + " .",
+        "python run_reco.py " + arguments,
+        # a truncated output fails the node, which is retried instead of being analysed
+        "python validate_outputs.py -j 1 -Files " + local_output + " -Nevts " + spec["nevts"],
+        "mkdir -p " + os.path.dirname(output),
+        "cp " + local_output + " " + output,
+    ]
+    return Node(f"reco_{resolution_name(res)}_{point_name(point)}", commands, [sim_file(spec, point)], [output], [parent],
+                job_flavour(estimated_event_seconds(spec, point, cost_model, "reco") * int(spec["nevts"])), transfer)
+
+
+def stage_node(spec, point, res, stage, input_file, parent):
+    output = stage_file(spec, point, res, stage)
+    local_output = os.path.basename(output)
+    stage_script = f"analysis_{stage}.py"
+    commands = [
+        "cp " + os.path.join(spec["scripts_dir"], "run_stage.py") + " " + os.path.join(spec["plotting_dir"], stage_script) + " .",
+        "python run_stage.py -Stage " + stage_script + " -InputPath " + input_file + " -OutputPath " + local_output,
+        "mkdir -p " + os.path.dirname(output),
+        "cp " + local_output + " " + output,
+    ]
+    return Node(f"{stage}_{resolution_name(res)}_{point_name(point)}", commands, [input_file], [output], [parent],
+                spec["job_flavour"][stage])
+
+
+def build_nodes(spec, seed_service, sandbox_dir, cost_model):
+    nodes = []
+    for point in points(spec):
+        sim = sim_nodes(spec, point, seed_service, cost_model)
+        nodes += sim
+        sim = sim[-1]
+        for res in spec["resolution_sets"]:
+            reco = reco_node(spec, point, res, sim.name, sandbox_dir, cost_model)
+            stage1 = stage_node(spec, point, res, "stage1", reco.outputs[0], reco.name)
+            stage2 = stage_node(spec, point, res, "stage2", stage1.outputs[0], stage1.name)
+            nodes += [reco, stage1, stage2]
+    return nodes
+
+
+def is_stale(node, scheduled):
+    # A node runs if a parent runs, if an output is missing, or if an output is older than an input
+    if any(parent in scheduled for parent in node.parents):
+        return True
+    if not all(os.path.exists(output) for output in node.outputs):
+        return True
+    inputs = [i for i in node.inputs if os.path.exists(i)]
+    if inputs and min(os.path.getmtime(o) for o in node.outputs) < max(os.path.getmtime(i) for i in inputs):
+        return True
+    return False
+
+
+def write_node(node, setup, dag_directory):
+    node_directory = os.path.join(dag_directory, node.name)
+    os.makedirs(node_directory, exist_ok=True)
+    bash_file = os.path.join(node_directory, f"{node.name}.sh")
+    with open(bash_file, "w") as file:
+        file.write("#!/bin/bash \n")
+        file.write("set -e\n")
+        file.write("source " + setup + "\n")
+        for command in node.commands:
+            file.write(command + "\n")
+    os.chmod(bash_file, 0o755)
+    condor_file = os.path.join(node_directory, f"{node.name}.sub")
+    with open(condor_file, "w") as file:
+        transfer = "transfer_input_files = " + ", ".join(node.transfer) if node.transfer else ""
+        file.write(condor_file_template.format(name=node.name, flavour=node.flavour, transfer=transfer))
+    return node_directory
+
+
+def run_local(nodes, node_directories, executor):
+    # Run the nodes wave by wave: every node whose parents are done, in parallel
+    done = set()
+    failed = set()
+    pending = list(nodes)
+    while pending:
+        # the nodes are in dependency order, so one pass skips everything below a failure
+        for node in pending:
+            if any(p in failed for p in node.parents):
+                print(f"{node.name}: skipped, a parent failed")
+                failed.add(node.name)
+        pending = [n for n in pending if n.name not in failed]
+        ready = [n for n in pending if all(p in done or p not in node_directories for p in n.parents)]
+        if not ready:
+            break
+        # each node runs in a scratch directory with its transferred files, as on a worker node
+        tasks = [Task(n.name, node_directories[n.name], [os.path.join(node_directories[n.name], f"{n.name}.sh")], n.flavour, n.transfer)
+                 for n in ready]
+        for name, returncode in executor.run(tasks).items():
+            (done if returncode == 0 else failed).add(name)
+        pending = [n for n in pending if n.name not in done and n.name not in failed]
+    return len(failed) == 0
+
+
+spec = load_spec(args.Spec)
+dag_directory = os.path.abspath(args.DagDirectory)
+seed_service = SeedService(spec["campaign"], args.SeedManifest or os.path.join(dag_directory, f"{spec['campaign']}_seeds.json"))
+nodes = build_nodes(spec, seed_service, os.path.join(dag_directory, "sandboxes"), load_cost_model(spec))
+
+# Keep the nodes that need to run, in dependency order
+scheduled = set()
+to_run = []
+for node in nodes:
+    if is_stale(node, scheduled):
+        scheduled.add(node.name)
+        to_run.append(node)
+print(f"{len(to_run)} of {len(nodes)} nodes need to run")
+if not to_run:
+    exit(0)
+
+os.makedirs(dag_directory, exist_ok=True)
+seed_service.save()
+node_directories = {node.name: write_node(node, spec["setup"], dag_directory) for node in to_run}
+
+dag_file = os.path.join(dag_directory, f"{spec['campaign']}.dag")
+with open(dag_file, "w") as file:
+    for node in to_run:
+        file.write(f"JOB {node.name} {node.name}.sub DIR {node_directories[node.name]}\n")
+        if spec["retries"]:
+            file.write(f"RETRY {node.name} {spec['retries']}\n")
+    for node in to_run:
+        for parent in node.parents:
+            if parent in scheduled:
+                file.write(f"PARENT {parent} CHILD {node.name}\n")
+print(f"DAG written to {dag_file}")
+
+if args.Local > 0:
+    executor = LocalExecutor(n_processes=args.Local, memory_per_task_gb=args.LocalMemoryGB, retries=spec["retries"])
+    if not run_local(to_run, node_directories, executor):
+        exit(1)
+elif not args.DryRun:
+    os.system(f"cd {dag_directory}; condor_submit_dag {os.path.basename(dag_file)}")
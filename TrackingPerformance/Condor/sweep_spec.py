@@ -0,0 +1,125 @@
+#!/usr/bin/env python
+
+import os
+import math
+import json
+import itertools
+from cost_model import CostModel
+
+# Sweep specification shared by the submitters: the grid of (detector, particle,
+# theta, momentum) points, the resolution sets, and the naming of the files
+# produced at each stage. The spec is a JSON file, see sweep_example.json. The
+# simulation and reconstruction times come from the cost model of cost_model.py,
+# sim_event_cost being used for the points it has no fit for.
+
+required_keys = ["campaign", "detector_models", "particles", "thetas", "momenta", "nevts", "resolution_sets",
+                 "sim_steering", "reco_steering", "clic_dir", "scripts_dir", "plotting_dir",
+                 "sim_dir", "rec_dir", "analysis_dir"]
+
+defaults = {
+    "setup": "/cvmfs/sw.hsf.org/key4hep/setup.sh",
+    # Job flavours of the nodes the cost model does not time; the sim and reco nodes get theirs from their expected duration
+    "job_flavour": {"stage1": "espresso", "stage2": "espresso", "merge": "espresso"},
+    # Cost model fitted by cost_model.py (default: cost_model.json in scripts_dir)
+    "cost_model": None,
+    # Simulation time per event without a fit of the cost model: base + per_GeV[particle] * momentum, in seconds
+    "sim_event_cost": {"base": 0.2, "per_GeV": {"mu": 0.002, "e": 0.02, "pi": 0.01}},
+    # Target duration of one simulation shard in seconds (0: one job per point)
+    "shard_target_seconds": 0,
+    "max_shards": 50,
+    # Send the reconstruction inputs as a content-hashed tarball instead of copying clic_dir
+    "sandbox": True,
+    # Number of times DAGMan resubmits a failed node, e.g. a reco job whose output does not validate
+    "retries": 2,
+}
+
+
+def load_spec(path):
+    """Read a sweep spec and fill in the defaults."""
+    with open(path) as spec_file:
+        spec = json.load(spec_file)
+    missing = [key for key in required_keys if key not in spec]
+    if missing:
+        raise ValueError(f"sweep spec {path} is missing {', '.join(missing)}")
+    for key, value in defaults.items():
+        spec.setdefault(key, value)
+    for key, value in defaults["job_flavour"].items():
+        spec["job_flavour"].setdefault(key, value)
+    if spec["cost_model"] is None:
+        spec["cost_model"] = os.path.join(spec["scripts_dir"], "cost_model.json")
+    for res in spec["resolution_sets"]:
+        for layer in ["VXD", "IT", "OT"]:
+            if len(res.get(layer, [])) != 2:
+                raise ValueError(f"resolution set {res} needs a [U, V] pair for {layer}")
+    return spec
+
+
+def points(spec):
+    """(detector, particle, theta, momentum) of every point of the grid."""
+    return list(itertools.product(spec["detector_models"], spec["particles"], spec["thetas"], spec["momenta"]))
+
+
+def resolution_name(res):
+    """Tag of a resolution set in the file names, e.g. resIT_U_7_V_90mic as in condorJobs_reco.py."""
+    if "name" in res:
+        return res["name"]
+    return "resIT_U_" + str(int(float(res["IT"][0]) * 1000)) + "_V_" + str(int(float(res["IT"][1]) * 1000)) + "mic"
+
+
+def point_name(point):
+    detector, particle, theta, momentum = point
+    return f"{detector}_{particle}_{theta}_deg_{momentum}_GeV"
+
+
+def sim_file(spec, point):
+    detector, particle, theta, momentum = point
+    return os.path.join(spec["sim_dir"].format(detector=detector),
+                        f"SIM_{detector}_{particle}_{theta}_deg_{momentum}_GeV_{spec['nevts']}_evts.slcio")
+
+
+def rec_file(spec, point, res):
+    detector, particle, theta, momentum = point
+    return os.path.join(spec["rec_dir"].format(detector=detector),
+                        f"REC_{detector}_{resolution_name(res)}_{particle}_{theta}_deg_{momentum}_GeV_{spec['nevts']}_evts_edm4hep.root")
+
+
+def stage_file(spec, point, res, stage):
+    """Output of analysis stage1 or stage2, named like the processes of Plotting/analysis_final.py."""
+    detector, particle, theta, momentum = point
+    directory = os.path.join(spec["analysis_dir"].format(detector=detector, resolution=resolution_name(res)), stage)
+    return os.path.join(directory, f"{particle}_{theta}deg_{momentum}GeV_{spec['nevts']}evts.root")
+
+
+def load_cost_model(spec):
+    """Cost model of the spec, the default model if it was not fitted yet."""
+    return CostModel.load(spec["cost_model"])
+
+
+def estimated_event_seconds(spec, point, cost_model, stage="sim"):
+    """Expected time of one event of a point, from the cost model or else sim_event_cost for the simulation."""
+    detector, particle, theta, momentum = point
+    if stage == "sim" and not cost_model.has_fit(stage, detector, particle):
+        cost = spec["sim_event_cost"]
+        return cost["base"] + cost["per_GeV"].get(particle, 0) * float(momentum)
+    return cost_model.event_seconds(stage, detector, particle, theta, momentum)
+
+
+def shard_events(spec, point, cost_model):
+    """Number of events of each simulation shard of a point, so that a shard takes about shard_target_seconds."""
+    nevts = int(spec["nevts"])
+    if spec["shard_target_seconds"] <= 0:
+        return [nevts]
+    n_shards = math.ceil(nevts * estimated_event_seconds(spec, point, cost_model) / spec["shard_target_seconds"])
+    n_shards = max(1, min(n_shards, spec["max_shards"], nevts))
+    return [nevts // n_shards + (1 if i < nevts % n_shards else 0) for i in range(n_shards)]
+
+
+def shard_file(spec, point, shard):
+    """Simulation output of one shard, in a shards/ directory next to the merged file."""
+    merged = sim_file(spec, point)
+    return os.path.join(os.path.dirname(merged), "shards", os.path.basename(merged).replace(".slcio", f"_shard{shard}.slcio"))
+
+
+def resolution_arguments(res):
+    """run_reco.py options giving the hit resolutions of a set to the reconstruction steering file."""
+    return "".join(f" -{layer}Res {res[layer][0]} {res[layer][1]}" for layer in ["VXD", "IT", "OT"])
@@ -1,6 +1,38 @@
 #!/usr/bin/env python3
+import os
+import sys
+import math
+import argparse
 import ROOT
-from math import ceil, floor
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(1, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from quantile_histograms import sketch_accuracy, book_quantile_sketch, bin_contents, quantile_window, trimmed_histogram, histogram_from_counts
+from fit_cache import FitCache, file_identity, fit_key
+from summary_table import summary_row, write_summary, index_summary, summary_enabled
+
+# Command-line options, unknown arguments are left to fccanalysis
+parser = argparse.ArgumentParser(description="Fit the resolutions of each process and make the final plots")
+parser.add_argument("--threads", help="Number of threads for ROOT implicit multi-threading (0: disabled)", type=int, default=0)
+parser.add_argument("--run-graphs", help="Run the event loops of all processes concurrently with ROOT.RDF.RunGraphs", action="store_true")
+parser.add_argument("--cache", help="Fit cache file (default: <outputDir>/fit_cache.sqlite)", default=None)
+parser.add_argument("--no-cache", help="Always rerun the event loops and the fits", action="store_true")
+parser.add_argument("--cache-max-mb", help="Maximum size of the fit cache in MB", type=float, default=512)
+parser.add_argument("--summary", help="Summary table of the fit results (default: <outputDir>/summary.parquet)", default=None)
+args, _ = parser.parse_known_args()
+# The summary table needs pyarrow, checked before the event loops
+write_table = summary_enabled()
+
+if args.threads > 0:
+    ROOT.EnableImplicitMT(args.threads)
+
+# Clock used to time the event loop of each graph
+ROOT.gInterpreter.Declare("""
+double graphClockSeconds()
+{
+    return std::chrono::duration<double>(std::chrono::steady_clock::now().time_since_epoch()).count();
+}
+""")
 
 ROOT.gStyle.SetOptFit(1111)
 # Define marker styles and colors
@@ -28,9 +60,14 @@ def pname(particle, theta, momentum):
 
 processList = {pname(particle, theta, momentum):{} for particle in ParticleList for theta in ThetaList for momentum in MomentumList}
 #print(processList)
-outputDir = "Output/FCCee_o1_04/final_7mic"
+# particle, theta and momentum of each process, for the summary table
+processPoint = {pname(particle, theta, momentum): (particle, theta, momentum) for particle in ParticleList for theta in ThetaList for momentum in MomentumList}
+
+DetectorModel = "FCCee_o1_04"
+ResolutionConfig = "7mic"
+outputDir = f"Output/{DetectorModel}/final_{ResolutionConfig}"
 
-inputDir = "Output/FCCee_o1_04/stage2_7mic"
+inputDir = f"Output/{DetectorModel}/stage2_{ResolutionConfig}"
 
 residualList = ["d0", "z0", "phi0", "omega", "tanLambda", "phi", "theta"]
 specialList = ["pt", "p"]
@@ -61,37 +98,95 @@ unit_scale = {
     "sdelta_p": 1.0,
 }
 
-df = {}
-var_col_rp = {}
-# get column for each variable by running event loop once
+# settings of the fits, part of the cache key
+quantile_range = (0.05, 0.95)
+nbins = 200
+fit_function = "gaus"
+fit_option = "RQ"
+
+# look up the fits of each process in the cache, keyed on the input file and the fit settings
+cache = None
+if not args.no_cache:
+    cache = FitCache(args.cache or f"{outputDir}/fit_cache.sqlite", int(args.cache_max_mb * 1024 * 1024))
+cache_key = {}
+cached = {}
 for p in processList:
+    identity = file_identity(f"{inputDir}/{p}.root")
+    cache_key[p] = {v: fit_key(identity, v, quantile_range, sketch_accuracy, nbins, fit_function, fit_option) for v in varList}
+    cached[p] = {}
+    if cache is not None:
+        for v in varList:
+            entry = cache.get(cache_key[p][v])
+            if entry is not None:
+                cached[p][v] = entry
+# processes with at least one fit missing from the cache need an event loop
+runList = [p for p in processList if len(cached[p]) < len(varList)]
+print(f"{len(processList) - len(runList)} of {len(processList)} processes taken from the fit cache")
+
+df = {}
+h_sketch = {}
+# book a quantile sketch of each variable, filled in a single event loop
+for p in runList:
     df[p] = ROOT.RDataFrame("events", f"{inputDir}/{p}.root")
     for v in specialList:
         df[p] = df[p].Define(f"sdelta_{v}", f"delta_{v} / (true_{v} * true_{v})")
-    var_col_rp[p] = {}
+    h_sketch[p] = {}
     for v in varList:
-        var_col_rp[p][v] = df[p].Take["double"](v)
+        h_sketch[p][v] = book_quantile_sketch(df[p], v)
+
+# run the event loops, either all graphs together or one process after the other
+graph_start = {}
+graph_time = {}
+if args.run_graphs and runList:
+    clock_min = {}
+    clock_max = {}
+    for p in runList:
+        df_clock = df[p].Define("graph_clock", "graphClockSeconds()")
+        clock_min[p] = df_clock.Min("graph_clock")
+        clock_max[p] = df_clock.Max("graph_clock")
+    handles = [h_sketch[p][v] for p in runList for v in varList]
+    handles += [clock_min[p] for p in runList] + [clock_max[p] for p in runList]
+    run_start = ROOT.graphClockSeconds()
+    ROOT.RDF.RunGraphs(handles)
+    run_time = ROOT.graphClockSeconds() - run_start
+    for p in runList:
+        graph_start[p] = clock_min[p].GetValue() - run_start
+        graph_time[p] = clock_max[p].GetValue() - clock_min[p].GetValue()
+else:
+    run_start = ROOT.graphClockSeconds()
+    for p in runList:
+        graph_start[p] = ROOT.graphClockSeconds() - run_start
+        h_sketch[p][varList[0]].GetValue()
+        graph_time[p] = ROOT.graphClockSeconds() - run_start - graph_start[p]
+    run_time = ROOT.graphClockSeconds() - run_start
+
+print(f"Event loops of {len(runList)} processes done in {run_time:.1f} s (threads: {args.threads}, RunGraphs: {args.run_graphs})")
+for p in runList:
+    print(f"  {p}: started after {graph_start[p]:.1f} s, event loop {graph_time[p]:.1f} s")
 
-var_col = {}
 var_low = {}
 var_high = {}
 h = {}
-# get bin borders and run again to make histograms
+# get bin borders from the quantiles and derive the trimmed histograms without rereading the file
 for p in processList:
-    var_col[p] = {}
     var_low[p] = {}
     var_high[p] = {}
     h[p] = {}
     for v in varList:
-        var_col[p][v] = sorted(var_col_rp[p][v].GetValue())
-        var_low[p][v] = var_col[p][v][ceil(0.05 * len(var_col[p][v]))]
-        var_high[p][v] = var_col[p][v][floor(0.95 * len(var_col[p][v]))]
-        h[p][v] = (df[p]
-                   .Filter(f"{v} > {var_low[p][v]} && {v} < {var_high[p][v]}")
-                   .Histo1D((v, f"{p};{title[v]}", 200, var_low[p][v], var_high[p][v]), v)
-                   )
-
-# after both runs do fits and make plots
+        if v in cached[p]:
+            var_low[p][v], var_high[p][v] = cached[p][v]["window"]
+            h[p][v] = histogram_from_counts(cached[p][v]["counts"], var_low[p][v], var_high[p][v], v, f"{p};{title[v]}")
+        else:
+            try:
+                var_low[p][v], var_high[p][v] = quantile_window(h_sketch[p][v].GetValue(), *quantile_range)
+                h[p][v] = trimmed_histogram(h_sketch[p][v].GetValue(), var_low[p][v], var_high[p][v], nbins, v, f"{p};{title[v]}")
+            except ValueError as error:
+                # not fitted, rather than fitting a histogram that does not resolve the distribution
+                print(f"/!\\ Warning: {p} {v} not fitted: {error}")
+                h[p][v] = None
+
+# after the run do fits (or restore them from the cache) and make plots
+summary_rows = []
 mean = {}
 mean_err = {}
 sigma = {}
@@ -105,15 +200,56 @@ for p in processList:
     c = ROOT.TCanvas()
     c.Print(f"{fname}[")
     for v in varList:
-        f = ROOT.TF1(f"f_{p}_{v}", "gaus", var_low[p][v], var_high[p][v])
-        h[p][v].Fit(f, "RQ")
+        particle, theta, momentum = processPoint[p]
+        if h[p][v] is None:
+            mean[p][v] = mean_err[p][v] = sigma[p][v] = sigma_err[p][v] = float("nan")
+            summary_rows.append(summary_row(DetectorModel, ResolutionConfig, particle, theta, momentum, v,
+                                            transverse_momentum=float(momentum) * math.sin(math.radians(float(theta))),
+                                            mean=mean[p][v], mean_err=mean_err[p][v],
+                                            sigma=sigma[p][v], sigma_err=sigma_err[p][v], n=0))
+            continue
+        f = ROOT.TF1(f"f_{p}_{v}", fit_function, var_low[p][v], var_high[p][v])
+        if v in cached[p]:
+            for i, (value, error) in enumerate(zip(cached[p][v]["parameters"], cached[p][v]["errors"])):
+                f.SetParameter(i, value)
+                f.SetParError(i, error)
+            f.SetChisquare(cached[p][v]["chi2"])
+            f.SetNDF(cached[p][v]["ndf"])
+            ROOT.SetOwnership(f, False)
+            h[p][v].GetListOfFunctions().Add(f)
+        else:
+            h[p][v].Fit(f, fit_option)
+            if cache is not None:
+                cache.put(cache_key[p][v], p, v, {
+                    "window": [var_low[p][v], var_high[p][v]],
+                    "counts": bin_contents(h[p][v]).tolist(),
+                    "parameters": [f.GetParameter(i) for i in range(f.GetNpar())],
+                    "errors": [f.GetParError(i) for i in range(f.GetNpar())],
+                    "chi2": f.GetChisquare(),
+                    "ndf": f.GetNDF(),
+                })
         mean[p][v] = f.GetParameter(1)
         mean_err[p][v] = f.GetParError(1)
         sigma[p][v] = f.GetParameter(2)
         sigma_err[p][v] = f.GetParError(2)
+        summary_rows.append(summary_row(DetectorModel, ResolutionConfig, particle, theta, momentum, v,
+                                        transverse_momentum=float(momentum) * math.sin(math.radians(float(theta))),
+                                        mean=mean[p][v], mean_err=mean_err[p][v],
+                                        sigma=sigma[p][v], sigma_err=sigma_err[p][v],
+                                        n=h[p][v].GetEntries()))
         h[p][v].Draw()
         c.Print(fname)
     c.Print(f"{fname}]")
+if cache is not None:
+    cache.close()
+
+# write the summary table, the combined plots are made from its rows
+if write_table:
+    write_summary(summary_rows, args.summary or f"{outputDir}/summary.parquet")
+summary = index_summary(summary_rows)
+
+def result(particle, theta, momentum, v):
+    return summary[(DetectorModel, ResolutionConfig, particle, float(theta), float(momentum), v)]
 
 # combined plots
 #--------------------------------
@@ -162,9 +298,9 @@ for v in varList:
     color_index = 0  # Index for colors list
 
     for t in stackThetaList:
-        y = ROOT.std.vector["double"]((sigma[pname("mu", t, p)][v]) for p in MomentumList)
+        y = ROOT.std.vector["double"]((result("mu", t, p, v)["sigma"]) for p in MomentumList)
         x = ROOT.std.vector["double"](float(p) for p in MomentumList)
-        err_y = ROOT.std.vector["double"]((sigma_err[pname("mu", t, p)][v]) for p in MomentumList)
+        err_y = ROOT.std.vector["double"]((result("mu", t, p, v)["sigma_err"]) for p in MomentumList)
         err_x = ROOT.std.vector["double"]([0]*len(MomentumList))
         p_dist_t[v][t] = ROOT.TGraphErrors(len(MomentumList), x.data(), y.data(), err_x.data(), err_y.data())
         p_dist_t[v][t].SetMarkerStyle(marker_styles[marker_style_index])
@@ -236,9 +372,9 @@ for v in varList:
     marker_style_index = 0  # Index for marker_styles list
     color_index = 0  # Index for colors list
     for p in stackMomentumList:
-        y = ROOT.std.vector["double"]((sigma[pname("mu", t, p)][v]) for t in ThetaList)
+        y = ROOT.std.vector["double"]((result("mu", t, p, v)["sigma"]) for t in ThetaList)
         x = ROOT.std.vector["double"](float(t) for t in ThetaList)
-        err_y = ROOT.std.vector["double"]((sigma_err[pname("mu", t, p)][v]) for t in ThetaList)
+        err_y = ROOT.std.vector["double"]((result("mu", t, p, v)["sigma_err"]) for t in ThetaList)
         err_x = ROOT.std.vector["double"]([0]*len(ThetaList))
         t_dist_p[v][p] = ROOT.TGraphErrors(len(ThetaList), x.data(), y.data(), err_x.data(), err_y.data())
         t_dist_p[v][p].SetMarkerStyle(marker_styles[marker_style_index])
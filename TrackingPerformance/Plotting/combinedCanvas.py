@@ -1,5 +1,12 @@
+import os
+import sys
+import argparse
+import numpy as np
 import ROOT
 
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from summary_table import read_summary, select
+
 def set_styles_and_colors_momentum(input_file_idx):
     marker_styles_full = [ROOT.kFullTriangleUp, ROOT.kFullSquare, ROOT.kFullDiamond, ROOT.kFullCross, ROOT.kFullCircle]
     marker_styles_open = [ROOT.kOpenTriangleUp, ROOT.kOpenSquare, ROOT.kOpenDiamond, ROOT.kOpenCross, ROOT.kOpenCircle]
@@ -53,10 +60,106 @@ def set_y_axis_title(canvas_name):
     }
     return y_axis_titles.get(canvas_name, "Some Default Y-axis Title")
 
+canvas_names = [
+    "Canvas_delta_d0", "Canvas_delta_z0", "Canvas_delta_phi0", "Canvas_delta_omega",
+    "Canvas_delta_tanLambda", "Canvas_delta_phi", "Canvas_delta_theta",
+    "Canvas_sdelta_pt", "Canvas_sdelta_p"
+]
+
+# Scale of each variable on the plots, as in analysis_final.py
+unit_scale = {
+    "delta_d0": 1e3,
+    "delta_z0": 1e3,
+    "delta_phi0": 1.0,
+    "delta_omega": 1.0,
+    "delta_tanLambda": 1.0,
+    "delta_phi": 1e3,
+    "delta_theta": 1e3,
+    "sdelta_pt": 1.0,
+    "sdelta_p": 1.0,
+}
+
+# Points drawn as one graph each: theta values on the momentum plots, momenta on the theta plots
+stackThetaList = [10, 30, 50, 70, 89]
+stackMomentumList = [1, 10, 100]
+
+def graph_array(buffer, n):
+    # Copy of a TGraph point array as a NumPy array
+    if n == 0:
+        return np.zeros(0)
+    buffer.reshape((n,))
+    return np.frombuffer(buffer, dtype=np.float64, count=n).copy()
+
+def load_graph_index(input_file):
+    # Open a file written by analysis_final.py once and index the graphs of all its canvases:
+    # {canvas name: [(x, y, ex, ey, legend label)]}
+    index = {}
+    input_root_file = ROOT.TFile(input_file)
+    for canvas_name in canvas_names:
+        graphs = []
+        input_canvas = input_root_file.Get(canvas_name)
+        if input_canvas and input_canvas.InheritsFrom("TCanvas"):
+            input_legend = None
+            multigraph = None
+            for prim in input_canvas.GetListOfPrimitives():
+                if input_legend is None and prim.InheritsFrom("TLegend"):
+                    input_legend = prim
+                if multigraph is None and prim.InheritsFrom("TMultiGraph"):
+                    multigraph = prim
+            if multigraph:
+                for j, graph in enumerate(multigraph.GetListOfGraphs()):
+                    n = graph.GetN()
+                    label = input_legend.GetListOfPrimitives().At(j).GetLabel() if input_legend else ""
+                    graphs.append((graph_array(graph.GetX(), n), graph_array(graph.GetY(), n),
+                                   graph_array(graph.GetEX(), n), graph_array(graph.GetEY(), n), label))
+        index[canvas_name] = graphs
+    input_root_file.Close()
+    return index
+
+def canvas_graphs_from_summary(table, canvas_name, axis):
+    # (x, y, ex, ey, legend label) of each graph of a canvas, built from the rows of the summary table
+    variable = canvas_name[len("Canvas_"):]
+    rows = select(table, variable=variable)
+    graphs = []
+    for value in (stackThetaList if axis == "momentum" else stackMomentumList):
+        if axis == "momentum":
+            points = select(rows, theta=float(value))
+            label = f"#theta = {value} deg"
+        else:
+            points = select(rows, momentum=float(value))
+            label = f"p = {value}GeV"
+        if points.num_rows == 0:
+            continue
+        points = points.sort_by(axis)
+        x = np.asarray(points[axis].to_numpy(), dtype=np.float64)
+        y = np.asarray(points["sigma"].to_numpy(), dtype=np.float64) * unit_scale[variable]
+        ey = np.asarray(points["sigma_err"].to_numpy(), dtype=np.float64) * unit_scale[variable]
+        graphs.append((x, y, np.zeros(len(x)), ey, label))
+    return graphs
+
 def combine_canvases(input_files, output_file, marker_styles_func, log_x=False, log_y=False):
-    ROOT.gROOT.SetBatch(True)
     custom_texts = [", VXD res 1 #mum", ", VXD res 2 #mum", ", VXD res 3 #mum", ", VXD res 4 #mum", ", VXD res 5 #mum"]
     #custom_texts = [", VDX res 3 #mum", ", VDX res 5 #mum", ", VDX res 7 #mum"]
+    # each input file is read once, all the canvases are served from its index
+    sources = [load_graph_index(input_file).get for input_file in input_files]
+    draw_combined(sources, custom_texts, output_file, marker_styles_func, log_x, log_y)
+
+def combine_summary(summary_files, output_file, axis, particle="mu", configurations=None, log_x=False, log_y=False):
+    # Same plots as combine_canvases, one input per (detector, resolution) configuration of the summary tables
+    table = select(read_summary(summary_files), particle=particle)
+    if configurations is None:
+        configurations = sorted(set(zip(table["detector"].to_pylist(), table["resolution"].to_pylist())))
+    sources = []
+    texts = []
+    for detector, resolution in configurations:
+        rows = select(table, detector=detector, resolution=resolution)
+        sources.append(lambda canvas_name, rows=rows: canvas_graphs_from_summary(rows, canvas_name, axis))
+        texts.append(f", {resolution}")
+    marker_styles_func = set_styles_and_colors_momentum if axis == "momentum" else set_styles_and_colors_theta
+    draw_combined(sources, texts, output_file, marker_styles_func, log_x, log_y)
+
+def draw_combined(sources, custom_texts, output_file, marker_styles_func, log_x=False, log_y=False):
+    ROOT.gROOT.SetBatch(True)
 
     #output_root_file = ROOT.TFile(output_file, "recreate")
     output_root_file = ROOT.TFile(output_file + ".root", "recreate")
@@ -64,11 +167,7 @@ def combine_canvases(input_files, output_file, marker_styles_func, log_x=False,
     output_pdf_canvas = ROOT.TCanvas("combined_canvas", "Combined Canvas", 800, 800)
     output_pdf_canvas.Print(output_pdf_file + "[")
 
-    for canvas_name in [
-        "Canvas_delta_d0", "Canvas_delta_z0", "Canvas_delta_phi0", "Canvas_delta_omega",
-        "Canvas_delta_tanLambda", "Canvas_delta_phi", "Canvas_delta_theta",
-        "Canvas_sdelta_pt", "Canvas_sdelta_p"
-    ]:
+    for canvas_name in canvas_names:
         superposed_multigraph = ROOT.TMultiGraph()
         output_legend = ROOT.TLegend(0.90, 0.45, 1.20, 0.90)
         output_legend.SetTextFont(62)
@@ -76,57 +175,20 @@ def combine_canvases(input_files, output_file, marker_styles_func, log_x=False,
         output_legend.SetBorderSize(0)
         output_legend.SetHeader("Single #mu^{-}")
 
-        for input_file_idx, input_file in enumerate(input_files):
-            input_root_file = ROOT.TFile(input_file)
-            input_canvas = input_root_file.Get(canvas_name)
-            
-            if input_canvas and input_canvas.InheritsFrom("TCanvas"):
-                primitives = input_canvas.GetListOfPrimitives()
-                for i in range(primitives.GetSize()):
-                    obj = primitives.At(i)
-                    if obj.InheritsFrom("TMultiGraph"):
-                        multigraph = obj.Clone()
-                        graph_count = multigraph.GetListOfGraphs().GetSize()
-                        new_graphs = []
-
-                        marker_styles, marker_colors = marker_styles_func(input_file_idx)
-                        for i, graph in enumerate(multigraph.GetListOfGraphs()):
-                            new_graph = ROOT.TGraphErrors(graph.GetN(), graph.GetX(), graph.GetY(), graph.GetEX(), graph.GetEY())
-                            new_marker_style = marker_styles[i % len(marker_styles)]
-                            new_marker_color = marker_colors[i % len(marker_colors)]
-                            new_graph.SetMarkerStyle(new_marker_style)
-                            new_graph.SetMarkerColor(new_marker_color)
-                            new_graphs.append(new_graph)
-
-                        new_multigraph = ROOT.TMultiGraph()
-                        for new_graph in new_graphs:
-                            new_multigraph.Add(new_graph)
-
-                        superposed_multigraph.Add(new_multigraph.Clone())
-                        break
-
-                legend = None
-                for prim in input_canvas.GetListOfPrimitives():
-                    if prim.InheritsFrom("TLegend"):
-                        legend = prim
-                        break
-
-                if legend:
-                    input_legend = None
-                    for prim in input_canvas.GetListOfPrimitives():
-                        if prim.InheritsFrom("TLegend"):
-                            input_legend = prim
-                            break
-                    
-                    if input_legend:
-                        for marker_idx in range(len(marker_styles)):
-                            new_entry = input_legend.GetListOfPrimitives().At(marker_idx).Clone()
-                            new_entry.SetTextFont(43)
-                            new_entry.SetFillStyle(0)
-                            new_entry.SetMarkerStyle(marker_styles[marker_idx])
-                            new_entry.SetMarkerColor(marker_colors[marker_idx])
-                            legend_label = f"{new_entry.GetLabel()}{custom_texts[input_file_idx]}\n"
-                            output_legend.AddEntry(new_entry, legend_label, "P")
+        for input_idx, source in enumerate(sources):
+            graphs = source(canvas_name) or []
+            if not graphs:
+                continue
+            marker_styles, marker_colors = marker_styles_func(input_idx)
+            for i, (x, y, ex, ey, label) in enumerate(graphs):
+                graph = ROOT.TGraphErrors(len(x), x, y, ex, ey)
+                ROOT.SetOwnership(graph, False)  # owned by the multigraph, also used by the legend
+                graph.SetMarkerStyle(marker_styles[i % len(marker_styles)])
+                graph.SetMarkerColor(marker_colors[i % len(marker_colors)])
+                superposed_multigraph.Add(graph)
+                if i < len(marker_styles):
+                    entry = output_legend.AddEntry(graph, f"{label}{custom_texts[input_idx]}\n", "P")
+                    entry.SetTextFont(43)
 
         output_canvas = ROOT.TCanvas(canvas_name, "Superposed Canvas", 800, 800)
         
@@ -146,9 +208,9 @@ def combine_canvases(input_files, output_file, marker_styles_func, log_x=False,
         superposed_multigraph.Draw("APE" if output_canvas.GetListOfPrimitives().GetSize() == 0 else "APEsame")
         
         # Set the X-axis title
-        if marker_styles_func == momentum_styles:
+        if marker_styles_func == set_styles_and_colors_momentum:
             superposed_multigraph.GetXaxis().SetTitle("momentum [GeV]")
-        elif marker_styles_func == theta_styles:
+        elif marker_styles_func == set_styles_and_colors_theta:
             superposed_multigraph.GetXaxis().SetTitle("#theta [deg]")
         superposed_multigraph.GetXaxis().SetTitleSize(0.05)
         
@@ -193,6 +255,16 @@ def combine_canvases(input_files, output_file, marker_styles_func, log_x=False,
     output_root_file.Close()
 
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Superpose the resolution plots of several configurations")
+    parser.add_argument("-Summary", help="Summary tables written by analysis_final.py, used instead of the canvases", nargs="+", default=None)
+    parser.add_argument("-Particle", help="Particle of the summary rows", default="mu")
+    args = parser.parse_args()
+
+    if args.Summary:
+        combine_summary(args.Summary, "combined_canvas_momentum", "momentum", args.Particle, log_x=True, log_y=True)
+        combine_summary(args.Summary, "combined_canvas_theta", "theta", args.Particle, log_x=False, log_y=True)
+        sys.exit(0)
+
     momentum_styles = set_styles_and_colors_momentum
     theta_styles = set_styles_and_colors_theta
 
@@ -0,0 +1,121 @@
+#!/usr/bin/env python3
+import os
+import json
+import time
+import sqlite3
+import hashlib
+import fnmatch
+import argparse
+
+# Persistent cache of the per-point fit results of analysis_final.py.
+# Entries are keyed on the identity of the input file (path, size, mtime) and on
+# everything that changes the fit: variable, quantile window, binning and fit
+# function. The cache lives in a single SQLite file and is bounded in size, the
+# least recently used entries being evicted first.
+
+# Bump when the content of the cached payload changes
+cache_version = 2
+
+default_max_bytes = 512 * 1024 * 1024
+
+
+def file_identity(path):
+    """Cheap identity of an input file: absolute path, size and modification time."""
+    stat = os.stat(path)
+    return [os.path.abspath(path), stat.st_size, stat.st_mtime_ns]
+
+
+def fit_key(identity, variable, window, sketch_accuracy, nbins, fit_function, fit_option):
+    """Key of one fit, as the hash of all its inputs."""
+    description = json.dumps([cache_version, identity, variable, list(window), sketch_accuracy, nbins, fit_function, fit_option])
+    return hashlib.sha256(description.encode()).hexdigest()
+
+
+class FitCache:
+
+    def __init__(self, path, max_bytes=default_max_bytes):
+        self.path = path
+        self.max_bytes = max_bytes
+        directory = os.path.dirname(os.path.abspath(path))
+        os.makedirs(directory, exist_ok=True)
+        self.db = sqlite3.connect(path)
+        self.db.execute("""CREATE TABLE IF NOT EXISTS fits (
+                               key TEXT PRIMARY KEY,
+                               process TEXT,
+                               variable TEXT,
+                               payload TEXT,
+                               size INTEGER,
+                               created REAL,
+                               last_access REAL)""")
+        self.db.commit()
+
+    def get(self, key):
+        """Cached payload of a fit, or None."""
+        row = self.db.execute("SELECT payload FROM fits WHERE key = ?", (key,)).fetchone()
+        if row is None:
+            return None
+        self.db.execute("UPDATE fits SET last_access = ? WHERE key = ?", (time.time(), key))
+        self.db.commit()
+        return json.loads(row[0])
+
+    def put(self, key, process, variable, payload):
+        text = json.dumps(payload)
+        now = time.time()
+        self.db.execute("INSERT OR REPLACE INTO fits VALUES (?, ?, ?, ?, ?, ?, ?)",
+                        (key, process, variable, text, len(text), now, now))
+        self.db.commit()
+        self.evict()
+
+    def evict(self):
+        """Remove the least recently used entries until the cache fits in max_bytes."""
+        total = self.size()
+        if total <= self.max_bytes:
+            return
+        rows = self.db.execute("SELECT key, size FROM fits ORDER BY last_access ASC").fetchall()
+        for key, size in rows:
+            if total <= self.max_bytes:
+                break
+            self.db.execute("DELETE FROM fits WHERE key = ?", (key,))
+            total -= size
+        self.db.commit()
+
+    def size(self):
+        return self.db.execute("SELECT COALESCE(SUM(size), 0) FROM fits").fetchone()[0]
+
+    def entries(self, pattern="*"):
+        """(process, variable, size, last_access) of the entries whose 'process/variable' matches pattern."""
+        rows = self.db.execute("SELECT process, variable, size, last_access FROM fits ORDER BY process, variable").fetchall()
+        return [row for row in rows if fnmatch.fnmatch(f"{row[0]}/{row[1]}", pattern)]
+
+    def invalidate(self, pattern="*"):
+        """Remove the entries whose 'process/variable' matches pattern, and return how many."""
+        matching = self.entries(pattern)
+        for process, variable, _, _ in matching:
+            self.db.execute("DELETE FROM fits WHERE process = ? AND variable = ?", (process, variable))
+        self.db.commit()
+        self.db.execute("VACUUM")
+        return len(matching)
+
+    def close(self):
+        self.db.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Inspect or invalidate the fit cache of analysis_final.py")
+    parser.add_argument("cache", help="Path to the cache file")
+    parser.add_argument("command", choices=["list", "stats", "invalidate"], help="list entries, show statistics, or remove entries")
+    parser.add_argument("--match", help="Only entries whose 'process/variable' matches this glob pattern", default="*")
+    args = parser.parse_args()
+
+    if not os.path.exists(args.cache):
+        parser.error(f"cache {args.cache} does not exist")
+    cache = FitCache(args.cache)
+    if args.command == "list":
+        for process, variable, size, last_access in cache.entries(args.match):
+            print(f"{process:40s} {variable:20s} {size:8d} B  last used {time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(last_access))}")
+    elif args.command == "stats":
+        entries = cache.entries(args.match)
+        print(f"{args.cache}: {len(entries)} entries, {sum(e[2] for e in entries) / 1024:.1f} kB")
+    elif args.command == "invalidate":
+        print(f"Removed {cache.invalidate(args.match)} entries from {args.cache}")
+    cache.close()
@@ -0,0 +1,167 @@
+import numpy as np
+import ROOT
+
+# Single-pass quantile window and trimmed histogram for analysis_final.py.
+# Each variable fills a streaming quantile sketch in the event loop: a logarithmic
+# histogram of |x| (DDSketch style) whose buckets are (gamma^(k-1), gamma^k] with
+# gamma = (1 + a) / (1 - a), so that every value is known to a relative accuracy a
+# whatever its range. Its memory is bounded by the number of distinct buckets, not
+# by the number of events, and the per-thread sketches are merged exactly. The
+# quantiles and the trimmed histogram are then derived from the buckets, so the
+# input file is read only once and never sorted in Python.
+
+# Relative accuracy of the sketch
+sketch_accuracy = 1e-5
+# Largest bucket width inside the window, as a fraction of the width of a trimmed histogram bin
+max_bucket_fraction = 0.1
+
+ROOT.gInterpreter.Declare("""
+#include <cmath>
+#include <map>
+#include <vector>
+
+class QuantileSketch {
+public:
+   QuantileSketch(double accuracy = 1e-5, double minValue = 1e-30)
+      : fGamma((1 + accuracy) / (1 - accuracy)), fLogGamma(std::log(fGamma)), fMinValue(minValue) {}
+
+   void Fill(double x)
+   {
+      if (!std::isfinite(x))
+         return;
+      if (std::abs(x) <= fMinValue)
+         fZero += 1;
+      else if (x > 0)
+         fPositive[Key(x)] += 1;
+      else
+         fNegative[Key(-x)] += 1;
+   }
+
+   void Merge(const std::vector<QuantileSketch *> &others)
+   {
+      for (auto *other : others) {
+         if (other == this)
+            continue;
+         fZero += other->fZero;
+         for (auto &bucket : other->fPositive)
+            fPositive[bucket.first] += bucket.second;
+         for (auto &bucket : other->fNegative)
+            fNegative[bucket.first] += bucket.second;
+      }
+   }
+
+   void Reset()
+   {
+      fZero = 0;
+      fPositive.clear();
+      fNegative.clear();
+   }
+
+   // Buckets in increasing order of value: low edges, high edges and counts
+   std::vector<double> LowEdges() const { return Buckets(0); }
+   std::vector<double> HighEdges() const { return Buckets(1); }
+   std::vector<double> Counts() const { return Buckets(2); }
+
+private:
+   int Key(double value) const { return (int)std::ceil(std::log(value) / fLogGamma); }
+
+   std::vector<double> Buckets(int what) const
+   {
+      std::vector<double> result;
+      for (auto it = fNegative.rbegin(); it != fNegative.rend(); ++it) {
+         double edges[3] = {-std::pow(fGamma, it->first), -std::pow(fGamma, it->first - 1), it->second};
+         result.push_back(edges[what]);
+      }
+      if (fZero > 0) {
+         double edges[3] = {-fMinValue, fMinValue, fZero};
+         result.push_back(edges[what]);
+      }
+      for (auto &bucket : fPositive) {
+         double edges[3] = {std::pow(fGamma, bucket.first - 1), std::pow(fGamma, bucket.first), bucket.second};
+         result.push_back(edges[what]);
+      }
+      return result;
+   }
+
+   double fGamma;
+   double fLogGamma;
+   double fMinValue;
+   double fZero = 0;
+   std::map<int, double> fPositive;
+   std::map<int, double> fNegative;
+};
+
+ROOT::RDF::RResultPtr<QuantileSketch> BookQuantileSketch(ROOT::RDF::RNode df, const std::string &column, double accuracy)
+{
+   return df.Fill<double>(QuantileSketch(accuracy), {column});
+}
+""")
+
+
+def book_quantile_sketch(df, column, accuracy=sketch_accuracy):
+    """Book the quantile sketch of column, filled in the event loop of df."""
+    df = df.Define(f"{column}_sketch", f"static_cast<double>({column})")
+    return ROOT.BookQuantileSketch(ROOT.RDF.AsRNode(df), f"{column}_sketch", accuracy)
+
+
+def sketch_buckets(sketch):
+    """(low edges, high edges, counts) of the buckets of a sketch, in increasing order of value."""
+    return (np.array(sketch.LowEdges(), dtype=np.float64), np.array(sketch.HighEdges(), dtype=np.float64),
+            np.array(sketch.Counts(), dtype=np.float64))
+
+
+def bin_contents(hist):
+    """Contents of the in-range bins of a TH1D as a NumPy array."""
+    nbins = hist.GetNbinsX()
+    array = hist.GetArray()
+    array.reshape((nbins + 2,))
+    return np.frombuffer(array, dtype=np.float64, count=nbins + 2)[1:-1].copy()
+
+
+def quantile_window(sketch, low=0.05, high=0.95):
+    """Values of the low and high quantiles, interpolated inside the buckets of the sketch."""
+    low_edges, high_edges, counts = sketch_buckets(sketch)
+    if counts.sum() == 0:
+        raise ValueError("empty quantile sketch")
+    cumulative = np.cumsum(counts)
+    window = []
+    for probability in (low, high):
+        target = probability * cumulative[-1]
+        i = min(int(np.searchsorted(cumulative, target)), len(counts) - 1)
+        fraction = (target - (cumulative[i] - counts[i])) / counts[i]
+        window.append(float(low_edges[i] + fraction * (high_edges[i] - low_edges[i])))
+    return window[0], window[1]
+
+
+def trimmed_histogram(sketch, low, high, nbins, name, title):
+    """TH1D with nbins bins in (low, high) filled from the buckets of the sketch.
+
+    The content of a bucket is spread uniformly over its width, so a bucket
+    overlapping two bins is shared between them. Raises ValueError if a bucket inside
+    the window is wider than max_bucket_fraction of a bin, as the histogram would then
+    not resolve the distribution.
+    """
+    low_edges, high_edges, counts = sketch_buckets(sketch)
+    inside = (high_edges > low) & (low_edges < high)
+    low_edges, high_edges, counts = low_edges[inside], high_edges[inside], counts[inside]
+    bin_width = (high - low) / nbins
+    if len(counts) and np.max(high_edges - low_edges) > max_bucket_fraction * bin_width:
+        raise ValueError(f"sketch buckets up to {np.max(high_edges - low_edges):.3g} wide for bins of {bin_width:.3g}")
+    # fraction of each bucket below each bin edge
+    edges = np.linspace(low, high, nbins + 1)
+    below = np.clip((edges[:, None] - low_edges[None, :]) / (high_edges - low_edges)[None, :], 0, 1)
+    bin_counts = np.diff(below @ counts)
+    return histogram_from_counts(bin_counts, low, high, name, title)
+
+
+def histogram_from_counts(counts, low, high, name, title):
+    """TH1D in (low, high) with the given bin counts and Poisson errors."""
+    counts = np.asarray(counts, dtype=np.float64)
+    hist = ROOT.TH1D(name, title, len(counts), low, high)
+    hist.SetDirectory(ROOT.nullptr)
+    content = np.zeros(len(counts) + 2, dtype=np.float64)
+    content[1:-1] = counts
+    hist.SetContent(content)
+    hist.SetError(np.sqrt(content))
+    hist.SetEntries(float(counts.sum()))
+    return hist
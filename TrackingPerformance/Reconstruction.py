@@ -1,7 +1,13 @@
 #!/usr/bin/env python
 
 import os
+import argparse
 import subprocess
+from manifest import Manifest
+
+parser = argparse.ArgumentParser(description="Reconstruct the simulated particle-gun points with k4run")
+parser.add_argument("-Resume", help="Only run the points whose output is missing or incomplete in the manifest", action="store_true")
+args = parser.parse_args()
 
 os.chdir("CLICPerformance/fcceeConfig/")
 
@@ -12,6 +18,9 @@ Nevts = "1000"
 script_filename = os.path.basename(__file__)
 print(f"-----> running {script_filename} with Detector Model = {DetectorModel}, Nevts = {Nevts}")
 
+# Outputs produced so far, with their number of events and parameters
+manifest = Manifest(f"/eos/user/g/gasadows/Output/TrackingPerformance/{DetectorModel}/REC/manifest.jsonl")
+
 # Define lists
 ParticleList = ["mu", "e", "pi"]
 MomentumList = ["1", "2", "5", "10", "20", "50", "100", "200"]
@@ -25,6 +34,11 @@ for Particle in ParticleList:
             ThetaList = ["10", "30", "50", "70", "89"]
 
         for theta in ThetaList:
+            output_file = f"/eos/user/g/gasadows/Output/TrackingPerformance/{DetectorModel}/REC/REC_{Particle}_{theta}deg_{momentum}GeV_1000evt_edm4hep.root"
+            params = {"detector": DetectorModel, "particle": Particle, "theta": theta, "momentum": momentum, "nevts": Nevts, "steering": "fccRec_e4h_input.py"}
+            if args.Resume and manifest.is_complete(output_file, params, Nevts):
+                continue
+
             print(f"running k4run with Particle {Particle}-, Theta = {theta} deg, Momentum = {momentum} Gev")
 
             input_file = f"/eos/user/g/gasadows/Output/TrackingPerformance/{DetectorModel}/SIM/SIM_{Particle}_{theta}deg_{momentum}GeV_1000evt_edm4hep.root"
@@ -39,11 +53,15 @@ for Particle in ParticleList:
                 "--EventDataSvc.input",
                 input_file,
                 "--filename.PodioOutput",
-                f"/eos/user/g/gasadows/Output/TrackingPerformance/{DetectorModel}/REC/REC_{Particle}_{theta}deg_{momentum}GeV_1000evt_edm4hep.root",
+                output_file,
                 "-n", f"{Nevts}"
             ]
 
-            subprocess.run(command, stdout=subprocess.DEVNULL)
+            result = subprocess.run(command, stdout=subprocess.DEVNULL)
+            if result.returncode == 0 and os.path.exists(output_file):
+                manifest.record(output_file, params)
+            else:
+                print(f"/!\ Warning: reconstruction of {input_file} failed.")
 
 import os
 
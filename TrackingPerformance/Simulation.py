@@ -1,7 +1,13 @@
 #!/usr/bin/env python
 
 import os
+import argparse
 import subprocess
+from manifest import Manifest
+
+parser = argparse.ArgumentParser(description="Simulate the particle-gun points with ddsim")
+parser.add_argument("-Resume", help="Only run the points whose output is missing or incomplete in the manifest", action="store_true")
+args = parser.parse_args()
 
 DetectorModel = "FCCee_o1_v04"
 Nevts = "1000"
@@ -13,6 +19,9 @@ print(f"-----> running {script_filename} with Detector Model = {DetectorModel},
 # Get the value of $LCGEO
 LCGEO = os.environ.get("LCGEO")
 
+# Outputs produced so far, with their number of events and parameters
+manifest = Manifest(f"/eos/user/g/gasadows/Output/TrackingPerformance/{DetectorModel}/SIM/manifest.jsonl")
+
 # Define lists
 ParticleList = ["mu", "e", "pi"]
 MomentumList = ["1", "2", "5", "10", "20", "50", "100", "200"]
@@ -26,13 +35,18 @@ for Particle in ParticleList:
             ThetaList = ["10", "30", "50", "70", "89"]
 
         for theta in ThetaList:
+            output_file = f"/eos/user/g/gasadows/Output/TrackingPerformance/{DetectorModel}/SIM/SIM_{Particle}_{theta}deg_{momentum}GeV_1000evt_edm4hep.root"
+            params = {"detector": DetectorModel, "particle": Particle, "theta": theta, "momentum": momentum, "nevts": Nevts, "seed": "0123456789"}
+            if args.Resume and manifest.is_complete(output_file, params, Nevts):
+                continue
+
             print(f"running ddsim with Particle {Particle}-, Theta = {theta} deg, Momentum = {momentum} Gev")
 
             command = [
                 "ddsim",
                 "--compactFile",
                 f"{DetectorModel}/{DetectorModel}.xml",
-                "--outputFile", f"/eos/user/g/gasadows/Output/TrackingPerformance/{DetectorModel}/SIM/SIM_{Particle}_{theta}deg_{momentum}GeV_1000evt_edm4hep.root",
+                "--outputFile", output_file,
                 "--steeringFile", "CLICPerformance/fcceeConfig/fcc_steer.py",
                 "--random.seed", "0123456789",
                 "--enableGun",
@@ -45,4 +59,6 @@ for Particle in ParticleList:
                 "--numberOfEvents", f"{Nevts}"
             ]
 
-            subprocess.run(command, stdout=subprocess.DEVNULL)
+            result = subprocess.run(command, stdout=subprocess.DEVNULL)
+            if result.returncode == 0 and os.path.exists(output_file):
+                manifest.record(output_file, params)
@@ -1,9 +1,12 @@
 #!/usr/bin/env python
 
 import os
-import subprocess
-from multiprocessing import Pool
+import sys
 import argparse
+from manifest import Manifest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "Condor"))
+from executors import Task, LocalExecutor
 
 # Set Detector Model and numder of events
 #Nevts = "1000"
@@ -12,6 +15,9 @@ import argparse
 parser = argparse.ArgumentParser(description="Script for plotting Detector Performances")
 parser.add_argument("-DetectorModel", help="Detector model: FCCee_o1_v04 \n FCCee_o2_v02 \n FCCee_o1_v04_lcio", required=True)
 parser.add_argument("-Nevts", help="Number of events", required=True)
+parser.add_argument("-Resume", help="Only simulate the points whose output is missing or incomplete in the manifest", action="store_true")
+parser.add_argument("-j", help="Maximum number of parallel ddsim processes (default: one per CPU, fewer if memory is short)", type=int, default=None)
+parser.add_argument("-Retries", help="Number of retries of a failed point", type=int, default=1)
 args = parser.parse_args()
 
 # Get the name of the current Python script
@@ -29,20 +35,26 @@ if not os.path.exists(output_directory_1):
 if not os.path.exists(output_directory_2):
     os.makedirs(output_directory_2)
 
+# Outputs produced so far, with their number of events and parameters
+manifest = Manifest(os.path.join(output_directory_2, "manifest.jsonl"))
+
 # Define lists
 ParticleList = ["mu", "e", "pi"]
 MomentumList = ["1", "2", "5", "10", "20", "50", "100", "200"]
 
-# Create a function to process each combination of parameters
-def process_combination(params):
-    Particle, momentum, theta = params
-    print(f"running ddsim with Particle {Particle}-, Theta = {theta} deg, Momentum = {momentum} Gev")
+def output_path(Particle, momentum, theta):
+    return f"/eos/user/g/gasadows/Output/TrackingPerformance/{args.DetectorModel}/SIM/SIM_{Particle}_{theta}deg_{momentum}GeV_{args.Nevts}evts.slcio"
+
+def output_params(Particle, momentum, theta):
+    return {"detector": args.DetectorModel, "particle": Particle, "theta": theta, "momentum": momentum, "nevts": args.Nevts, "seed": "0123456789"}
 
-    command = [
+# Create a function to build the ddsim command of each combination of parameters
+def ddsim_command(Particle, momentum, theta):
+    return [
         "ddsim",
         "--compactFile",
         f"{LCGEO}/FCCee/compact/FCCee_o1_v04/FCCee_o1_v04.xml",
-        "--outputFile", f"/eos/user/g/gasadows/Output/TrackingPerformance/{args.DetectorModel}/SIM/SIM_{Particle}_{theta}deg_{momentum}GeV_{args.Nevts}evts.slcio",
+        "--outputFile", output_path(Particle, momentum, theta),
         "--steeringFile", "CLICPerformance/fcceeConfig/fcc_steer.py",
         "--random.seed", "0123456789",
         "--enableGun",
@@ -55,12 +67,6 @@ def process_combination(params):
         "--numberOfEvents", f"{args.Nevts}"
     ]
 
-    subprocess.run(command, stdout=subprocess.DEVNULL)
-
-    # Print completion message
-    output_file = f"/eos/user/g/gasadows/Output/TrackingPerformance/{args.DetectorModel}/SIM/SIM_{Particle}_{theta}deg_{momentum}GeV_{args.Nevts}evts.slcio"
-    print(f"File {output_file}  -----> finished processing")
-
 # Create a list of combinations of parameters
 combinations = []
 for Particle in ParticleList:
@@ -73,12 +79,20 @@ for Particle in ParticleList:
         for theta in ThetaList:
             combinations.append((Particle, momentum, theta))
 
-# Create a pool of worker processes
-pool = Pool()
+# Keep only the points without a complete output
+if args.Resume:
+    combinations = [c for c in combinations if not manifest.is_complete(output_path(*c), output_params(*c), args.Nevts)]
+    print(f"-----> {len(combinations)} points to simulate")
 
-# Process combinations in parallel
-pool.map(process_combination, combinations)
+# Process combinations in parallel from the current directory, with the ddsim logs in SimLogs
+tasks = {f"SIM_{Particle}_{theta}deg_{momentum}GeV": (Particle, momentum, theta) for Particle, momentum, theta in combinations}
+executor = LocalExecutor(n_processes=args.j, retries=args.Retries, scratch=False, log_directory="SimLogs")
+status = executor.run([Task(name, os.getcwd(), ddsim_command(*params)) for name, params in tasks.items()])
 
-# Close the pool and wait for the processes to finish
-pool.close()
-pool.join()
+# Record the outputs of the successful ones
+for name, params in tasks.items():
+    if status[name] == 0 and os.path.exists(output_path(*params)):
+        manifest.record(output_path(*params), output_params(*params))
+        print(f"File {output_path(*params)}  -----> finished processing")
+    else:
+        print(f"/!\ Warning: simulation of {params} failed, see SimLogs/{name}.local.err")
@@ -0,0 +1,235 @@
+#!/usr/bin/env python
+
+import os
+import sys
+import glob
+import json
+import hashlib
+import random
+import argparse
+import itertools
+import numpy as np
+import ROOT
+from sigma_clip import sigma_clip
+from efficiency import total_efficiency
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "Condor"))
+from executors import Task, LocalExecutor
+
+# Scan of the ConformalTracking cuts. Variants of the Steps (every combination of the
+# values given with -Vary, plus the nominal Steps) reconstruct the same cached SIM
+# samples in parallel with processor profiling. For each variant, the time per event of
+# the tracking processors comes from the profiles, the efficiency and the
+# sigma(DeltapT/pT^2) of the gun particle from the REC files. The variants that no
+# other variant beats on all three (time, efficiency, resolution) form the Pareto front.
+
+condor_directory = os.path.join(os.path.dirname(os.path.abspath(__file__)), "Condor")
+repository_directory = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+parser = argparse.ArgumentParser(description="Pareto scan of the ConformalTracking Steps: time per event against efficiency and resolution")
+parser.add_argument("-Samples", help="Cached SIM files or glob patterns (LCIO)", nargs="+", required=True)
+parser.add_argument("-Vary", help="Values of a step parameter, e.g. Tracker.MaxCellAngle=0.05,0.1,0.2 ('*' for all the steps)", nargs="+", required=True)
+parser.add_argument("-Nevts", help="Number of events per sample", default="1000")
+parser.add_argument("-SteeringFile", help="Steering file", default=os.path.join(repository_directory, "fccRec_lcio_input_trackers.py"))
+parser.add_argument("-OutputDirectory", help="One directory per variant, and the results", default="ConformalScan")
+parser.add_argument("-DetectorModel", help="Detector model", default=None)
+parser.add_argument("-VXDRes", help="VXD resolutions U V", nargs=2, default=None)
+parser.add_argument("-ITRes", help="IT resolutions U V", nargs=2, default=None)
+parser.add_argument("-OTRes", help="OT resolutions U V", nargs=2, default=None)
+parser.add_argument("-MaxVariants", help="Random subset of the combinations (the nominal Steps are always run)", type=int, default=None)
+parser.add_argument("-Seed", help="Seed of the random subset", type=int, default=0)
+parser.add_argument("-TimedProcessors", help="Processors whose time is the cost of a variant", nargs="+", default=["MyConformalTracking"])
+parser.add_argument("-Skip", help="First events of each job left out of the time (initialisation)", type=int, default=1)
+parser.add_argument("-BField", help="Magnetic field in T, to get pT from omega", type=float, default=2.0)
+parser.add_argument("-j", help="Number of parallel reconstructions", type=int, default=None)
+args = parser.parse_args()
+
+# Selection of CLDperfPlot_track.py: threshold and number of passes of the sigma clipping
+clip_settings = (3, 3)
+
+# Track state at the IP of the gun particle, as in Plotting/analysis_stage1.py
+ROOT.gROOT.SetBatch(True)
+ROOT.gInterpreter.Declare("""
+ROOT::VecOps::RVec<int> MCTruthTrackIndex(ROOT::VecOps::RVec<int> trackIndex,
+                                          ROOT::VecOps::RVec<int> mcIndex,
+                                          ROOT::VecOps::RVec<edm4hep::MCParticleData> mc)
+{
+    ROOT::VecOps::RVec<int> res;
+    res.resize(mc.size(), -1);
+
+    for (size_t i = 0; i < trackIndex.size(); i++) {
+        res[mcIndex[i]] = trackIndex[i];
+    }
+    return res;
+}
+""")
+
+
+def parse_vary(items):
+    """[((step, parameter), [values])] from the -Vary arguments."""
+    vary = []
+    for item in items:
+        name, values = item.split("=", 1)
+        step, parameter = name.split(".", 1)
+        vary.append(((step, parameter), values.split(",")))
+    return vary
+
+
+def variant_name(overrides):
+    """Name of the directory of a variant, a hash of its overrides, so that a directory always holds the same Steps."""
+    if not overrides:
+        return "nominal"
+    return "variant_" + hashlib.sha256(json.dumps(overrides, sort_keys=True).encode()).hexdigest()[:10]
+
+
+def make_variants(vary, max_variants=None, seed=0):
+    """[(name, {step: {parameter: value}})], the nominal Steps first."""
+    combinations = list(itertools.product(*[values for _, values in vary]))
+    if max_variants is not None and len(combinations) > max_variants:
+        combinations = random.Random(seed).sample(combinations, max_variants)
+    variants = [("nominal", {})]
+    for combination in combinations:
+        overrides = {}
+        for ((step, parameter), _), value in zip(vary, combination):
+            overrides.setdefault(step, {})[parameter] = value
+        variants.append((variant_name(overrides), overrides))
+    return variants
+
+
+def read_gun_tracks(rec_file):
+    """(found, DeltapT/pT^2) of the gun particle in every event, the residual being 0 if it has no track."""
+    df = (ROOT.RDataFrame("events", rec_file)
+          .Alias("MCTrackAssociations0", "SiTracksMCTruthLink#0.index")
+          .Alias("MCTrackAssociations1", "SiTracksMCTruthLink#1.index")
+          .Define("GunParticle_index", "MCParticles.generatorStatus == 1")
+          .Define("GunParticle", "MCParticles[GunParticle_index][0]")
+          .Define("trackStates_IP", "SiTracks_Refitted_1[SiTracks_Refitted_1.location == 1]")
+          .Define("MC2TrackIndex", "MCTruthTrackIndex(MCTrackAssociations0, MCTrackAssociations1, MCParticles)")
+          .Define("GunParticleTrackIndex", "MC2TrackIndex[GunParticle_index][0]")
+          .Define("found", "GunParticleTrackIndex >= 0 && GunParticleTrackIndex < (int) trackStates_IP.size()")
+          .Define("true_pt", "std::hypot(GunParticle.momentum.x, GunParticle.momentum.y)")
+          .Define("reco_pt", f"found ? 0.299792458e-3 * {args.BField} / std::abs(trackStates_IP[GunParticleTrackIndex].omega) : 0.")
+          .Define("DeltaPt_Pt2", "found ? (reco_pt - true_pt) / (true_pt * true_pt) : 0."))
+    columns = df.AsNumpy(["found", "DeltaPt_Pt2"])
+    return np.asarray(columns["found"], dtype=bool), np.asarray(columns["DeltaPt_Pt2"], dtype=np.float64)
+
+
+def time_per_event(profile_file, processors, skip):
+    """Mean time in ms per event of the processors, from a record of processor_profiling.py."""
+    with open(profile_file) as f:
+        record = json.load(f)
+    times = [record["processors"][name]["times_us"][skip:] for name in processors if name in record["processors"]]
+    if not times or not times[0]:
+        return None
+    return sum(sum(values) for values in times) / len(times[0]) / 1000
+
+
+def sample_metrics(rec_file, profile_file):
+    found, residuals = read_gun_tracks(rec_file)
+    kept = sigma_clip(residuals[found], *clip_settings).data
+    return {"found": found, "resolution": float(np.std(kept)) if kept.size > 1 else None,
+            "time_ms": time_per_event(profile_file, args.TimedProcessors, args.Skip)}
+
+
+def pareto_front(results):
+    """Names of the variants not dominated by another one: lower time, higher efficiency, lower resolution."""
+    objectives = {name: (r["time_ms"], -r["efficiency"], r["resolution_ratio"]) for name, r in results.items()
+                  if None not in (r["time_ms"], r["efficiency"], r["resolution_ratio"])}
+    front = []
+    for name, a in objectives.items():
+        dominated = any(all(x <= y for x, y in zip(b, a)) and b != a for other, b in objectives.items() if other != name)
+        if not dominated:
+            front.append(name)
+    return front
+
+
+samples = []
+for pattern in args.Samples:
+    samples += sorted(glob.glob(pattern)) if glob.has_magic(pattern) else [pattern]
+variants = make_variants(parse_vary(args.Vary), args.MaxVariants, args.Seed)
+print(f"-----> {len(variants)} variants of the ConformalTracking Steps on {len(samples)} samples")
+
+
+def rec_path(variant, sample):
+    return os.path.join(os.path.abspath(args.OutputDirectory), variant,
+                        "REC_" + os.path.splitext(os.path.basename(sample))[0] + "_edm4hep.root")
+
+
+# Reconstruct every sample with every variant, except those done by a previous scan
+tasks = []
+for name, overrides in variants:
+    directory = os.path.join(os.path.abspath(args.OutputDirectory), name)
+    os.makedirs(directory, exist_ok=True)
+    steps_file = os.path.join(directory, "steps.json")
+    # the outputs of a directory are only reused for the same Steps
+    if os.path.exists(steps_file):
+        with open(steps_file) as f:
+            if json.load(f) != overrides:
+                raise RuntimeError(f"{steps_file} does not hold the Steps of {name}, remove {directory}")
+    with open(steps_file, "w") as f:
+        json.dump(overrides, f, indent=1)
+    for j, sample in enumerate(samples):
+        output = rec_path(name, sample)
+        if os.path.exists(output) and os.path.exists(os.path.splitext(output)[0] + ".profile.json"):
+            continue
+        command = ["python", "run_reco.py", "-Nevts", args.Nevts, "-InputPath", os.path.abspath(sample), "-OutputPath", output,
+                   "-SteeringFile", os.path.abspath(args.SteeringFile), "-Profile", "-ConformalStepParameters", steps_file]
+        if args.DetectorModel:
+            command += ["-DetectorModel", args.DetectorModel]
+        for layer in ["VXD", "IT", "OT"]:
+            if getattr(args, layer + "Res"):
+                command += ["-" + layer + "Res"] + getattr(args, layer + "Res")
+        # run_reco.py imports its helpers from the running directory, as in the Condor jobs
+        transfer = [os.path.join(condor_directory, "run_reco.py"), os.path.join(condor_directory, "cost_model.py"),
+                    os.path.join(repository_directory, "processor_profiling.py")]
+        tasks.append(Task(f"{name}_{j}", directory, command, transfer=transfer))
+LocalExecutor(n_processes=args.j, retries=0).run(tasks)
+
+# Metrics of every variant; the resolution is compared to the nominal one sample by sample,
+# as it depends strongly on the momentum and the angle
+metrics = {}
+for name, _ in variants:
+    metrics[name] = {}
+    for sample in samples:
+        output = rec_path(name, sample)
+        profile_file = os.path.splitext(output)[0] + ".profile.json"
+        if os.path.exists(output) and os.path.exists(profile_file):
+            metrics[name][sample] = sample_metrics(output, profile_file)
+        else:
+            print(f"/!\\ Warning: {name} has no output for {sample}")
+
+results = {}
+for name, overrides in variants:
+    done = metrics[name]
+    found = np.concatenate([m["found"] for m in done.values()]) if done else np.zeros(0, dtype=bool)
+    efficiency, err_low, err_high = total_efficiency(found) if found.size else (None, None, None)
+    times = [m["time_ms"] for m in done.values() if m["time_ms"] is not None]
+    ratios = [m["resolution"] / metrics["nominal"][sample]["resolution"] for sample, m in done.items()
+              if m["resolution"] and sample in metrics["nominal"] and metrics["nominal"][sample]["resolution"]]
+    results[name] = {
+        "steps": overrides,
+        "samples": len(done),
+        "time_ms": float(np.mean(times)) if times else None,
+        "efficiency": efficiency,
+        "efficiency_err": (err_low, err_high),
+        "resolution_ratio": float(np.mean(ratios)) if ratios else None,
+        "resolutions": {os.path.basename(sample): m["resolution"] for sample, m in done.items()},
+    }
+front = pareto_front(results)
+for name in results:
+    results[name]["pareto"] = name in front
+
+with open(os.path.join(args.OutputDirectory, "scan_results.json"), "w") as f:
+    json.dump(results, f, indent=1)
+
+
+def number(value, fmt):
+    return format(value, fmt) if value is not None else "-"
+
+
+print(f"{'variant':18s} {'ms/event':>9s} {'efficiency':>10s} {'sigma/nominal':>13s}  Steps (* Pareto front)")
+for name, r in sorted(results.items(), key=lambda item: item[1]["time_ms"] if item[1]["time_ms"] is not None else np.inf):
+    steps = ", ".join(f"{step}.{parameter}={value}" for step, values in r["steps"].items() for parameter, value in values.items())
+    print(f"{name:18s} {number(r['time_ms'], '9.2f')} {number(r['efficiency'], '10.4f')} {number(r['resolution_ratio'], '13.3f')} "
+          f"{'*' if r['pareto'] else ' '} {steps or 'nominal'}")
+print(f"Results in {os.path.join(args.OutputDirectory, 'scan_results.json')}")
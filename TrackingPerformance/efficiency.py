@@ -0,0 +1,52 @@
+import numpy as np
+from scipy.stats import beta
+
+# Mask-based efficiency computation with Clopper-Pearson errors
+
+# Confidence level of the efficiency intervals (1 sigma)
+confidence_level = 0.6827
+
+
+def clopper_pearson(k, n, cl=confidence_level):
+    """Efficiency k/n with the lower and upper Clopper-Pearson errors, for arrays of counts.
+
+    Bins with n = 0 get an efficiency of nan and zero errors.
+    """
+    k = np.asarray(k, dtype=np.float64)
+    n = np.asarray(n, dtype=np.float64)
+    alpha = 1.0 - cl
+    filled = n > 0
+    efficiency = np.divide(k, n, out=np.full(k.shape, np.nan), where=filled)
+    with np.errstate(invalid="ignore"):
+        lower = np.where(k > 0, beta.ppf(alpha / 2, k, n - k + 1), 0.0)
+        upper = np.where(k < n, beta.ppf(1 - alpha / 2, k + 1, n - k), 1.0)
+    err_low = np.where(filled, efficiency - lower, 0.0)
+    err_high = np.where(filled, upper - efficiency, 0.0)
+    return efficiency, err_low, err_high
+
+
+def binned_efficiency(values, passed, bins, range=None):
+    """Histogram all entries and the ones flagged by the boolean mask passed, and divide them.
+
+    Returns a dict with the bin edges, the counts ("n_all", "n_passed") and the
+    efficiency with its errors per bin.
+    """
+    values = np.asarray(values, dtype=np.float64)
+    passed = np.asarray(passed, dtype=bool)
+    n_all, edges = np.histogram(values, bins=bins, range=range)
+    n_passed, _ = np.histogram(values[passed], bins=edges)
+    efficiency, err_low, err_high = clopper_pearson(n_passed, n_all)
+    return {
+        "edges": edges,
+        "n_all": n_all,
+        "n_passed": n_passed,
+        "efficiency": efficiency,
+        "err_low": err_low,
+        "err_high": err_high,
+    }
+
+
+def total_efficiency(passed):
+    """Efficiency and errors of a boolean mask over all candidates."""
+    efficiency, err_low, err_high = clopper_pearson(np.count_nonzero(passed), np.size(passed))
+    return float(efficiency), float(err_low), float(err_high)
@@ -0,0 +1,110 @@
+#!/usr/bin/env python
+
+import os
+import json
+import zlib
+import shutil
+import argparse
+import subprocess
+
+# Manifest of the outputs of a campaign, one JSON line per produced file with its
+# path, size, modification time, number of events, adler32 checksum and the
+# parameters it was produced with. The last line of a path wins. With it, the
+# drivers and the Condor submitters can skip the points whose output already
+# exists and is complete, and redo only the missing or corrupt ones.
+
+
+def file_checksum(path):
+    """adler32 of the file as 8 hex digits, as reported by EOS."""
+    checksum = 1
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            checksum = zlib.adler32(block, checksum)
+    return f"{checksum:08x}"
+
+
+def count_events(path):
+    """Number of events of an EDM4hep/analysis ROOT file or of an LCIO file, or None if it cannot be read."""
+    if path.endswith(".root"):
+        try:
+            import ROOT
+        except ImportError:
+            return None
+        root_file = ROOT.TFile.Open(path)
+        if not root_file or root_file.IsZombie():
+            return None
+        tree = root_file.Get("events")
+        n = int(tree.GetEntries()) if tree else None
+        root_file.Close()
+        return n
+    if path.endswith(".slcio") and shutil.which("lcio_event_counter"):
+        result = subprocess.run(["lcio_event_counter", path], capture_output=True, text=True)
+        words = result.stdout.split()
+        if result.returncode == 0 and words and words[-1].isdigit():
+            return int(words[-1])
+    return None
+
+
+class Manifest:
+
+    def __init__(self, path):
+        self.path = path
+        self.records = {}
+        if os.path.exists(path):
+            with open(path) as manifest_file:
+                for line in manifest_file:
+                    line = line.strip()
+                    if line:
+                        record = json.loads(line)
+                        self.records[record["path"]] = record
+
+    def record(self, path, params):
+        """Measure the output file and append it to the manifest."""
+        stat = os.stat(path)
+        record = {"path": path, "size": stat.st_size, "mtime": stat.st_mtime, "events": count_events(path),
+                  "checksum": file_checksum(path), "params": params}
+        self.records[path] = record
+        os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+        with open(self.path, "a") as manifest_file:
+            manifest_file.write(json.dumps(record, sort_keys=True) + "\n")
+        return record
+
+    def is_complete(self, path, params, nevts=None, verify=False):
+        """True if the output exists, has not changed since it was recorded, was produced
+        with params and holds nevts events. An existing file that is not recorded yet
+        (e.g. written by a Condor job) is measured and recorded first. With verify the
+        checksum is recomputed too.
+        """
+        if not os.path.exists(path):
+            return False
+        stat = os.stat(path)
+        record = self.records.get(path)
+        if record is None or record["size"] != stat.st_size or record["mtime"] != stat.st_mtime:
+            record = self.record(path, params)
+        if stat.st_size == 0 or record["params"] != params:
+            return False
+        if nevts is not None and record["events"] is not None and record["events"] != int(nevts):
+            return False
+        return not verify or file_checksum(path) == record["checksum"]
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Check the outputs recorded in a manifest")
+    parser.add_argument("-Manifest", help="Manifest file", required=True)
+    parser.add_argument("-Verify", help="Recompute the checksums", action="store_true")
+    args = parser.parse_args()
+
+    manifest = Manifest(args.Manifest)
+    bad = 0
+    for path, record in sorted(manifest.records.items()):
+        if not os.path.exists(path):
+            status = "missing"
+        elif os.path.getsize(path) != record["size"]:
+            status = "size changed"
+        elif args.Verify and file_checksum(path) != record["checksum"]:
+            status = "checksum mismatch"
+        else:
+            continue
+        bad += 1
+        print(f"{status:18s} {path}")
+    print(f"{len(manifest.records)} outputs recorded, {bad} missing or corrupt")
@@ -0,0 +1,115 @@
+import numpy as np
+import ROOT
+
+# Columnar reader for the trees written by CLD_perf_getTree.py.
+# The per-particle quantities are computed in C++ by RDataFrame, and the per-event
+# vectors of a column are concatenated in C++ after the event loop, so that each
+# column crosses into Python as one flat array, with no work per event in Python.
+
+# Per-particle columns derived from MC_tlv inside the event loop
+particle_columns = {
+    "MC_pt_all":    "ROOT::VecOps::Map(MC_tlv, [](const TLorentzVector& v) { return v.Pt(); })",
+    "MC_p_all":     "ROOT::VecOps::Map(MC_tlv, [](const TLorentzVector& v) { return v.P(); })",
+    "MC_theta_all": "ROOT::VecOps::Map(MC_tlv, [](const TLorentzVector& v) { return v.Theta(); })",
+}
+
+# Branches that must have one entry per MC particle
+aligned_columns = ["Track_pt", "d0", "z0", "MC_Reco_pdg"]
+
+# Track_pt value for MC particles without a matched track
+unmatched_track_pt = [0, -9]
+
+# C++ type of the flat columns, by NumPy type
+flat_types = {np.float64: "double", np.int64: "Long64_t"}
+
+ROOT.gInterpreter.Declare("""
+template <typename T>
+ROOT::RDF::RResultPtr<std::vector<ROOT::VecOps::RVec<T>>> TakeJagged(ROOT::RDF::RNode df, const std::string &column)
+{
+   return df.Take<ROOT::VecOps::RVec<T>>(column);
+}
+
+template <typename T>
+std::vector<T> FlattenJagged(const std::vector<ROOT::VecOps::RVec<T>> &jagged)
+{
+   std::size_t n = 0;
+   for (auto &v : jagged)
+      n += v.size();
+   std::vector<T> flat;
+   flat.reserve(n);
+   for (auto &v : jagged)
+      flat.insert(flat.end(), v.begin(), v.end());
+   return flat;
+}
+""")
+
+
+def book_flat(df, column, dtype=np.float64):
+    """Book the per-event vectors of a column, in the C++ type of dtype, taken in the next event loop of df."""
+    cpp_type = flat_types[dtype]
+    df = df.Define(f"{column}_flat", f"ROOT::VecOps::RVec<{cpp_type}>({column}.begin(), {column}.end())")
+    return ROOT.TakeJagged[cpp_type](ROOT.RDF.AsRNode(df), f"{column}_flat")
+
+
+def flat_array(jagged, dtype=np.float64):
+    """Single NumPy array of the vectors booked by book_flat, concatenated in C++."""
+    flat = ROOT.FlattenJagged[flat_types[dtype]](jagged.GetValue())
+    if flat.size() == 0:
+        return np.empty(0, dtype=dtype)
+    return np.array(flat, dtype=dtype)
+
+
+def read_tracking_columns(file_name, tree_name="events"):
+    """Read one analysis file into flat per-particle NumPy arrays.
+
+    Returns a dict with the flat columns (MC_pt, MC_p, MC_theta, Track_pt, d0, z0,
+    MC_Reco_pdg) and "offsets", such that the particles of event i are
+    offsets[i]:offsets[i+1].
+    """
+    df = ROOT.RDataFrame(tree_name, str(file_name))
+    for name, expression in particle_columns.items():
+        df = df.Define(name, expression)
+    df = df.Define("n_MC", "static_cast<unsigned int>(MC_tlv.size())")
+    for name in aligned_columns:
+        df = df.Define(f"n_{name}", f"static_cast<unsigned int>({name}.size())")
+
+    # booked before AsNumpy, so that they are filled by the same event loop
+    jagged = {name: book_flat(df, name) for name in list(particle_columns) + aligned_columns if name != "MC_Reco_pdg"}
+    jagged["MC_Reco_pdg"] = book_flat(df, "MC_Reco_pdg", np.int64)
+    arrays = df.AsNumpy(["n_MC"] + [f"n_{name}" for name in aligned_columns])
+
+    n_MC = np.asarray(arrays["n_MC"], dtype=np.int64)
+    for name in aligned_columns:
+        if not np.array_equal(n_MC, np.asarray(arrays[f"n_{name}"], dtype=np.int64)):
+            raise ValueError(f"{file_name}: branch {name} is not aligned with MC_tlv")
+
+    columns = {
+        "offsets":     np.concatenate(([0], np.cumsum(n_MC))),
+        "MC_pt":       flat_array(jagged["MC_pt_all"]),
+        "MC_p":        flat_array(jagged["MC_p_all"]),
+        "MC_theta":    flat_array(jagged["MC_theta_all"]),
+        "Track_pt":    flat_array(jagged["Track_pt"]),
+        "d0":          flat_array(jagged["d0"]),
+        "z0":          flat_array(jagged["z0"]),
+        "MC_Reco_pdg": flat_array(jagged["MC_Reco_pdg"], np.int64),
+    }
+    return columns
+
+
+def tracking_quantities(columns):
+    """Select the MC particles matched to a track and compute the resolution inputs."""
+    matched = ~np.isin(columns["Track_pt"], unmatched_track_pt)
+    MC_pt = columns["MC_pt"][matched]
+    trk_pt = columns["Track_pt"][matched]
+    quantities = {
+        "matched":     matched,
+        "MC_pt_all":   columns["MC_pt"],
+        "MC_pt":       MC_pt,
+        "MC_p":        columns["MC_p"][matched],
+        "MC_theta":    columns["MC_theta"][matched],
+        "trk_pt":      trk_pt,
+        "d0":          columns["d0"][matched],
+        "z0":          columns["z0"][matched],
+        "DeltaPt_Pt2": (trk_pt - MC_pt) / (MC_pt * MC_pt),
+    }
+    return quantities
@@ -0,0 +1,41 @@
+import numpy as np
+from collections import namedtuple
+
+# Iterative sigma clipping on NumPy arrays, used to remove badly reconstructed tracks
+
+# Scale factor from the median absolute deviation to the sigma of a Gaussian
+mad_to_sigma = 1.4826
+
+# Kept entries, boolean mask over the input and one ClipStep per pass
+ClipResult = namedtuple("ClipResult", ["data", "mask", "stats"])
+ClipStep = namedtuple("ClipStep", ["centre", "width", "n_kept"])
+
+
+def sigma_clip(data, threshold, n_selections, robust=False, converge=True):
+    """Keep the entries closer than threshold * width to the centre, n_selections times.
+
+    Each pass computes the centre and width from the entries kept so far: mean and
+    standard deviation, or median and MAD scaled to a Gaussian sigma if robust is set.
+    If converge is set, the passes stop as soon as one of them keeps every entry.
+    """
+    data = np.asarray(data, dtype=np.float64)
+    mask = np.ones(data.shape, dtype=bool)
+    stats = []
+    for _ in range(n_selections):
+        kept = data[mask]
+        if kept.size == 0:
+            break
+        if robust:
+            centre = np.median(kept)
+            width = mad_to_sigma * np.median(np.abs(kept - centre))
+        else:
+            centre = np.mean(kept)
+            width = np.std(kept)
+        new_mask = mask & (np.abs(data - centre) < threshold * width)
+        n_kept = int(np.count_nonzero(new_mask))
+        stats.append(ClipStep(centre, width, n_kept))
+        converged = n_kept == kept.size
+        mask = new_mask
+        if converge and converged:
+            break
+    return ClipResult(data[mask], mask, stats)
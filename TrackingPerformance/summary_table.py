@@ -0,0 +1,99 @@
+import os
+import math
+
+try:
+    import pyarrow as pa
+    import pyarrow.compute as pc
+    import pyarrow.parquet as pq
+except ImportError:
+    pa = None
+
+# Compact Parquet table of the per-point resolution results, with one row per
+# detector model x resolution configuration x particle x theta x momentum x variable.
+# Written by CLDperfPlot_track.py and Plotting/analysis_final.py, read back by the
+# plotters and by Plotting/combinedCanvas.py. pyarrow is optional for the writers:
+# without it they warn at startup and skip the table.
+
+key_columns = ["detector", "resolution", "particle", "theta", "momentum", "variable"]
+
+if pa is not None:
+    schema = pa.schema([
+        ("detector", pa.string()),
+        ("resolution", pa.string()),
+        ("particle", pa.string()),
+        ("theta", pa.float64()),
+        ("momentum", pa.float64()),
+        ("transverse_momentum", pa.float64()),
+        ("variable", pa.string()),
+        ("mean", pa.float64()),
+        ("mean_err", pa.float64()),
+        ("sigma", pa.float64()),
+        ("sigma_err", pa.float64()),
+        ("n", pa.int64()),
+        ("efficiency", pa.float64()),
+        ("efficiency_err_low", pa.float64()),
+        ("efficiency_err_high", pa.float64()),
+    ])
+
+
+def require_pyarrow():
+    if pa is None:
+        raise ImportError("pyarrow is needed to read and write the summary table")
+
+
+def summary_enabled():
+    """True if the summary table can be written, else warn that it is skipped."""
+    if pa is None:
+        print("/!\\ Warning: pyarrow is not installed, the summary table is not written")
+    return pa is not None
+
+
+def summary_row(detector, resolution, particle, theta, momentum, variable, **values):
+    """One row of the table; the result columns that are not given are set to nan (n to -1)."""
+    row = {
+        "detector": detector,
+        "resolution": resolution,
+        "particle": particle,
+        "theta": float(theta),
+        "momentum": float(momentum),
+        "variable": variable,
+    }
+    for name in ["transverse_momentum", "mean", "mean_err", "sigma", "sigma_err",
+                 "efficiency", "efficiency_err_low", "efficiency_err_high"]:
+        row[name] = float(values.get(name, math.nan))
+    row["n"] = int(values.get("n", -1))
+    return row
+
+
+def write_summary(rows, path):
+    """Write the rows to a Parquet file; the file is replaced atomically."""
+    require_pyarrow()
+    table = pa.Table.from_pylist(rows, schema=schema)
+    directory = os.path.dirname(os.path.abspath(path))
+    os.makedirs(directory, exist_ok=True)
+    tmp_path = f"{path}.tmp{os.getpid()}"
+    pq.write_table(table, tmp_path)
+    os.replace(tmp_path, path)
+
+
+def read_summary(paths):
+    """Read and concatenate one or several summary files."""
+    require_pyarrow()
+    if isinstance(paths, str):
+        paths = [paths]
+    return pa.concat_tables([pq.read_table(path, schema=schema) for path in paths])
+
+
+def select(table, **criteria):
+    """Rows of the table whose columns are equal to the given values."""
+    mask = None
+    for column, value in criteria.items():
+        condition = pc.equal(table[column], value)
+        mask = condition if mask is None else pc.and_(mask, condition)
+    return table if mask is None else table.filter(mask)
+
+
+def index_summary(table):
+    """Dict of the rows of a table or a list of rows keyed on (detector, resolution, particle, theta, momentum, variable)."""
+    rows = table if isinstance(table, list) else table.to_pylist()
+    return {tuple(row[c] for c in key_columns): row for row in rows}
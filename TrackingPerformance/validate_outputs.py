@@ -0,0 +1,119 @@
+#!/usr/bin/env python
+
+import os
+import sys
+import glob
+import json
+import argparse
+from multiprocessing import Pool
+
+# Fast validation of SIM and REC outputs before they are used downstream. Only the
+# file metadata is read: the number of entries of the events tree and its branches
+# for EDM4hep ROOT files, the number of events and the collections of the first
+# event for LCIO files. Exits with a non-zero status if any file is bad, so it can
+# gate the analysis of the reconstruction outputs. A file produced by the adaptive
+# sampling (Condor/run_adaptive.py) holds the number of events written in its
+# <name>_sampling.json, which is expected instead of -Nevts.
+
+# Collections needed downstream, by file type
+required_collections = {
+    ".root": ["MCParticles", "SiTracks_Refitted_1", "SiTracksMCTruthLink"],
+    ".slcio": ["MCParticle"],
+}
+
+
+def sampled_events(path):
+    """Number of events recorded by the adaptive sampling for a file, or None."""
+    sampling_path = os.path.splitext(path)[0] + "_sampling.json"
+    if not os.path.exists(sampling_path):
+        return None
+    with open(sampling_path) as sampling_file:
+        return int(json.load(sampling_file)["events"])
+
+
+def root_contents(path):
+    """(number of events, branch names) of an EDM4hep ROOT file."""
+    import ROOT
+    root_file = ROOT.TFile.Open(path)
+    if not root_file or root_file.IsZombie() or root_file.TestBit(ROOT.TFile.kRecovered):
+        raise OSError("cannot be opened or was not closed properly")
+    tree = root_file.Get("events")
+    if not tree:
+        raise OSError("has no events tree")
+    contents = int(tree.GetEntries()), {branch.GetName() for branch in tree.GetListOfBranches()}
+    root_file.Close()
+    return contents
+
+
+def lcio_contents(path):
+    """(number of events, collection names of the first event) of an LCIO file."""
+    from pyLCIO import IOIMPL
+    reader = IOIMPL.LCFactory.getInstance().createLCReader()
+    reader.open(path)
+    n = reader.getNumberOfEvents()
+    event = reader.readNextEvent()
+    names = set(event.getCollectionNames()) if event else set()
+    reader.close()
+    return n, names
+
+
+def validate(task):
+    """(path, number of events, problems found) of one file, no problems meaning it is good."""
+    path, nevts, collections = task
+    if not os.path.exists(path):
+        return path, None, ["missing"]
+    if os.path.getsize(path) == 0:
+        return path, 0, ["empty"]
+    extension = os.path.splitext(path)[1]
+    try:
+        n, names = root_contents(path) if extension == ".root" else lcio_contents(path)
+    except Exception as error:
+        return path, None, [f"unreadable: {error}"]
+    problems = []
+    if nevts is not None and sampled_events(path) is not None:
+        nevts = sampled_events(path)
+    if nevts is not None and n != nevts:
+        problems.append(f"{n} events instead of {nevts}")
+    missing = [c for c in (collections if collections is not None else required_collections.get(extension, [])) if c not in names]
+    if missing:
+        problems.append("missing " + ", ".join(missing))
+    return path, n, problems
+
+
+def validate_files(paths, nevts=None, collections=None, n_processes=1):
+    """{path: (number of events, problems)} for every file, checked in parallel."""
+    tasks = [(path, nevts, collections) for path in paths]
+    if n_processes > 1 and len(tasks) > 1:
+        with Pool(n_processes) as pool:
+            results = pool.map(validate, tasks)
+    else:
+        results = [validate(task) for task in tasks]
+    return {path: (n, problems) for path, n, problems in results}
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Check the number of events and the collections of SIM/REC outputs")
+    parser.add_argument("-Files", help="Files or glob patterns to check, e.g. '/eos/.../REC/*.root'", nargs="+", required=True)
+    parser.add_argument("-Nevts", help="Expected number of events", type=int, default=None)
+    parser.add_argument("-Collections", help="Required collections (default: by file type)", nargs="*", default=None)
+    parser.add_argument("-j", help="Number of parallel processes", type=int, default=os.cpu_count())
+    parser.add_argument("-Quarantine", help="Rename the bad files to <name>.invalid so that they get produced again", action="store_true")
+    parser.add_argument("-Json", help="Write the status of every file to this JSON file", default=None)
+    args = parser.parse_args()
+
+    paths = []
+    for pattern in args.Files:
+        paths += sorted(glob.glob(pattern)) if glob.has_magic(pattern) else [pattern]
+    results = validate_files(paths, args.Nevts, args.Collections, args.j)
+
+    bad = [path for path, (n, problems) in results.items() if problems]
+    for path in paths:
+        n, problems = results[path]
+        print(f"{'ok' if not problems else 'BAD':4s} {os.path.basename(path)}: {n} events" + ("" if not problems else " - " + "; ".join(problems)))
+        if problems and args.Quarantine and os.path.exists(path):
+            os.rename(path, path + ".invalid")
+    print(f"{len(paths) - len(bad)} of {len(paths)} files ok")
+    if args.Json:
+        with open(args.Json, "w") as json_file:
+            json.dump({path: {"events": n, "problems": problems} for path, (n, problems) in results.items()}, json_file, indent=1)
+    sys.exit(1 if bad else 0)
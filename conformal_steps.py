@@ -0,0 +1,55 @@
+#!/usr/bin/env python
+
+import re
+import json
+
+# Edition of the Steps parameter of ConformalTrackingV2. The Steps are a list of words,
+# read by the processor as one text: "[VXDBarrel] @Collections : VXDTrackerHits
+# @Parameters : MaxCellAngle : 0.01; Chi2Cut : 100; ... @Flags : ... @Functions : ...",
+# one [name] section per step. The overrides are {step name: {parameter: value}}, the
+# step "*" applying to every step that has the parameter.
+
+step_pattern = re.compile(r"(?=\[\w+\])")
+
+
+def parameter_pattern(parameter):
+    return re.compile(r"(\b" + re.escape(parameter) + r"\s*:\s*)([^;\s]+)")
+
+
+def step_parameters(steps):
+    """{step name: {parameter: value}} of the numerical parameters of the Steps."""
+    parameters = {}
+    for section in step_pattern.split(" ".join(steps)):
+        name = re.match(r"\[(\w+)\]", section)
+        if not name or "@Parameters" not in section:
+            continue
+        text = section.split("@Parameters", 1)[1].split("@", 1)[0]
+        parameters[name.group(1)] = dict(re.findall(r"(\w+)\s*:\s*([^;\s]+)", text))
+    return parameters
+
+
+def set_step_parameters(steps, overrides):
+    """Steps with the values of overrides; raises ValueError for an unknown step or parameter."""
+    sections = step_pattern.split(" ".join(steps))
+    names = [re.match(r"\[(\w+)\]", section) for section in sections]
+    known = {name.group(1) for name in names if name}
+    unknown = [step for step in overrides if step != "*" and step not in known]
+    if unknown:
+        raise ValueError(f"unknown ConformalTracking steps {', '.join(unknown)}")
+    changed = {(step, parameter): 0 for step, values in overrides.items() for parameter in values}
+    for i, (section, name) in enumerate(zip(sections, names)):
+        if not name:
+            continue
+        for step in ["*", name.group(1)]:
+            for parameter, value in overrides.get(step, {}).items():
+                sections[i], n = parameter_pattern(parameter).subn(r"\g<1>" + str(value), sections[i])
+                changed[(step, parameter)] += n
+    missing = [f"{step}.{parameter}" for (step, parameter), n in changed.items() if n == 0]
+    if missing:
+        raise ValueError(f"parameters not found in the ConformalTracking steps: {', '.join(missing)}")
+    return " ".join(sections).split()
+
+
+def load_overrides(path):
+    with open(path) as overrides_file:
+        return json.load(overrides_file)
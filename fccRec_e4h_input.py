@@ -1338,10 +1338,44 @@ algList.append(Output_DST)
 ## PodioOutput 
 algList.append(out)
 
+# Tracking-only runs: --KeepCollections MCParticles SiTracks_Refitted SiTracksMCTruthLink removes
+# the processors that do not contribute to these collections, see steering_pruner.py
+from k4FWCore.parseArgs import parser
+parser.add_argument("--KeepCollections", help="Output collections the kept processors must produce", nargs="+", default=None)
+pruning_args = parser.parse_known_args()[0]
+# steering_pruner.py, output_profiles.py and processor_profiling.py are next to this file, or copied to the running directory
+import sys
+if "__file__" in globals():
+    sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+from steering_pruner import prune_processors, input_collections, conversion_mapping
+if pruning_args.KeepCollections:
+    algList = prune_processors(algList, pruning_args.KeepCollections)
+
+# Only read and convert the SIM collections used by the processors that run
+inp.collections = input_collections(algList, inp.collections)
+edmConvTool.collNameMapping = conversion_mapping(algList, edmConvTool.collNameMapping)
+
+# A single output with the collections of --OutputProfile, see output_profiles.py
+from output_profiles import add_output_arguments, configure_output, output_collections
+add_output_arguments(parser, "full")
+output_args = parser.parse_known_args()[0]
+algList = configure_output(algList, out, Output_REC, lcioConvTool, output_collections(output_args),
+                           output_args.OutputFormat, output_args.LCIOOutputFile)
+
+# Per-processor timing and memory, see processor_profiling.py
+parser.add_argument("--Profile", help="Time every algorithm per event and log the memory after each one", action="store_true")
+parser.add_argument("--ProfileTimingFile", help="Per-event times of the algorithms (--Profile)", default="processor_timing.txt")
+profiling_args = parser.parse_known_args()[0]
+profiling_svc = []
+if profiling_args.Profile:
+    from processor_profiling import profiling_services
+    profiling_svc = profiling_services(profiling_args.ProfileTimingFile)
+
 from Configurables import ApplicationMgr
 ApplicationMgr( TopAlg = algList,
                 EvtSel = 'NONE',
                 EvtMax   = 1,       
-                ExtSvc = [evtsvc],
+                ExtSvc = [evtsvc] + profiling_svc,
+                AuditAlgorithms = profiling_args.Profile,
                 OutputLevel=WARNING
               )
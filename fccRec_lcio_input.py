@@ -4,7 +4,22 @@ from Configurables import LcioEvent, k4DataSvc, MarlinProcessorWrapper
 from k4MarlinWrapper.parseConstants import *
 algList = []
 
-from config_values import *
+from k4FWCore.parseArgs import parser
+
+# Detector model and hit resolutions (mm), e.g. k4run fccRec_lcio_input_trackers.py --ITBarrelResU 0.007
+# Every value given on the command line overrides the one of config_values.py, which is
+# only needed if some of them are not given.
+resolution_parameters = ["DetectorModel",
+                         "VXDBarrelResU", "VXDBarrelResV", "VXDEndcapResU", "VXDEndcapResV",
+                         "ITBarrelResU", "ITBarrelResV", "ITEndcapResU", "ITEndcapResV",
+                         "OTBarrelResU", "OTBarrelResV", "OTEndcapResU", "OTEndcapResV"]
+for name in resolution_parameters:
+    parser.add_argument(f"--{name}", default=None)
+reco_args = parser.parse_known_args()[0]
+if any(getattr(reco_args, name) is None for name in resolution_parameters):
+    import config_values
+for name in resolution_parameters:
+    globals()[name] = getattr(reco_args, name) if getattr(reco_args, name) is not None else getattr(config_values, name)
 
 
 CONSTANTS = {
@@ -4,7 +4,22 @@ from Configurables import LcioEvent, k4DataSvc, MarlinProcessorWrapper
 from k4MarlinWrapper.parseConstants import *
 algList = []
 
-from config_values import *
+from k4FWCore.parseArgs import parser
+
+# Detector model and hit resolutions (mm), e.g. k4run fccRec_lcio_input_trackers.py --ITBarrelResU 0.007
+# Every value given on the command line overrides the one of config_values.py, which is
+# only needed if some of them are not given.
+resolution_parameters = ["DetectorModel",
+                         "VXDBarrelResU", "VXDBarrelResV", "VXDEndcapResU", "VXDEndcapResV",
+                         "ITBarrelResU", "ITBarrelResV", "ITEndcapResU", "ITEndcapResV",
+                         "OTBarrelResU", "OTBarrelResV", "OTEndcapResU", "OTEndcapResV"]
+for name in resolution_parameters:
+    parser.add_argument(f"--{name}", default=None)
+reco_args = parser.parse_known_args()[0]
+if any(getattr(reco_args, name) is None for name in resolution_parameters):
+    import config_values
+for name in resolution_parameters:
+    globals()[name] = getattr(reco_args, name) if getattr(reco_args, name) is not None else getattr(config_values, name)
 
 
 CONSTANTS = {
@@ -1236,15 +1251,53 @@ algList.append(RenameCollection)  # Config.OverlayFalse
 algList.append(VertexFinder)
 algList.append(JetClusteringAndRefiner)
 # algList.append(VertexFinderUnconstrained)  # Config.VertexUnconstrainedON
-# FIXME: if I comment this out a lot of collections are missing from the edm4hep output :(
+# Only one of the writers is kept, see configure_output below
 algList.append(Output_REC)
 # algList.append(Output_DST)
 algList.append(out)
 
+# Only run the processors needed for the tracking collections, see steering_pruner.py
+parser.add_argument("--NoPruning", help="Run all the processors of algList", action="store_true")
+parser.add_argument("--KeepCollections", help="Output collections the kept processors must produce", nargs="+", default=None)
+pruning_args = parser.parse_known_args()[0]
+# steering_pruner.py, output_profiles.py, processor_profiling.py and conformal_steps.py are next to this file, or copied to the running directory
+import sys
+if "__file__" in globals():
+    sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+if not pruning_args.NoPruning:
+    from steering_pruner import prune_processors, tracking_collections
+    algList = prune_processors(algList, pruning_args.KeepCollections or tracking_collections)
+
+# A single output with the collections of --OutputProfile, see output_profiles.py
+from output_profiles import add_output_arguments, configure_output, output_collections
+add_output_arguments(parser, "tracking")
+output_args = parser.parse_known_args()[0]
+algList = configure_output(algList, out, Output_REC, lcioConvTool, output_collections(output_args),
+                           output_args.OutputFormat, output_args.LCIOOutputFile)
+
+# ConformalTracking Steps with other cuts, e.g. for the scans of conformal_scan.py, see conformal_steps.py
+parser.add_argument("--ConformalStepParameters", help="JSON file of {step: {parameter: value}} for the ConformalTracking Steps", default=None)
+steps_args = parser.parse_known_args()[0]
+if steps_args.ConformalStepParameters:
+    from conformal_steps import set_step_parameters, load_overrides
+    parameters = dict(MyConformalTracking.Parameters)
+    parameters["Steps"] = set_step_parameters(parameters["Steps"], load_overrides(steps_args.ConformalStepParameters))
+    MyConformalTracking.Parameters = parameters
+
+# Per-processor timing and memory, see processor_profiling.py
+parser.add_argument("--Profile", help="Time every algorithm per event and log the memory after each one", action="store_true")
+parser.add_argument("--ProfileTimingFile", help="Per-event times of the algorithms (--Profile)", default="processor_timing.txt")
+profiling_args = parser.parse_known_args()[0]
+profiling_svc = []
+if profiling_args.Profile:
+    from processor_profiling import profiling_services
+    profiling_svc = profiling_services(profiling_args.ProfileTimingFile)
+
 from Configurables import ApplicationMgr
 ApplicationMgr( TopAlg = algList,
                 EvtSel = 'NONE',
                 EvtMax   = 3,
-                ExtSvc = [evtsvc],
+                ExtSvc = [evtsvc] + profiling_svc,
+                AuditAlgorithms = profiling_args.Profile,
                 OutputLevel=WARNING
               )
\ No newline at end of file
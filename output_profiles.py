@@ -0,0 +1,128 @@
+#!/usr/bin/env python
+
+import argparse
+from steering_pruner import collection_names, processor_collections
+
+# Output of the reconstruction steering files. A profile is the list of collections
+# written, and the output is a single file: EDM4hep through PodioOutput, or LCIO
+# through one LCIOOutputProcessor. For EDM4hep only the collections of the profile
+# are converted from LCIO, by a Lcio2EDM4hepTool attached to the last Marlin
+# processor of algList, so that every collection exists when it runs.
+
+# Collections written by each profile, None meaning all of them
+profiles = {
+    # tracking resolution studies
+    "tracking": ["EventHeader", "MCParticles", "SiTracks_Refitted", "SiTracksMCTruthLink"],
+    # the collections of Output_DST
+    "pfo": ["EventHeader", "MCParticles", "MCParticlesSkimmed", "MCPhysicsParticles", "RecoMCTruthLink", "SiTracks", "SiTracks_Refitted",
+            "SiTracksMCTruthLink", "PandoraClusters", "PandoraPFOs", "SelectedPandoraPFOs", "LooseSelectedPandoraPFOs",
+            "TightSelectedPandoraPFOs", "RefinedVertexJets", "RefinedVertexJets_rel", "RefinedVertexJets_vtx",
+            "RefinedVertexJets_vtx_RP", "BuildUpVertices", "BuildUpVertices_res", "BuildUpVertices_RP", "BuildUpVertices_res_RP",
+            "BuildUpVertices_V0", "BuildUpVertices_V0_res", "BuildUpVertices_V0_RP", "BuildUpVertices_V0_res_RP", "PrimaryVertices",
+            "PrimaryVertices_res", "PrimaryVertices_RP", "PrimaryVertices_res_RP", "RefinedVertices", "RefinedVertices_RP"],
+    "full": None,
+}
+
+# LCIO types dropped by the LCIO writer, so that only the KeepCollectionNames are written
+lcio_types = ["MCParticle", "LCRelation", "SimCalorimeterHit", "CalorimeterHit", "SimTrackerHit", "TrackerHit", "TrackerHitPlane",
+              "Track", "Cluster", "ReconstructedParticle", "Vertex", "LCFloatVec", "LCIntVec", "LCGenericObject"]
+
+
+def add_output_arguments(parser, default_profile):
+    parser.add_argument("--OutputProfile", help="Collections written: " + ", ".join(profiles), choices=list(profiles), default=default_profile)
+    parser.add_argument("--OutputCollections", help="Collections written, instead of those of the profile", nargs="+", default=None)
+    parser.add_argument("--OutputFormat", help="edm4hep (PodioOutput) or lcio (LCIOOutputProcessor)", choices=["edm4hep", "lcio"], default="edm4hep")
+    parser.add_argument("--LCIOOutputFile", help="Output file of the lcio format", default=None)
+
+
+def configure_output(alg_list, podio_output, lcio_output, conversion_tool, collections=None, output_format="edm4hep", lcio_output_file=None):
+    """algList writing collections (None: all) with podio_output or lcio_output only.
+
+    The other LCIOOutputProcessors are removed, and for lcio conversion_tool converts
+    nothing. For edm4hep, conversion_tool is moved to
+    the last Marlin processor and converts only the collections produced by the Marlin
+    processors, and the input collections renamed by its collNameMapping.
+    """
+    writers = [alg for alg in alg_list if getattr(alg, "ProcessorType", None) == "LCIOOutputProcessor"]
+    alg_list = [alg for alg in alg_list if alg not in writers and alg is not podio_output]
+    # the LCIO names of the input collections that are renamed, e.g. MCParticle -> MCParticles
+    renamed = {edm4hep_name: lcio_name for lcio_name, edm4hep_name in dict(getattr(conversion_tool, "collNameMapping", {})).items()}
+    if output_format == "lcio":
+        if collections is not None:
+            parameters = dict(lcio_output.Parameters)
+            parameters["DropCollectionTypes"] = lcio_types
+            parameters["KeepCollectionNames"] = [renamed.get(c, c) for c in collections if c != "EventHeader"]
+            lcio_output.Parameters = parameters
+        if lcio_output_file:
+            parameters = dict(lcio_output.Parameters)
+            parameters["LCIOOutputFile"] = [lcio_output_file]
+            lcio_output.Parameters = parameters
+        # nothing is written in EDM4hep
+        conversion_tool.convertAll = False
+        conversion_tool.collNameMapping = {}
+        return alg_list + [lcio_output]
+
+    if collections is None:
+        conversion_tool.convertAll = True
+        podio_output.outputCommands = ["keep *"]
+    else:
+        produced = set()
+        for alg in alg_list:
+            if hasattr(alg, "ProcessorType"):
+                collections_of_alg = processor_collections(alg)
+                produced |= collections_of_alg[1] if collections_of_alg else collection_names(v for values in alg.Parameters.values() for v in values)
+        mapping = {}
+        for name in collections:
+            if name in renamed:
+                mapping[renamed[name]] = name
+            elif name in produced or any(name.startswith(p + "_") for p in produced):
+                # including the collections named after a parameter, e.g. PrimaryVertices_RP
+                mapping[name] = name
+        conversion_tool.convertAll = False
+        conversion_tool.collNameMapping = mapping
+        podio_output.outputCommands = ["drop *"] + [f"keep {name}" for name in collections]
+    marlin_processors = [alg for alg in alg_list if hasattr(alg, "ProcessorType")]
+    if marlin_processors:
+        marlin_processors[-1].Lcio2EDM4hepTool = conversion_tool
+    return alg_list + [podio_output]
+
+
+def output_collections(args):
+    """Collections written for the parsed --OutputProfile and --OutputCollections."""
+    return args.OutputCollections if args.OutputCollections else profiles[args.OutputProfile]
+
+
+def collection_sizes(path):
+    """{collection: (compressed bytes, uncompressed bytes)} of the events tree of an EDM4hep file.
+
+    The branches of the relations and vector members of a collection (_<name>_<member>,
+    <name>_<index>) are counted with it.
+    """
+    import ROOT
+    root_file = ROOT.TFile.Open(path)
+    tree = root_file.Get("events")
+    branches = [branch for branch in tree.GetListOfBranches()]
+    names = {branch.GetName() for branch in branches if not branch.GetName().startswith("_")}
+    names = {name for name in names if not (name.rsplit("_", 1)[-1].isdigit() and name.rsplit("_", 1)[0] in names)}
+    sizes = {}
+    for branch in branches:
+        branch_name = branch.GetName().lstrip("_")
+        matches = [name for name in names if branch_name == name or branch_name.startswith(name + "_")]
+        collection = max(matches, key=len) if matches else branch_name
+        zipped, total = sizes.get(collection, (0, 0))
+        sizes[collection] = (zipped + branch.GetZipBytes("*"), total + branch.GetTotBytes("*"))
+    root_file.Close()
+    return sizes
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Bytes written per collection in an EDM4hep output")
+    parser.add_argument("-Files", help="EDM4hep ROOT files", nargs="+", required=True)
+    args = parser.parse_args()
+
+    for path in args.Files:
+        sizes = collection_sizes(path)
+        total = sum(zipped for zipped, _ in sizes.values())
+        print(f"{path}: {total / 1024**2:.2f} MB in {len(sizes)} collections")
+        for collection, (zipped, unzipped) in sorted(sizes.items(), key=lambda item: -item[1][0]):
+            print(f"  {collection:40s} {zipped / 1024:10.1f} kB {100 * zipped / max(total, 1):5.1f} %  (uncompressed {unzipped / 1024:.1f} kB)")
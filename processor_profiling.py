@@ -0,0 +1,132 @@
+#!/usr/bin/env python
+
+import os
+import re
+import glob
+import json
+import argparse
+
+# Per-processor profiling of the k4run reconstruction. With --Profile the steering files
+# audit every algorithm of algList: the ChronoAuditor times each execution and
+# ChronoStatSvc writes the time of every event per algorithm to --ProfileTimingFile,
+# while the MemoryAuditor logs the memory of the process after an algorithm whenever it
+# changed. profile_record() turns the two into one compact JSON record per job, and the
+# command line aggregates the records of a campaign into percentiles per processor.
+
+# MemoryAuditor line, e.g. "Memory usage has changed after Refit Execute  virtual size = 1650.2 MB  resident set size = 512.4 MB"
+memory_pattern = re.compile(r"after (\S+) (\w+)\s+virtual size = ([\d.]+) MB\s+resident set size = ([\d.]+) MB")
+
+
+def profiling_services(timing_file):
+    """Services auditing the algorithms, for the ExtSvc of an ApplicationMgr with AuditAlgorithms = True."""
+    from Gaudi.Configuration import INFO
+    from Configurables import AuditorSvc, ChronoStatSvc, ChronoAuditor, MemoryAuditor
+    memory_auditor = MemoryAuditor()
+    # printed at INFO, below the WARNING level of the steering files
+    memory_auditor.OutputLevel = INFO
+    auditor_svc = AuditorSvc()
+    auditor_svc.Auditors = [ChronoAuditor(), memory_auditor]
+    chrono_svc = ChronoStatSvc()
+    chrono_svc.PerEventFile = timing_file
+    return [auditor_svc, chrono_svc]
+
+
+def read_timing(path):
+    """{algorithm: [time of each event in us]} from the PerEventFile of ChronoStatSvc."""
+    times = {}
+    with open(path) as timing_file:
+        for line in timing_file:
+            words = line.split()
+            if len(words) > 1:
+                times[words[0].split(":")[0]] = [int(word) for word in words[1:]]
+    return times
+
+
+def read_memory(path):
+    """{algorithm: (resident memory growth in MB, largest resident memory in MB after it)} from the MemoryAuditor lines of a log."""
+    memory = {}
+    rss_before = None
+    with open(path, errors="replace") as log_file:
+        for line in log_file:
+            match = memory_pattern.search(line)
+            if not match:
+                continue
+            name, rss = match.group(1), float(match.group(4))
+            growth, largest = memory.get(name, (0.0, 0.0))
+            # the growth of the first line includes everything loaded before it
+            memory[name] = (growth + (rss - rss_before if rss_before is not None else 0.0), max(largest, rss))
+            rss_before = rss
+    return memory
+
+
+def profile_record(timing_path, log_path, info):
+    """Record of one job: info (e.g. the point) and, per algorithm, its times and memory."""
+    times = read_timing(timing_path) if os.path.exists(timing_path) else {}
+    memory = read_memory(log_path) if os.path.exists(log_path) else {}
+    processors = {}
+    for name in list(times) + [name for name in memory if name not in times]:
+        growth, largest = memory.get(name, (0.0, None))
+        processors[name] = {"times_us": times.get(name, []), "rss_growth_mb": round(growth, 1), "max_rss_mb": largest}
+    return {"info": info, "processors": processors}
+
+
+def percentile(sorted_values, fraction):
+    """Nearest-rank percentile of a sorted list."""
+    return sorted_values[min(len(sorted_values) - 1, max(0, int(round(fraction * len(sorted_values))) - 1))]
+
+
+def summarize(records, skip_events=1):
+    """{algorithm: statistics} over all the events of the records, without the first skip_events of each job."""
+    times, growth, largest, jobs = {}, {}, {}, {}
+    for record in records:
+        for name, processor in record["processors"].items():
+            times.setdefault(name, []).extend(processor["times_us"][skip_events:])
+            growth[name] = max(growth.get(name, 0.0), processor["rss_growth_mb"])
+            if processor["max_rss_mb"] is not None:
+                largest[name] = max(largest.get(name, 0.0), processor["max_rss_mb"])
+            jobs[name] = jobs.get(name, 0) + 1
+    total = sum(sum(values) for values in times.values())
+    summary = {}
+    for name, values in times.items():
+        values = sorted(values)
+        summary[name] = {
+            "jobs": jobs[name],
+            "events": len(values),
+            "mean_ms": sum(values) / len(values) / 1000 if values else None,
+            "p50_ms": percentile(values, 0.50) / 1000 if values else None,
+            "p90_ms": percentile(values, 0.90) / 1000 if values else None,
+            "p99_ms": percentile(values, 0.99) / 1000 if values else None,
+            "time_fraction": sum(values) / total if total else None,
+            "max_rss_growth_mb": growth[name],
+            "max_rss_mb": largest.get(name),
+        }
+    return summary
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Percentiles of the per-event time and the memory of every processor over the profiles of a campaign")
+    parser.add_argument("-Records", help="Profile records or glob patterns, e.g. '/eos/.../REC/*.profile.json'", nargs="+", required=True)
+    parser.add_argument("-Skip", help="First events of each job left out (initialisation)", type=int, default=1)
+    parser.add_argument("-Json", help="Write the summary to this JSON file", default=None)
+    args = parser.parse_args()
+
+    paths = []
+    for pattern in args.Records:
+        paths += sorted(glob.glob(pattern)) if glob.has_magic(pattern) else [pattern]
+    records = []
+    for path in paths:
+        with open(path) as record_file:
+            records.append(json.load(record_file))
+    summary = summarize(records, args.Skip)
+
+    def ms(value):
+        return f"{value:9.2f}" if value is not None else f"{'-':>9s}"
+
+    print(f"{len(records)} jobs")
+    print(f"{'processor':32s} {'events':>8s} {'mean ms':>9s} {'p50 ms':>9s} {'p90 ms':>9s} {'p99 ms':>9s} {'time %':>7s} {'dRSS MB':>8s} {'RSS MB':>8s}")
+    for name, stats in sorted(summary.items(), key=lambda item: -(item[1]["time_fraction"] or 0)):
+        print(f"{name:32s} {stats['events']:8d} {ms(stats['mean_ms'])} {ms(stats['p50_ms'])} {ms(stats['p90_ms'])} {ms(stats['p99_ms'])}"
+              f" {100 * (stats['time_fraction'] or 0):7.1f} {stats['max_rss_growth_mb']:8.1f} {stats['max_rss_mb'] or 0:8.1f}")
+    if args.Json:
+        with open(args.Json, "w") as json_file:
+            json.dump(summary, json_file, indent=1)
@@ -0,0 +1,168 @@
+#!/usr/bin/env python
+
+import sys
+import argparse
+
+# Removal of the Marlin processors that do not contribute to a requested set of output
+# collections, and of the input collections that no remaining processor reads. The
+# input and output collections of each MarlinProcessorWrapper are read from its Parameters: the outputs from the parameters listed below for its
+# ProcessorType, the inputs from every other parameter value. Going backwards through
+# algList, a processor is kept if it writes a collection needed by the requested
+# outputs or by a processor kept after it.
+
+# Parameters holding the output collections, by ProcessorType
+output_parameters = {
+    "DDPlanarDigiProcessor": ["TrackerHitCollectionName", "SimTrkHitRelCollection"],
+    "ConformalTrackingV2": ["SiTrackCollectionName", "DebugHits"],
+    "TruthTrackFinder": ["SiTrackCollectionName", "SiTrackRelationCollectionName"],
+    "ClonesAndSplitTracksFinder": ["OutputTrackCollectionName"],
+    "RefitFinal": ["OutputTrackCollectionName", "OutputRelationCollectionName"],
+    "ClicEfficiencyCalculator": ["MCParticleNotReco"],
+    "TrackChecker": [],
+    "HitResiduals": [],
+    "RecoMCTruthLinker": ["CalohitMCTruthLinkName", "ClusterMCTruthLinkName", "MCParticlesSkimmedName", "MCTruthClusterLinkName",
+                          "MCTruthRecoLinkName", "MCTruthTrackLinkName", "RecoMCTruthLinkName", "TrackMCTruthLinkName"],
+    "DDSimpleMuonDigi": ["MUONOutputCollection", "RelationOutputCollection"],
+    "DDCaloDigi": ["ECALOutputCollection0", "ECALOutputCollection1", "ECALOutputCollection2",
+                   "HCALOutputCollection0", "HCALOutputCollection1", "HCALOutputCollection2", "RelationOutputCollection"],
+    "DDPandoraPFANewProcessor": ["ClusterCollectionName", "PFOCollectionName", "StartVertexCollectionName"],
+    "MarlinLumiCalClusterer": ["LumiCal_Clusters", "LumiCal_RecoParticles"],
+    "CLICPfoSelector": ["SelectedPfoCollection"],
+    "MergeCollections": ["OutputCollection"],
+    "FastJetProcessor": ["jetOut", "recParticleOut"],
+    "LcfiplusProcessor": ["PrimaryVertexCollectionName", "BuildUpVertexCollectionName", "BuildUpVertex.V0VertexCollectionName",
+                          "JetClustering.OutputJetCollectionName", "JetVertexRefiner.OutputJetCollectionName",
+                          "JetVertexRefiner.OutputVertexCollectionName"],
+    # the overlay creates MCPhysicsParticles and applies the timing cuts to the listed hit collections in place
+    "OverlayTimingGeneric": ["MCPhysicsParticleCollectionName", "Collection_IntegrationTimes"],
+}
+
+# Output collections written under a fixed name, not given by a parameter
+fixed_outputs = {
+    "ClicEfficiencyCalculator": ["EfficientMCParticles", "InefficientMCParticles"],
+}
+
+# Inputs a processor runs without, so that they do not keep their producers: the
+# truth linker only makes the cluster and particle links if these collections exist
+optional_inputs = {
+    "RecoMCTruthLinker": ["ClusterCollection", "RecoParticleCollection", "SimCaloHitCollections", "SimCalorimeterHitRelationNames"],
+}
+
+# Processors always kept: they have side effects but no output collections
+always_kept = ["AIDAProcessor", "InitializeDD4hep", "Statusmonitor", "LCIOOutputProcessor"]
+
+# Collections needed for the tracking resolution studies
+tracking_collections = ["MCParticles", "SiTracks_Refitted", "SiTracksMCTruthLink"]
+
+
+def collection_names(values):
+    """Words of a parameter value that can be collection names (e.g. in the ConformalTracking Steps)."""
+    return {word.strip(",;") for value in values for word in str(value).split()} - {""}
+
+
+def processor_collections(alg):
+    """(inputs, outputs) of a MarlinProcessorWrapper, or None if its outputs are not known."""
+    processor_type = alg.ProcessorType
+    if processor_type not in output_parameters:
+        return None
+    outputs, inputs = set(fixed_outputs.get(processor_type, [])), set()
+    for key, values in alg.Parameters.items():
+        if key in output_parameters[processor_type]:
+            outputs |= collection_names(values)
+        elif key not in optional_inputs.get(processor_type, []):
+            inputs |= collection_names(values)
+    return inputs, outputs
+
+
+def prune_processors(alg_list, keep_collections=tracking_collections, verbose=True):
+    """algList without the Marlin processors that do not contribute to keep_collections.
+
+    Algorithms that are not Marlin processors (readers, PodioOutput), the processors
+    in always_kept and those of an unknown ProcessorType are kept. A warning is printed
+    for each of keep_collections that no kept processor produces or reads from the input.
+    """
+    needed = set(keep_collections)
+    produced = set()
+    kept = []
+    for alg in reversed(alg_list):
+        if not hasattr(alg, "ProcessorType") or alg.ProcessorType in always_kept:
+            kept.append(alg)
+            continue
+        collections = processor_collections(alg)
+        if collections is None:
+            # unknown processor: keep it and everything it might read
+            kept.append(alg)
+            names = collection_names(v for values in alg.Parameters.values() for v in values)
+            needed |= names
+            produced |= names
+            if verbose:
+                print(f"steering_pruner: keeping {alg.name()} of unknown type {alg.ProcessorType}")
+            continue
+        inputs, outputs = collections
+        if outputs & needed:
+            kept.append(alg)
+            needed |= inputs
+            produced |= outputs
+        elif verbose:
+            print(f"steering_pruner: removing {alg.name()} ({alg.ProcessorType})")
+    kept = kept[::-1]
+    # the requested collections that are neither made by a kept processor (or named after
+    # one of its outputs, e.g. PrimaryVertices_RP) nor read from the input by one of them
+    available = produced | read_collections(kept) | {"EventHeader"}
+    for name in keep_collections:
+        if name not in available and not any(name.startswith(p + "_") for p in produced):
+            print(f"steering_pruner: /!\\ no kept processor produces or reads {name}, it will not be written")
+    return kept
+
+
+def read_collections(alg_list):
+    """Collection names the Marlin processors of alg_list read, without their optional inputs.
+
+    The hit collections the overlay modifies in place are not counted, it skips
+    those missing from the event.
+    """
+    names = set()
+    for alg in alg_list:
+        if not hasattr(alg, "ProcessorType"):
+            continue
+        collections = processor_collections(alg)
+        if collections is None:
+            names |= collection_names(v for values in alg.Parameters.values() for v in values)
+        else:
+            names |= collections[0]
+    return names
+
+
+def input_collections(alg_list, collections):
+    """The collections of a PodioInput list used by the processors of alg_list.
+
+    The EventHeader is always kept, and the <name>Contributions of a calorimeter hit
+    collection are kept with it.
+    """
+    needed = read_collections(alg_list)
+    return [c for c in collections
+            if c == "EventHeader" or c in needed or (c.endswith("Contributions") and c[:-len("Contributions")] in needed)]
+
+
+def conversion_mapping(alg_list, mapping):
+    """The entries of an EDM4hep2LcioTool collNameMapping used by the processors of alg_list."""
+    needed = read_collections(alg_list)
+    return {edm4hep_name: lcio_name for edm4hep_name, lcio_name in mapping.items() if lcio_name in needed}
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="List the processors of a steering file needed for some output collections")
+    parser.add_argument("-SteeringFile", help="Steering file defining algList", required=True)
+    parser.add_argument("-Keep", help="Output collections", nargs="+", default=tracking_collections)
+    args, steering_args = parser.parse_known_args()
+
+    # the steering file parses the remaining command-line options itself
+    sys.argv = [args.SteeringFile] + steering_args + ["--NoPruning"]
+    steering = {"__file__": args.SteeringFile}
+    with open(args.SteeringFile) as steering_file:
+        exec(compile(steering_file.read(), args.SteeringFile, "exec"), steering)
+    alg_list = steering["algList"]
+    kept = prune_processors(alg_list, args.Keep, verbose=False)
+    for alg in alg_list:
+        print(f"{'keep  ' if alg in kept else 'remove'} {alg.name()}")
+    print(f"{len(kept)} of {len(alg_list)} algorithms kept for {', '.join(args.Keep)}")